@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, List, Optional
+
+"""
+Long lived export workers for sweep results.
+
+laser_sweep used to start a Process per sweep for plot.generate_plots,
+paying interpreter start plus the matplotlib / plotly / pandas / scipy
+imports every time, and join() held the auto measurement loop until every
+file was written. ExportService keeps a small process pool whose workers
+import all of that once, and takes plot objects through a bounded queue:
+
+    exports = ExportService()
+    exports.submit(name, diagram)           # returns at once
+    exports.submit(name, diagram).result()  # manual sweep, wait for the html
+
+    - submit blocks only while max_pending jobs are queued (backpressure)
+    - every job reports completion / failure (print, done / failed lists,
+      optional on_done(name, ok, seconds, error))
+    - close() waits for what is queued
+"""
+
+
+def _warm_imports():
+    """Worker initializer, everything generate_plots needs is imported once"""
+    import matplotlib
+    import GUI.lib_gui  # noqa: F401, plotly / pandas / scipy / matplotlib
+    matplotlib.use("Agg", force=True)  # Files only, no GUI in the workers
+
+
+def _run_export(plotter, method: str) -> float:
+    t0 = time.perf_counter()
+    getattr(plotter, method)()
+    return time.perf_counter() - t0
+
+
+class ExportService:
+    def __init__(self, max_workers: int = 2, max_pending: int = 8,
+                 on_done: Optional[Callable[[str, bool, float, Optional[str]], None]] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(1, int(max_pending))
+        self.on_done = on_done
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.done: List[str] = []
+        self.failed: List[str] = []
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 initializer=_warm_imports)
+        return self._executor
+
+    def start(self) -> None:
+        """Spawn and warm the workers ahead of the first sweep"""
+        pool = self._pool()
+        for _ in range(self.max_workers):
+            pool.submit(time.sleep, 0)
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def submit(self, name: str, plotter, method: str = "generate_plots",
+               timeout: Optional[float] = None) -> Future:
+        """
+        Queue plotter.<method>() (plot / plot_luna / ...), returns its Future.
+        Blocks while the queue is full, TimeoutError after timeout seconds.
+        """
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"export queue full ({self.max_pending} pending)")
+        try:
+            fut = self._pool().submit(_run_export, plotter, method)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending += 1
+        fut.add_done_callback(lambda f, n=name: self._finished(n, f))
+        return fut
+
+    def _finished(self, name: str, fut: Future) -> None:
+        ok, seconds, error = True, 0.0, None
+        try:
+            seconds = fut.result()
+            self.done.append(name)
+            print(f"[Export] {name} written in {seconds:.1f}s")
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+            self.failed.append(f"{name}: {error}")
+            print(f"[Export] {name} failed: {error}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+        if self.on_done is not None:
+            try:
+                self.on_done(name, ok, seconds, error)
+            except Exception:
+                pass
+
+    def close(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
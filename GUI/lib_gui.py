@@ -17,7 +17,6 @@ from motors.config.stage_config import *
 from motors.utils.shared_memory import *
 from motors.hal.motors_hal import AxisType
 import gc
-import plotly.express as px
 from pathlib import Path
 import matplotlib.pyplot as plt
 import shutil
@@ -28,6 +27,8 @@ from scipy.ndimage import gaussian_filter
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import matplotlib, logging
 matplotlib.use("QtAgg")
+from GUI.lib_render import ARTIFACTS, render_html, render_static, scatter, write_html, write_source
+from utils import decimate, spectrum_codec
 web_w = 0
 web_h = 0
 from pathlib import Path
@@ -520,7 +521,8 @@ class File():
             "User_add": "Guest",
             "Image": "TSP/none.png",
             "Web": "",
-            "FileFormat": {"csv": 1, "mat": 1, "png": 1, "pdf": 1},
+            "FileFormat": {"csv": 0, "mat": 1, "png": 1, "pdf": 1, "dataset": 1, "lazy": 1,
+                           "compact_html": 1, "spz": 1, "spz_precision": "float32"},
             "FilePath": "",
             "Limit": {"x": "Yes", "y": "Yes", "z": "Yes", "chip": "Yes", "fiber": "Yes"},
             "FineA":  {
@@ -715,7 +717,7 @@ class plot():
                  project=None, data=None, file_format=None,
                  xticks = None, yticks=None, pos_i=None,
                  slot_info: Optional[list] = None, destination_dir = {},
-                 meta_data: Optional[Dict] = None
+                 meta_data: Optional[Dict] = None, y_norm=None, lazy: bool = False
         ):
         if file_format is None:
             self.file_format = {"csv": 1, "mat": 1, "png": 1, "pdf": 1}
@@ -723,6 +725,8 @@ class plot():
             self.file_format = file_format
         self.x = x
         self.y = y
+        self.y_norm = y_norm  # y - reference [dB], same rows as y, or None
+        self.lazy = lazy  # html / pdf / png rendered on first view (GUI.lib_render)
         self.filename = filename
         self.fileTime = fileTime
         self.user = user
@@ -738,6 +742,7 @@ class plot():
 
     def heat_map(self):
         import os
+        import threading
         import numpy as np
         import matplotlib.pyplot as plt
         from mpl_toolkits.axes_grid1 import make_axes_locatable
@@ -816,28 +821,6 @@ class plot():
             i = round(py / dy + mid_y)
             return clamp_idx(j, i)
 
-        # --- draw ---
-        fig, ax = plt.subplots(figsize=(7, 7))
-        heat = ax.imshow(
-            data,
-            origin="lower",  # y increases upward
-            cmap="gist_heat",
-            vmin=vmin - 3,
-            vmax=vmax + 1,
-            interpolation="nearest",
-            extent=[x_edge_min, x_edge_max, y_edge_min, y_edge_max],
-            aspect="equal",
-        )
-
-        title = "Area Sweep Heat Map"
-        ax.set_title(title, fontsize=16)
-        ax.set_xlabel("X (um)")
-        ax.set_ylabel("Y (um)")
-
-        # Ticks at sample centers
-        ax.set_xticks(x_centers)
-        ax.set_yticks(y_centers)
-
         def _fmt_ticks(vals):
             out = []
             for v in vals:
@@ -849,13 +832,61 @@ class plot():
                     out.append(f"{v:.1f}")
             return out
 
-        ax.set_xticklabels(_fmt_ticks(x_centers), fontsize=8)
-        ax.set_yticklabels(_fmt_ticks(y_centers), fontsize=8)
+        def draw(fig, ax):
+            heat = ax.imshow(
+                decimate.image(data, decimate.pixel_columns(fig)),  # Same extent, indices below stay on data
+                origin="lower",  # y increases upward
+                cmap="gist_heat",
+                vmin=vmin - 3,
+                vmax=vmax + 1,
+                interpolation="nearest",
+                extent=[x_edge_min, x_edge_max, y_edge_min, y_edge_max],
+                aspect="equal",
+            )
 
-        # Colorbar
-        div = make_axes_locatable(ax)
-        cax = div.append_axes("right", size="5%", pad=0.05)
-        plt.colorbar(heat, cax=cax, label="Power (dBm)")
+            title = "Area Sweep Heat Map"
+            ax.set_title(title, fontsize=16)
+            ax.set_xlabel("X (um)")
+            ax.set_ylabel("Y (um)")
+
+            # Ticks at sample centers
+            ax.set_xticks(x_centers)
+            ax.set_yticks(y_centers)
+            ax.set_xticklabels(_fmt_ticks(x_centers), fontsize=8)
+            ax.set_yticklabels(_fmt_ticks(y_centers), fontsize=8)
+
+            # Colorbar
+            div = make_axes_locatable(ax)
+            cax = div.append_axes("right", size="5%", pad=0.05)
+            fig.colorbar(heat, cax=cax, label="Power (dBm)")
+            return heat
+
+        # --- save outputs (own Agg figure, written while the window is open) ---
+        def save_outputs():
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            try:
+                out_dir = os.path.join(".", "UserData", self.user, self.project, "HeatMap")
+                os.makedirs(out_dir, exist_ok=True)
+                csv_path = os.path.join(out_dir, f"{self.filename}_{self.fileTime}.csv")
+                np.savetxt(csv_path, data, delimiter=",", fmt="%.4f")
+                print(f"Saved heatmap data: {csv_path}")
+                out_fig = Figure(figsize=(7, 7))
+                FigureCanvasAgg(out_fig)
+                draw(out_fig, out_fig.add_subplot(111))
+                out_fig.tight_layout(rect=[0, 0, 0.95, 1.0])
+                fig_path = os.path.join(out_dir, f"{self.filename}_{self.fileTime}.png")
+                out_fig.savefig(fig_path, dpi=300)
+                print(f"Saved heatmap figure: {fig_path}")
+            except Exception as e:
+                print(f"Exception saving heatmap: {e}")
+
+        saver = threading.Thread(target=save_outputs, daemon=True)
+        saver.start()
+
+        # --- draw ---
+        fig, ax = plt.subplots(figsize=(7, 7))
+        draw(fig, ax)
 
         # --- hover crosshair (snap to cell centers) ---
         # Start crosshair at center
@@ -925,17 +956,8 @@ class plot():
 
         fig.tight_layout(rect=[0, 0, 0.95, 1.0])
         plt.show()
-
-        # --- save outputs ---
-        out_dir = os.path.join(".", "UserData", self.user, self.project, "HeatMap")
-        os.makedirs(out_dir, exist_ok=True)
-        fig_path = os.path.join(out_dir, f"{self.filename}_{self.fileTime}.png")
-        fig.savefig(fig_path, dpi=300)
-        print(f"Saved heatmap figure: {fig_path}")
-        csv_path = os.path.join(out_dir, f"{self.filename}_{self.fileTime}.csv")
-        np.savetxt(csv_path, data, delimiter=",", fmt="%.4f")
-        print(f"Saved heatmap data: {csv_path}")
         plt.close(fig)
+        saver.join()
 
     def _cleanup_old_plots(self, keep: int = 1) -> None:
         self.output_dir = Path("./res/spectral_sweep")
@@ -964,34 +986,20 @@ class plot():
             path = self.destination_dir.get("dest_dir")
             path = os.path.join(path, "Spectrum", name)
 
+        # (n_det, n_pts) block, a view when y is already one (SpectrumResult)
+        y_block = np.atleast_2d(np.asarray(y_values))
+
+        output_html = os.path.join(path, f"{filename}_{fileTime}.html")
+        wanted = [k for k in ARTIFACTS if self.file_format.get(k, 1) == 1]
+        compact = self.file_format.get("compact_html", 1) == 1
         try:
-            plots = {"Wavelength [nm]": x_axis}
-            plotnames = []
-            for element in range(0, len(y_values)):
-                if self.slot_info is not None:
-                    # Updated for new (mf, slot, head) format
-                    mf, slot, head = self.slot_info[element]
-                    plotname = f'Detector MF{mf}:{slot}.{head+1}'
-                else:
-                    plotname = "Detector " + str(element + 1)
-                plots[plotname] = y_values[element]
-                plotnames.append(plotname)
-            fig = px.line(plots, x="Wavelength [nm]", y=plotnames,
-                          labels={'value': "Power [dBm]", 'x': "Wavelength [nm]"})
-            if self.slot_info is not None:
-                for i, (mf, slot, head) in enumerate(self.slot_info):
-                    fig.data[i].name = f'MF{mf}:{slot}.{head}'
-            else:
-                for i in range(0, len(y_values)):
-                    fig.data[i].name = str(i + 1)
-            fig.update_layout(legend_title_text="Detector")
-            output_html = os.path.join(path, f"{filename}_{fileTime}.html")
-            os.makedirs(os.path.dirname(output_html), exist_ok=True)
-            fig.write_html(output_html)
-
-            # output_html2 = os.path.join(file_path, f"{filename}_{fileTime}.html")
-            # os.makedirs(os.path.dirname(output_html2), exist_ok=True)
-            # fig.write_html(output_html2)
+            if self.lazy:
+                # Keep the data, render each artifact when first opened
+                write_source(os.path.join(path, f"{filename}_{fileTime}"),
+                             x_axis, y_block, self.slot_info, wanted, compact, y_norm=self.y_norm)
+            elif "html" in wanted:
+                render_html(x_axis, y_block, self.slot_info, output_html, compact=compact,
+                            y_norm=self.y_norm)
         except Exception as e:
             try:
                 print("Exception generating html plot")
@@ -999,11 +1007,25 @@ class plot():
             finally:
                 e = None
                 del e
-        if self.file_format["csv"] == 1:
+        if self.file_format.get("spz", 1) == 1:
+            # Compact copy of the sweep (utils.spectrum_codec), the CSV is made from it
+            # on export (spectrum_codec.csv_pending) instead of written for every sweep
             try:
-                df = pd.DataFrame({"Wavelength [nm]": x_axis})
-                for element in range(len(y_values)):
-                    df[f"Detector {element + 1}"] = y_values[element]
+                spectrum_codec.save(os.path.join(path, f"{filename}_{fileTime}"), x_axis, y_block,
+                                    precision=self.file_format.get("spz_precision", "float32"),
+                                    channels=self.slot_info, meta=self.meta_data, y_norm=self.y_norm)
+            except Exception as e:
+                print("Exception saving spz")
+                print(e)
+
+        if self.file_format["csv"] == 1 and self.file_format.get("spz", 1) != 1:
+            try:
+                df = pd.DataFrame(y_block.T, copy=False,
+                                  columns=[f"Detector {element + 1}" for element in range(len(y_values))])
+                df.insert(0, "Wavelength [nm]", x_axis)
+                if self.y_norm is not None:
+                    for element in range(len(self.y_norm)):
+                        df[f"Detector {element + 1} Normalised [dB]"] = self.y_norm[element]
                 output_csv = os.path.join(path, f"{filename}_{fileTime}.csv")
                 os.makedirs(os.path.dirname(output_csv), exist_ok=True)
                 df.to_csv(output_csv, index=False)
@@ -1017,7 +1039,7 @@ class plot():
 
         if self.file_format["mat"] == 1:
             try:
-                detectors_matrix = np.column_stack(y_values) if len(y_values) > 0 else np.empty((len(x_axis), 0))
+                detectors_matrix = y_block.T if len(y_values) > 0 else np.empty((len(x_axis), 0))
                 detector_names = [f"Detector {i + 1}" for i in range(len(y_values))]
                 mat_dict = {
                     "wavelength_nm": np.asarray(x_axis),
@@ -1030,6 +1052,8 @@ class plot():
                     "name": np.array(name, dtype=object),
                     "meta": self.meta_data,
                 }
+                if self.y_norm is not None:
+                    mat_dict["detectors_norm_db"] = np.column_stack(self.y_norm)
                 output_mat = os.path.join(path, f"{filename}_{fileTime}.mat")
                 os.makedirs(os.path.dirname(output_mat), exist_ok=True)
                 savemat(output_mat, mat_dict)
@@ -1042,39 +1066,15 @@ class plot():
                 print(e)
 
         try:
-            image_dpi = 20
-            plt.figure(figsize=(100 / image_dpi, 100 / image_dpi), dpi=image_dpi)
-            for element in range(0, len(y_values)):
-                plt.plot(x_axis, y_values[element], linewidth=0.2, label=f"{element+1}")
-            plt.xlabel("Wavelength [nm]")
-            plt.ylabel("Power [dBm]")
-            plt.legend(title="Detector", fontsize=8, title_fontsize=9, ncol=2, loc='upper right')
-            plt.tight_layout()
-
-            if self.file_format["pdf"] == 1:
-                output_pdf = os.path.join(path, f"{filename}_{fileTime}.pdf")
-                os.makedirs(os.path.dirname(output_pdf), exist_ok=True)
-                plt.savefig(output_pdf, dpi=image_dpi)
-
-                # output_pdf2 = os.path.join(file_path, f"{filename}_{fileTime}.pdf")
-                # os.makedirs(os.path.dirname(output_pdf2), exist_ok=True)
-                # plt.savefig(output_pdf2, dpi=image_dpi)
-
-            if self.file_format["png"] == 1:
-                output_png2 = os.path.join(path, f"{filename}_{fileTime}.png")
-                os.makedirs(os.path.dirname(output_png2), exist_ok=True)
-                plt.savefig(output_png2, dpi=300)
-
-                # output_png3= os.path.join(file_path, f"{filename}_{fileTime}.png")
-                # os.makedirs(os.path.dirname(output_png3), exist_ok=True)
-                # plt.savefig(output_png3, dpi=300)
-
+            # The GUI preview is always shown, saved png / pdf only when eager
             output_png = os.path.join(".", "res", "spectral_sweep", f"{filename}_{fileTime}.png")
-            os.makedirs(os.path.dirname(output_png), exist_ok=True)
-            plt.savefig(output_png, dpi=300)
+            outputs = {"preview": output_png}
+            if not self.lazy:
+                outputs.update({k: os.path.join(path, f"{filename}_{fileTime}.{k}")
+                                for k in ("pdf", "png") if k in wanted})
+            render_static(x_axis, y_block, outputs, y_norm=self.y_norm)
             self._cleanup_old_plots(keep=1)
 
-            plt.close()
             file = File("shared_memory", "Image", f"spectral_sweep/{filename}_{fileTime}.png", "Web", output_html)
             file.save()
         except Exception as e:
@@ -1165,8 +1165,17 @@ class plot_luna():
         
         os.makedirs(path, exist_ok=True)
         
+        # IL / GD rows for drawing, exports below keep every point
+        traces = np.vstack([np.asarray(self.insertion_loss, dtype=float),
+                            np.asarray(self.group_delay, dtype=float)])
+
         # ========== HTML (Interactive Plotly with subplots) ==========
         try:
+            compact = self.file_format.get("compact_html", 1) == 1
+            trace = scatter(compact)
+            xs, ys = decimate.for_plot(self.wavelength, traces)
+            if compact:
+                ys = ys.astype(np.float32)
             fig = make_subplots(
                 rows=2, cols=1,
                 shared_xaxes=True,
@@ -1176,7 +1185,7 @@ class plot_luna():
             
             # Top: Insertion Loss
             fig.add_trace(
-                go.Scatter(x=self.wavelength, y=self.insertion_loss, 
+                trace(x=xs[0], y=ys[0], 
                           mode='lines', name='Insertion Loss',
                           line=dict(color='#1f77b4', width=2)),
                 row=1, col=1
@@ -1184,7 +1193,7 @@ class plot_luna():
             
             # Bottom: Group Delay
             fig.add_trace(
-                go.Scatter(x=self.wavelength, y=self.group_delay,
+                trace(x=xs[1], y=ys[1],
                           mode='lines', name='Group Delay',
                           line=dict(color='#ff7f0e', width=2)),
                 row=2, col=1
@@ -1197,7 +1206,7 @@ class plot_luna():
             fig.update_layout(height=700, showlegend=False, title_text="OVA Measurement")
             
             output_html = os.path.join(path, f"{self.filename}_{self.fileTime}.html")
-            fig.write_html(output_html)
+            write_html(fig, output_html, compact)
             print(f"Saved HTML: {output_html}")
         except Exception as e:
             print(f"Exception generating HTML plot: {e}")
@@ -1267,15 +1276,16 @@ class plot_luna():
         # ========== PNG/PDF (matplotlib) ==========
         try:
             fig, axes = plt.subplots(2, 1, figsize=(10, 8), sharex=True)
+            xs, ys = decimate.minmax(self.wavelength, traces, decimate.pixel_columns(fig, 300))
             
             # Top: Insertion Loss
-            axes[0].plot(self.wavelength, self.insertion_loss, linewidth=1.5, color='#1f77b4')
+            axes[0].plot(xs[0], ys[0], linewidth=1.5, color='#1f77b4')
             axes[0].set_ylabel("Insertion Loss (dB)", fontsize=12)
             axes[0].set_title("OVA Measurement", fontsize=14, fontweight='bold')
             axes[0].grid(True, alpha=0.3, linestyle='--')
             
             # Bottom: Group Delay
-            axes[1].plot(self.wavelength, self.group_delay, linewidth=1.5, color='#ff7f0e')
+            axes[1].plot(xs[1], ys[1], linewidth=1.5, color='#ff7f0e')
             axes[1].set_xlabel("Wavelength (nm)", fontsize=12)
             axes[1].set_ylabel("Group Delay (ps)", fontsize=12)
             axes[1].grid(True, alpha=0.3, linestyle='--')
@@ -1405,7 +1415,7 @@ class plot_ld_sweep():
                             title_text="LD Current Sweep")
             
             output_html = os.path.join(path, f"{self.filename}_{self.fileTime}.html")
-            fig.write_html(output_html)
+            write_html(fig, output_html)
             print(f"Saved HTML: {output_html}")
             
             # Also save PNG to ./res for GUI display
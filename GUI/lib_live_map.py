@@ -0,0 +1,184 @@
+import multiprocessing as mp
+import queue
+import time
+from typing import Any, Iterator, Optional, Tuple
+
+import numpy as np
+
+"""
+Live heat map of a running area scan.
+
+AreaSweep publishes every cell it reads on a LiveMapChannel (a
+multiprocessing queue of small tuples); run_live_heat_map, started in its
+own Process like the other plot windows, draws them as they arrive:
+
+    channel = LiveMapChannel()
+    Process(target=run_live_heat_map, args=(channel, cancel_event, diagram)).start()
+    AreaSweep(..., live_channel=channel)      # open() / publish() per cell
+    channel.close(data)                       # final view + files
+
+    ("open", (rows, cols), step_um)
+    ("cell", row, col, dBm)
+    ("done", data)
+
+The image is one persistent artist: new cells are blitted over a cached
+background (axes, ticks and colorbar are not redrawn), a full redraw only
+happens when the colour range has to grow. "Abort scan" sets the same
+cancel event as the busy dialog, so a bad scan can be stopped early. On
+"done" the window hands over to plot.heat_map (click to move, crosshair),
+which writes its PNG / CSV in the background.
+"""
+
+POLL_MS = 50
+RANGE_SLACK_DB = 1.0  # Colour range grows in steps, not on every new extreme
+
+
+class LiveMapChannel:
+    def __init__(self, maxsize: int = 0):
+        self._q = mp.Queue(maxsize)
+
+    # Producer side (AreaSweep)
+    def open(self, shape: Tuple[int, int], step: float) -> None:
+        self._put(("open", (int(shape[0]), int(shape[1])), float(step)))
+
+    def publish(self, row: int, col: int, value: float) -> None:
+        self._put(("cell", int(row), int(col), float(value)))
+
+    def close(self, data) -> None:
+        self._put(("done", None if data is None else np.asarray(data, dtype=float)))
+
+    def _put(self, msg) -> None:
+        try:
+            self._q.put_nowait(msg)
+        except Exception:
+            pass  # A missing viewer never holds up the scan
+
+    # Consumer side (viewer)
+    def get(self, timeout: Optional[float] = None):
+        try:
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self, limit: int = 10000) -> Iterator[Any]:
+        for _ in range(limit):
+            try:
+                yield self._q.get_nowait()
+            except queue.Empty:
+                return
+
+
+def _extent(shape, step):
+    rows, cols = shape
+    half_x = cols * step / 2.0
+    half_y = rows * step / 2.0
+    return [-half_x, half_x, -half_y, half_y]
+
+
+def run_live_heat_map(channel: LiveMapChannel, cancel_event=None, diagram=None,
+                      open_timeout: float = 60.0) -> None:
+    """Process target: live view while scanning, then diagram.heat_map() on the result"""
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Button
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+
+    msg = channel.get(timeout=open_timeout)
+    while msg is not None and msg[0] != "open":
+        if msg[0] == "done":
+            break
+        msg = channel.get(timeout=open_timeout)
+    if msg is None:
+        print("[LiveMap] No scan started")
+        return
+
+    done = {"data": msg[1] if msg[0] == "done" else None, "finished": msg[0] == "done"}
+    if not done["finished"]:
+        shape, step = msg[1], msg[2]
+        img = np.full(shape, np.nan)
+        total = shape[0] * shape[1]
+        state = {"n": 0, "lo": np.inf, "hi": -np.inf, "bg": None, "t0": time.monotonic()}
+
+        fig, ax = plt.subplots(figsize=(7, 7))
+        im = ax.imshow(img, origin="lower", cmap="gist_heat", interpolation="nearest",
+                       extent=_extent(shape, step), aspect="equal", vmin=-60, vmax=0,
+                       animated=True)
+        ax.set_title("Area Sweep (live)", fontsize=16)
+        ax.set_xlabel("X (um)")
+        ax.set_ylabel("Y (um)")
+        counter = ax.text(0.01, 0.99, f"0/{total}", transform=ax.transAxes, ha="left", va="top",
+                          fontsize=9, bbox=dict(boxstyle="round,pad=0.2", fc="white", alpha=0.6),
+                          animated=True)
+        div = make_axes_locatable(ax)
+        cax = div.append_axes("right", size="5%", pad=0.05)
+        fig.colorbar(im, cax=cax, label="Power (dBm)")
+
+        abort_ax = fig.add_axes([0.80, 0.01, 0.18, 0.05])
+        abort_btn = Button(abort_ax, "Abort scan")
+
+        def on_abort(_event):
+            if cancel_event is not None:
+                cancel_event.set()
+                abort_btn.label.set_text("Aborting...")
+                fig.canvas.draw_idle()
+
+        abort_btn.on_clicked(on_abort)
+
+        def on_draw(_event):
+            # Cache everything but the animated artists, then put them back
+            state["bg"] = fig.canvas.copy_from_bbox(ax.bbox)
+            ax.draw_artist(im)
+            ax.draw_artist(counter)
+
+        fig.canvas.mpl_connect("draw_event", on_draw)
+
+        def blit():
+            if state["bg"] is None:
+                fig.canvas.draw_idle()
+                return
+            fig.canvas.restore_region(state["bg"])
+            ax.draw_artist(im)
+            ax.draw_artist(counter)
+            fig.canvas.blit(ax.bbox)
+
+        def poll():
+            changed = False
+            for m in channel.drain():
+                if m[0] == "cell":
+                    _, r, c, v = m
+                    img[r, c] = v
+                    state["n"] += 1
+                    if np.isfinite(v):
+                        state["lo"] = min(state["lo"], v)
+                        state["hi"] = max(state["hi"], v)
+                    changed = True
+                elif m[0] == "done":
+                    done["data"], done["finished"] = m[1], True
+            if changed:
+                im.set_data(img)
+                counter.set_text(f"{state['n']}/{total}  {time.monotonic() - state['t0']:.0f}s")
+                lo, hi = im.get_clim()
+                if state["lo"] < lo or state["hi"] > hi or lo < state["lo"] - 3 - 2 * RANGE_SLACK_DB:
+                    im.set_clim(state["lo"] - 3 - RANGE_SLACK_DB, state["hi"] + 1 + RANGE_SLACK_DB)
+                    fig.canvas.draw_idle()  # Colorbar changes, full redraw
+                else:
+                    blit()
+            if done["finished"]:
+                timer.stop()
+                plt.close(fig)
+
+        timer = fig.canvas.new_timer(interval=POLL_MS)
+        timer.add_callback(poll)
+        timer.start()
+        plt.show()
+
+        # Window closed by hand: keep waiting for the result
+        while not done["finished"]:
+            for m in channel.drain():
+                if m[0] == "done":
+                    done["data"], done["finished"] = m[1], True
+            if not done["finished"]:
+                time.sleep(POLL_MS / 1000.0)
+
+    if diagram is not None and done["data"] is not None and np.isfinite(done["data"]).any():
+        diagram.data = done["data"]
+        diagram.heat_map()
@@ -0,0 +1,253 @@
+import json
+import os
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from utils import decimate
+
+"""
+Spectral sweep artifacts (HTML / PDF / PNG), eager or on demand.
+
+Eager (plot.generate_plots with lazy=False) renders everything FileFormat
+asks for right away, as before. Lazy only stores the sweep once next to
+where the artifacts would go:
+
+    <name>_<time>.sweep.npz     wavelength, detector block, slot_info
+                                (+ y_norm when the sweep was normalised)
+    <name>_<time>.render.json   artifacts requested in FileFormat
+
+and each artifact is rendered the first time it is asked for, then kept
+(an existing file is the cache):
+
+    ensure(".../dev_12_2025-06-01_10-00-00.html")   # viewer about to open it
+    render_pending("./UserData/me/project")          # export a whole run
+
+Project exports (main_testing_gui.save_file) render what is still
+missing in the destination, the source project stays lazy.
+
+    python -m GUI.lib_render <directory> [html,pdf,png]
+
+HTML is compact by default (FileFormat "compact_html"): WebGL traces,
+numpy data as base64 typed arrays, and a <script src> to one plotly.js
+written once per project directory instead of the bundle in every file.
+compact=False writes the old standalone file.
+
+Both renderers draw a decimated copy of the traces (utils.decimate,
+min/max per bucket): HTML keeps decimate.HTML_POINTS per trace, the static
+figures one bucket per pixel column. max_points=None draws everything.
+Normalised traces (y_norm, y - reference [dB]) go on a second y axis.
+"""
+
+SOURCE_SUFFIX = ".sweep.npz"
+MANIFEST_SUFFIX = ".render.json"
+ARTIFACTS = ("html", "pdf", "png")
+
+STATIC_DPI = {"pdf": 20, "png": 300}  # Same figure / dpi as the eager path
+
+PROJECT_LEVELS = 2  # <project>/<Spectrum|OVA|LD_Sweep>/<device>/<file>.html
+
+
+def plotly_js(out_html: str, levels: int = PROJECT_LEVELS) -> str:
+    """
+    src of the shared plotly.js for out_html, relative to it. The bundle is
+    written to the project directory the first time it is needed.
+    """
+    import plotly
+    from plotly.offline import get_plotlyjs
+    html_dir = os.path.dirname(os.path.abspath(out_html))
+    root = html_dir
+    for _ in range(levels):
+        root = os.path.dirname(root)
+    target = os.path.join(root, f"plotly-{plotly.__version__}.min.js")
+    if not os.path.exists(target):
+        os.makedirs(root, exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"  # Export workers may race for it
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp, target)
+    return os.path.relpath(target, html_dir).replace(os.sep, "/")
+
+
+def scatter(compact: bool = True):
+    """Trace class for line plots, WebGL when compact"""
+    import plotly.graph_objects as go
+    return go.Scattergl if compact else go.Scatter
+
+
+def write_html(fig, out_html: str, compact: bool = True) -> str:
+    os.makedirs(os.path.dirname(out_html) or ".", exist_ok=True)
+    if compact:
+        fig.write_html(out_html, include_plotlyjs=plotly_js(out_html))
+    else:
+        fig.write_html(out_html)
+    return out_html
+
+
+def render_html(x, y_block, slot_info, out_html: str,
+                max_points: Optional[int] = decimate.HTML_POINTS, compact: bool = True,
+                y_norm=None) -> str:
+    import plotly.graph_objects as go
+    y_block = np.atleast_2d(np.asarray(y_block))
+    if slot_info is not None:
+        names = [f'MF{mf}:{slot}.{head}' for mf, slot, head in list(slot_info)[:len(y_block)]]
+    else:
+        names = []
+    names += [str(i + 1) for i in range(len(names), len(y_block))]
+    xs, ys = decimate.for_plot(x, y_block, max_points)
+    if compact:
+        ys = ys.astype(np.float32)  # Half the typed array, far below detector noise
+    trace = scatter(compact)
+    fig = go.Figure([trace(x=np.ascontiguousarray(xs[i]), y=ys[i], mode="lines", name=names[i])
+                     for i in range(len(ys))])
+    fig.update_layout(legend_title_text="Detector", xaxis_title="Wavelength [nm]",
+                      yaxis_title="Power [dBm]")
+    if y_norm is not None:
+        xs, ys = decimate.for_plot(x, np.atleast_2d(np.asarray(y_norm)), max_points)
+        if compact:
+            ys = ys.astype(np.float32)
+        for i in range(len(ys)):
+            fig.add_trace(trace(x=np.ascontiguousarray(xs[i]), y=ys[i], mode="lines",
+                                name=f"{names[i] if i < len(names) else i + 1} norm",
+                                line=dict(dash="dot"), yaxis="y2"))
+        fig.update_layout(yaxis2=dict(title="Normalised [dB]", overlaying="y", side="right"))
+    return write_html(fig, out_html, compact)
+
+
+def render_static(x, y_block, outputs: Dict[str, str], decimated: bool = True,
+                  y_norm=None) -> None:
+    """
+    One matplotlib figure saved to every {kind: path} (pdf / png / preview).
+    No pyplot, so it is safe from worker threads whatever the GUI backend.
+    """
+    from matplotlib.figure import Figure
+    y_block = np.atleast_2d(np.asarray(y_block))
+    image_dpi = 20
+    fig = Figure(figsize=(100 / image_dpi, 100 / image_dpi), dpi=image_dpi)
+    ax = fig.add_subplot()
+    width = decimate.pixel_columns(fig, max(STATIC_DPI.get(k, 300) for k in outputs)) \
+        if outputs and decimated else 0
+    xs, ys = decimate.minmax(x, y_block, width)  # 0 buckets -> every point
+    for element in range(0, len(ys)):
+        ax.plot(xs[element], ys[element], linewidth=0.2, label=f"{element+1}")
+    ax.set_xlabel("Wavelength [nm]")
+    ax.set_ylabel("Power [dBm]")
+    ax.legend(title="Detector", fontsize=8, title_fontsize=9, ncol=2, loc='upper right')
+    if y_norm is not None:
+        ax2 = ax.twinx()
+        xs, ys = decimate.minmax(x, np.atleast_2d(np.asarray(y_norm)), width)
+        for element in range(0, len(ys)):
+            ax2.plot(xs[element], ys[element], linewidth=0.2, linestyle="--",
+                     label=f"{element+1} norm")
+        ax2.set_ylabel("Normalised [dB]")
+        ax2.legend(fontsize=8, ncol=2, loc='lower right')
+    fig.tight_layout()
+    for kind, out in outputs.items():
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        fig.savefig(out, dpi=STATIC_DPI.get(kind, 300))
+
+
+######################################################################
+# Lazy artifacts
+######################################################################
+
+def write_source(stem: str, x, y_block, slot_info, requested: Iterable[str],
+                 compact: bool = True, y_norm=None) -> str:
+    """Store the sweep once and note which artifacts FileFormat asked for"""
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    arrays = {"x": np.asarray(x, dtype=np.float64), "y": np.atleast_2d(np.asarray(y_block)),
+              "slot_info": np.asarray(slot_info if slot_info is not None else [], dtype=np.int64)}
+    if y_norm is not None:
+        arrays["y_norm"] = np.atleast_2d(np.asarray(y_norm))
+    np.savez(stem + SOURCE_SUFFIX, **arrays)
+    with open(stem + MANIFEST_SUFFIX, "w") as f:
+        json.dump({"requested": [k for k in requested if k in ARTIFACTS],
+                   "compact_html": bool(compact)}, f)
+    return stem + SOURCE_SUFFIX
+
+
+def _load_source(stem: str):
+    with np.load(stem + SOURCE_SUFFIX) as z:
+        slot_info = [tuple(int(v) for v in r) for r in z["slot_info"]] or None
+        y_norm = z["y_norm"] if "y_norm" in z.files else None  # Optional, older sweeps lack it
+        return z["x"], z["y"], slot_info, y_norm
+
+
+def _manifest(stem: str) -> dict:
+    try:
+        with open(stem + MANIFEST_SUFFIX, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def requested(stem: str) -> List[str]:
+    return list(_manifest(stem).get("requested", []))
+
+
+def render(stem: str, kinds: Sequence[str]) -> List[str]:
+    """Render the missing ones of kinds for a stored sweep, returns their paths"""
+    paths = {k: f"{stem}.{k}" for k in kinds if k in ARTIFACTS}
+    todo = {k: p for k, p in paths.items() if not os.path.exists(p)}
+    if todo:
+        x, y, slot_info, y_norm = _load_source(stem)
+        if "html" in todo:
+            render_html(x, y, slot_info, todo.pop("html"),
+                        compact=_manifest(stem).get("compact_html", True), y_norm=y_norm)
+        if todo:
+            render_static(x, y, todo, y_norm=y_norm)
+    return list(paths.values())
+
+
+def ensure(artifact_path: str) -> Optional[str]:
+    """
+    Path of an artifact, rendered from its stored sweep first if it does
+    not exist yet. None if there is neither the file nor a source.
+    """
+    if not artifact_path:
+        return None
+    if os.path.exists(artifact_path):
+        return artifact_path
+    stem, ext = os.path.splitext(artifact_path)
+    kind = ext.lstrip(".").lower()
+    if kind not in ARTIFACTS or not os.path.exists(stem + SOURCE_SUFFIX):
+        return None
+    render(stem, [kind])
+    return artifact_path
+
+
+def stems(root: str) -> List[str]:
+    """Every stored sweep below root"""
+    out = []
+    for dirpath, _, files in os.walk(root):
+        for f in files:
+            if f.endswith(SOURCE_SUFFIX):
+                out.append(os.path.join(dirpath, f[:-len(SOURCE_SUFFIX)]))
+    return sorted(out)
+
+
+def render_pending(root: str, kinds: Optional[Sequence[str]] = None) -> int:
+    """Render what FileFormat requested (or kinds) for every stored sweep below root"""
+    n = 0
+    for stem in stems(root):
+        want = list(kinds) if kinds is not None else requested(stem)
+        missing = [k for k in want if k in ARTIFACTS and not os.path.exists(f"{stem}.{k}")]
+        if not missing:
+            continue
+        try:
+            render(stem, missing)
+            n += len(missing)
+        except Exception as e:
+            print(f"[Render] {stem}: {e}")
+    return n
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m GUI.lib_render <directory> [html,pdf,png]")
+        sys.exit(1)
+    import matplotlib
+    matplotlib.use("Agg")
+    kinds = sys.argv[2].split(",") if len(sys.argv) > 2 else None
+    print(f"[Render] {render_pending(sys.argv[1], kinds)} artifact(s) written")
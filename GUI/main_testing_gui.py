@@ -1,8 +1,12 @@
 from GUI.lib_gui import *
 from remi import start, App
 from GUI import lib_coordinates
-import threading, math, json, os, time, webview, wx, shutil
+import threading, math, json, os, time, webview, wx
 from GUI.lib_tsp import TSPSolver
+from GUI.lib_render import render_pending
+from utils.bulk_export import export_tree
+from utils.spectrum_codec import csv_pending
+from utils.results_catalog import FILE_NAME as CATALOG_FILE, open_catalog
 
 command_path = os.path.join("database", "command.json")
 shared_path = os.path.join("database", "shared_memory.json")
@@ -437,43 +441,32 @@ class testing(App):
         # --- Destination project root is EXACTLY what user typed ---
         dest_project_root = dest_root  
 
+        # --- Incremental copy of the project (config + results so far) ---
+        # Unchanged files are skipped, nothing already in the destination is
+        # removed (auto sweeps keep writing into it).
         try:
-            # Wipe any previous export in that directory
-            if os.path.exists(dest_project_root):
-                shutil.rmtree(dest_project_root)
-                print(f"Removed existing export tree: {dest_project_root}")
-
-            os.makedirs(dest_project_root, exist_ok=True)
+            # The results catalog is live (WAL), its rows are merged instead
+            result = export_tree(src_project_root, dest_project_root,
+                                 activity=f"Exporting {project}",
+                                 exclude=(CATALOG_FILE, CATALOG_FILE + "-wal", CATALOG_FILE + "-shm"))
+            if result.failed:
+                print(f"X {result.failed} file(s) could not be exported")
+            merged = open_catalog(dest_project_root).merge(os.path.join(src_project_root, CATALOG_FILE))
+            if merged:
+                print(f"{merged} result(s) added to the export catalog")
+            # Lazy sweeps only carry .sweep.npz: render the HTML / PDF / PNG
+            # FileFormat asked for, in the export (nothing already there is redone)
+            rendered = render_pending(dest_project_root)
+            if rendered:
+                print(f"{rendered} plot(s) rendered for the export")
+            # Sweeps are kept as .spz, the export gets their CSV
+            converted = csv_pending(dest_project_root)
+            if converted:
+                print(f"{converted} CSV file(s) written for the export")
         except Exception as e:
-            print(f"Failed to prepare destination: {e}")
+            print(f"Failed to export project: {e}")
             return
 
-        # --- Copy only JSON configs ---
-        try:
-            src_project_cfg = os.path.join(src_project_root, "project_config.json")
-            if os.path.isfile(src_project_cfg):
-                dest_project_cfg = os.path.join(dest_project_root, "project_config.json")
-                shutil.copy2(src_project_cfg, dest_project_cfg)
-        except Exception as e:
-            print(f"Failed to copy config JSON files: {e}")
-
-        # --- Mirror Spectrum directory structure ONLY (no files) ---
-        src_spectrum_root = os.path.join(src_project_root, "Spectrum")
-        if os.path.isdir(src_spectrum_root):
-            dest_spectrum_root = os.path.join(dest_project_root, "Spectrum")
-            try:
-                for dirpath, dirnames, _filenames in os.walk(src_spectrum_root):
-                    rel = os.path.relpath(dirpath, src_spectrum_root)
-                    if rel == ".":
-                        target_dir = dest_spectrum_root
-                    else:
-                        target_dir = os.path.join(dest_spectrum_root, rel)
-                    os.makedirs(target_dir, exist_ok=True)
-            except Exception as e:
-                print(f"Failed to mirror Spectrum directory structure: {e}")
-        else:
-            print("No Spectrum directory to mirror; autosweep will create it as needed.")
-
         try:
             file = File(
                 "shared_memory",
@@ -533,7 +526,7 @@ class testing(App):
             elif key == "testing_solve":
                 self.tsp_solve()
             elif key == "testing_save":
-                self.save_file()
+                self.run_in_thread(self.save_file)
             elif key == "testing_file":
                 self.file_dd.set_value(val)
             elif key == "testing_path":
@@ -14,6 +14,13 @@ from NIR.nir_manager import NIRManager
 from NIR.config.nir_config import NIRConfiguration
 from measure.area_sweep import AreaSweep
 from measure.fine_align import FineAlign
+from measure.peak_localiser import locate_peak
+from measure.spectral_analysis import SpectralAnalysisPool, TABLE_NAME
+from GUI.lib_export import ExportService
+from GUI.lib_live_map import LiveMapChannel, run_live_heat_map
+from GUI.lib_render import ensure as ensure_rendered
+from utils.spectrum_dataset import SpectrumDataset
+from utils.results_catalog import open_catalog
 from measure.config.area_sweep_config import AreaSweepConfiguration
 from measure.config.fine_align_config import FineAlignConfiguration
 from utils.progress_write_helpers import write_progress_file
@@ -84,6 +91,10 @@ class stage_control(App):
         self.slot_info_flag = False
         self.detector_window_settings = {}
         self.meta_data = {}
+        self.analysis_pool = None  # Background spectral analysis during auto sweeps
+        self.export_service = None  # Warm worker processes writing sweep files
+        self.dataset = None  # Per run append only dataset of all auto sweeps
+        self.last_alignment = None  # Outcome of the last fine align, for the results catalog
 
         # Misc vars, managers, progress bar and locks
         self.nir_configure = None
@@ -104,6 +115,8 @@ class stage_control(App):
         self.use_relative_movement = True  # For absolute movements
         self._absolute_locked_axes = {"z": False, "chip": False}  # For tracking of abs mvnts
         self.area_sweep = None
+        self._live_map_procs = []  # Live area scan view / heat map windows still open
+        self.area_peak = None  # (PeakEstimate, scan origin, half extent um) of the last area scan, seeds fine align
         self.fine_align = None
         self.task_laser = 0
         self._progress_lock = threading.Lock()  # For progress.json 'w'
@@ -406,7 +419,10 @@ class stage_control(App):
                     stop_nm=self.sweep["end"],
                     step_nm=self.sweep["step"],
                     laser_power_dbm=self.sweep["power"],
-                    args=args_list
+                    num_scans=int(self.sweep.get("num_scans", 0)),
+                    args=args_list,
+                    adaptive=bool(self.sweep.get("adaptive", 0)),
+                    target_sem_db=self.sweep.get("target_sem_db")
                 )
                 
                 luna_data = None  # No Luna data in NIR mode
@@ -423,7 +439,6 @@ class stage_control(App):
         
         # Plotting the data
         x = wl
-        active_detectors = []
         cancel_flag = getattr(self, "_scan_cancel", None)
         was_cancelled = bool(cancel_flag and cancel_flag.is_set())
         
@@ -453,13 +468,15 @@ class stage_control(App):
                     if not detectors:
                         raise ValueError("No detectors data to plot.")
 
-                    for d in detectors:
-                        active_detectors.append(d)
-
-                    if not active_detectors:
+                    # SpectrumResult block, (n_det, n_pts) without a copy
+                    y = np.asarray(detectors)
+                    if y.ndim != 2 or y.shape[0] == 0:
                         raise ValueError("Detector list empty after sweep.")
 
-                    y = np.vstack(active_detectors)
+                    # Normalised against the reference spectra, if any
+                    if self.sweep.get("reference_file"):
+                        self.nir_manager.load_reference(self.sweep["reference_file"], self.slot_info)
+                    y_norm = self.nir_manager.normalise_sweep(x, y, self.slot_info)
 
                     # Only write to save path on auto measurements
                     dest_cfg = self.use_destination_dir if auto == 1 else {}
@@ -469,15 +486,27 @@ class stage_control(App):
                         self.user, name, self.project,
                         auto, self.file_format, self.slot_info,
                         destination_dir=dest_cfg,
-                        meta_data=self.meta_data
+                        meta_data=self.meta_data,
+                        y_norm=y_norm,
+                        # Auto runs render html / pdf / png on first view, FileFormat lazy=0 is eager
+                        lazy=(auto == 1 and self.file_format.get("lazy", 1) == 1)
                     )
+
+                    if auto == 1 and self.file_format.get("dataset", 1):
+                        self._append_dataset(name, x, detectors, dest_cfg)
+
+                    # Figures of merit are computed off the measurement loop
+                    if auto == 1 and self.sweep.get("analyse", 1):
+                        self._submit_analysis(name, x, y, dest_cfg)
                 
-                p = Process(target=diagram.generate_plots)
-                p.start()
-                p.join()
+                fut = self._submit_export(name, diagram)
+                self._catalog_result(name, auto, fileTime, dest_cfg)
+                if auto == 0:
+                    # Manual sweep: the html is opened right after
+                    fut.result()
 
                 if self.web != "" and auto == 0:
-                    file_uri = Path(self.web).resolve().as_uri()
+                    file_uri = Path(ensure_rendered(self.web) or self.web).resolve().as_uri()
                     webview.create_window(
                         'Stage Control',
                         file_uri,
@@ -618,6 +647,8 @@ class stage_control(App):
             # Connect sensor instance
             self.nir_configure = NIRConfiguration()
             self.nir_configure.driver_types = self.configuration["sensor"]
+            self.nir_configure.sweep_engine = self.port.get("sweep_engine", self.nir_configure.sweep_engine)
+            self.nir_configure.visa_library = self.port.get("visa_library", self.nir_configure.visa_library)
             laser = self.port.get("laser_gpib")
             detector = self.port.get("detector_gpib")
             if laser == detector or detector is None:
@@ -822,13 +853,12 @@ class stage_control(App):
                 time.sleep(10.0)
                 continue
             if self.task_start == 0 and self.slot_info is not None:
-                for mf, slot, head in self.slot_info:
+                # All heads in one call, mainframes are read concurrently
+                powers = self.nir_manager.read_power_all(self.slot_info)
+                for (mf, slot, head), power in zip(self.slot_info, powers):
                     # Calculate display index for this specific head
                     i = (slot-1)*2 + head  # 0-index
-                    
-                    # Read individual head power
-                    power = self.nir_manager.read_power(slot=slot, head=head, mf=mf)
-                    self.ch_vals[i].set_text(str(round(power, 3)))
+                    self.ch_vals[i].set_text(str(round(float(power), 3)))
                 time.sleep(0.3)
             else:
                 print("### Waiting ###")
@@ -841,6 +871,14 @@ class stage_control(App):
 
         print(f"Starting auto sweep of {device_count} devices (estimated {estimated_total_time:.0f}s total)")
 
+        # Every sweep of this run goes to one dataset, opened on the first sweep
+        self.dataset = None
+
+        # Export workers import while the stage moves to the first device
+        if self.export_service is None:
+            self.export_service = ExportService()
+        self.export_service.start()
+
         i = 0
         while i < device_count:
             print("It's " + str(i))
@@ -883,6 +921,8 @@ class stage_control(App):
             activity = f"Device {device_num}/{device_count}: Spectral sweep"
             self._write_progress_file(device_num, activity, progress_percent)
 
+            if self.type and self.nir_manager is not None:
+                self.nir_manager.set_device_type(self.type[int(key[i])-1])
             self.laser_sweep(name=self.devices[int(key[i])-1])
 
             # Update progress: Device completed
@@ -901,6 +941,13 @@ class stage_control(App):
 
         # Final completion
         self._write_progress_file(device_count, "All measurements completed", 100)
+        if self.export_service is not None and self.export_service.pending:
+            print(f"[Export] {self.export_service.pending} sweep(s) still being written")
+        if self.dataset is not None:
+            print(f"[Dataset] {len(self.dataset.index())} sweep(s) in {self.dataset.path}")
+        if self.analysis_pool is not None and self.analysis_pool.pending:
+            print(f"[Analysis] {self.analysis_pool.pending} device(s) still being analysed "
+                  f"-> {self.analysis_pool.table_path}")
 
         with self._scan_done.get_lock():
             self._scan_done.value = 1
@@ -1488,6 +1535,7 @@ class stage_control(App):
             config.threshold = self.fine_a.get("threshold", -10.0)
             config.secondary_wl = self.fine_a.get("secondary_wl", 1540.0)
             config.secondary_loss = self.fine_a.get("secondary_loss", 50.0)
+            config.multi_wl_spiral = bool(self.fine_a.get("multi_wl_spiral", 0))
             if self.slot_info is not None:
                 s_temp = self.slot_info
             else:
@@ -1503,6 +1551,7 @@ class stage_control(App):
                 cancel_event=self._scan_cancel,
                 debug=getattr(self,"debug",False),
                 )
+            self._seed_from_area_peak(self.fine_align, config)
 
             # (Optional) tell the dialog we started
             try:
@@ -1511,7 +1560,8 @@ class stage_control(App):
                 pass
 
             # Wait until FA finishes
-            asyncio.run(self.fine_align.begin_fine_align())
+            ok = asyncio.run(self.fine_align.begin_fine_align())
+            self.last_alignment = {"ok": bool(ok), "loss": self.fine_align.lowest_loss}
 
             # (Optional) final update
             try:
@@ -1521,6 +1571,7 @@ class stage_control(App):
 
         except Exception as e:
             print(f"[FineAlign] Error: {e}")
+            self.last_alignment = {"ok": False, "loss": None}
             # show error state to the dialog
             try:
                 self._write_progress_file(0, f"Fine alignment: error ({e})", 100.0)
@@ -1598,6 +1649,147 @@ class stage_control(App):
         time_per_device = sweep_time + area_time + align_time + overhead_time
         return device_count * time_per_device
     
+    def _submit_export(self, name, diagram):
+        """Write a sweep's files on the export workers, blocks only when the queue is full"""
+        if self.export_service is None:
+            self.export_service = ExportService()
+        return self.export_service.submit(name, diagram)
+
+    def _append_dataset(self, name, wl, detectors, dest_cfg):
+        """Append an auto sweep to this run's dataset (one file set per run)"""
+        try:
+            if self.dataset is None:
+                if dest_cfg == {}:
+                    base = os.path.join(".", "UserData", self.user, self.project)
+                else:
+                    base = dest_cfg.get("dest_dir")
+                run = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                self.dataset = SpectrumDataset(os.path.join(base, "Spectrum", f"run_{run}"))
+            self.dataset.append(name, wl, detectors, channels=self.slot_info,
+                                meta=self.meta_data)
+        except Exception as e:
+            print(f"[Dataset] Could not append {name}: {e}")
+
+    def _reap_live_maps(self, timeout=None):
+        """
+        Join the viewer processes whose window was closed. With a timeout
+        (shutdown) wait that long for each, then terminate what is left.
+        """
+        alive = []
+        for proc in self._live_map_procs:
+            if timeout is not None:
+                proc.join(timeout)
+                if proc.is_alive():
+                    proc.terminate()
+                    proc.join(timeout)
+            if proc.is_alive():
+                alive.append(proc)
+            else:
+                proc.join()
+        self._live_map_procs = alive
+
+    def on_close(self):
+        self._reap_live_maps(timeout=2.0)
+        if self.export_service is not None:
+            # Sweeps handed to the export workers are finished, not dropped
+            if self.export_service.pending:
+                print(f"[Export] Waiting for {self.export_service.pending} sweep(s) to be written")
+            self.export_service.close(wait=True)
+            self.export_service = None
+        super().on_close()
+
+    def _locate_area_peak(self, data):
+        """Sub-cell peak of the finished area scan, kept to seed the next fine align"""
+        self.area_peak = None
+        sweep = self.area_sweep
+        if data is None or sweep is None or sweep.origin is None:
+            return
+        try:
+            est = locate_peak(data, sweep.step, sweep.center_index, sweep.origin)
+            if est is None:
+                return
+            print(f"[AreaScan] Peak {est.peak_dbm:.2f} dBm at ({est.x:.3f}, {est.y:.3f}) um "
+                  f"+- ({est.sigma_x_um:.3f}, {est.sigma_y_um:.3f}) um [{est.method}]")
+            extent = max(np.shape(data)) * sweep.step / 2.0
+            if self.area_s.get("seed_fine_align", 1):
+                self.area_peak = (est, sweep.origin, extent)
+        except Exception as e:
+            print(f"[AreaScan] Peak localisation failed: {e}")
+
+    def _seed_from_area_peak(self, aligner, config):
+        """Start fine align at the area scan peak (once), if the stage is still on that scan"""
+        if self.area_peak is None:
+            return
+        est, origin, extent = self.area_peak
+        self.area_peak = None
+        try:
+            if self.memory is not None and \
+                    np.hypot(self.memory.x_pos - origin[0], self.memory.y_pos - origin[1]) > extent:
+                return  # Moved away (another device) since the scan
+            radius = est.search_radius(k=3.0, min_radius=2 * config.step_size,
+                                       max_radius=config.scan_window)
+            aligner.seed(est.x, est.y, radius)
+        except Exception as e:
+            print(f"[FineAlign] Could not seed from area scan: {e}")
+
+    def _catalog_result(self, name, auto, fileTime, dest_cfg):
+        """Index a sweep (device, GDS info, alignment, files) in the project's results catalog"""
+        try:
+            if dest_cfg == {}:
+                base = os.path.join(".", "UserData", self.user, self.project)
+            else:
+                base = dest_cfg.get("dest_dir")
+            fmt = self.file_format or {}
+            if self.configuration.get("sensor") == "luna_controller":
+                kind, folder, stem = "ova", "OVA", f"ova_sweep_{fileTime}"
+                files = ["html"] + [k for k in ("csv", "mat", "png", "pdf") if fmt.get(k, 0) == 1]
+            else:
+                kind, folder, stem = "spectrum", "Spectrum", f"spectral_sweep_{fileTime}"
+                files = [k for k in ("csv", "mat") if fmt.get(k, 0) == 1]
+                if fmt.get("spz", 1) == 1:
+                    # CSV comes from the .spz on export
+                    files = [k for k in files if k != "csv"] + ["spz"]
+                files += [k for k in ARTIFACTS if fmt.get(k, 1) == 1]
+                if auto == 1 and fmt.get("lazy", 1) == 1:
+                    files.append("sweep.npz")
+            info = {}
+            if self.devices and name in self.devices:
+                idx = self.devices.index(name)
+                coord = self.coordinate[idx] if self.coordinate else None
+                info = {
+                    "device_num": self.number[idx] if self.number else idx + 1,
+                    "device_type": self.type[idx] if self.type else None,
+                    "x": float(coord[0]) if coord else None,
+                    "y": float(coord[1]) if coord else None,
+                    "polarization": self.polarization[idx] if self.polarization else None,
+                    "wavelength": self.wavelength[idx] if self.wavelength else None,
+                }
+            align = self.last_alignment or {}
+            self.last_alignment = None
+            open_catalog(base).add(
+                name, kind, os.path.join(base, folder, name), stem, files,
+                file_time=fileTime, auto=(auto == 1),
+                align_ok=align.get("ok"), align_loss=align.get("loss"),
+                meta={"sweep": self.sweep, "slot_info": self.slot_info}, **info)
+        except Exception as e:
+            print(f"[Catalog] Could not index {name}: {e}")
+
+    def _submit_analysis(self, name, wl, detectors, dest_cfg):
+        """Queue a sweep for the per-project spectral analysis table"""
+        try:
+            if dest_cfg == {}:
+                base = os.path.join(".", "UserData", self.user, self.project)
+            else:
+                base = dest_cfg.get("dest_dir")
+            table = os.path.join(base, "Spectrum", TABLE_NAME)
+            if self.analysis_pool is None or self.analysis_pool.table_path != table:
+                if self.analysis_pool is not None:
+                    self.analysis_pool.close(wait=False)
+                self.analysis_pool = SpectralAnalysisPool(table)
+            self.analysis_pool.submit(name, wl, detectors, self.slot_info)
+        except Exception as e:
+            print(f"[Analysis] Could not queue {name}: {e}")
+
     def _write_progress_file(self, current_device, activity, progress_percent):
         """Atomically write progress for the PyQt dialog to read (thread-safe on Windows)."""
         from pathlib import Path
@@ -1699,34 +1891,45 @@ class stage_control(App):
                 s_temp = [[0, 1, 0]]  # Assume only primary slot
             config.slots = s_temp
 
-            self.area_sweep = AreaSweep(
-                config, self.stage_manager, self.nir_manager,
-                progress=self._as_progress,
-                cancel_event=self._scan_cancel
-            )
-            self.data = asyncio.run(self.area_sweep.begin_sweep())
             fileTime = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-            
-            # Create window for plotting
             diagram = plot(
                 filename="heat_map",
                 fileTime=fileTime,
                 user=self.user,
                 project=self.project,
-                data=self.data,
+                data=None,
                 xticks=int(self.area_s["x_step"]),
                 yticks=None,
                 pos_i = [self.stage_x_pos, self.stage_y_pos]
             )
 
+            # Live view while scanning, becomes the heat map window when done
+            live = LiveMapChannel()
+            self._reap_live_maps()
+            proc = Process(target=run_live_heat_map, args=(live, self._scan_cancel, diagram))
+            proc.start()
+            self._live_map_procs.append(proc)
+
+            self.area_sweep = AreaSweep(
+                config, self.stage_manager, self.nir_manager,
+                progress=self._as_progress,
+                cancel_event=self._scan_cancel,
+                live_channel=live
+            )
+            data = None
+            try:
+                data = asyncio.run(self.area_sweep.begin_sweep())
+                self.data = data
+            finally:
+                live.close(data)
+            self._locate_area_peak(data)
+
             with self._scan_done.get_lock():
                 self._scan_done.value = 1
                 self.task_start = 0
                 self.lock_all(0)
 
-            p = Process(target=diagram.heat_map)
-            p.start()
-            p.join()
+            # No join: the window stays open while the GUI carries on
             self.area_sweep = None
             print("Done Scan")
 
@@ -7,6 +7,8 @@ from pathlib import Path
 import numpy as np
 
 from NIR.hal.nir_hal import LaserHAL, PowerUnit, PowerReading
+from NIR.Luna.luna_session import LunaSession, LunaNotSent
+from utils import io_trace
 
 
 PATH_TO_CONTROLLER = Path(__file__).resolve().parent
@@ -18,13 +20,16 @@ class LunaController(LaserHAL):
 
     Communication:
         Luna OVA 5000 Software
-        SendCmd.exe (TCP/IP or GPIB)
+        Persistent TCP session (LunaSession), falls back on
+        SendCmd.exe (TCP/IP or GPIB) when Luna can not be reached over it
     """
     def __init__(
         self,
         ip: str = '10.2.137.4',
         port: str = '1',
-        sendcmd_path: str = r"C:\Users\347\TEST\IDA\NIR\Luna\SendCmd.exe"
+        sendcmd_path: str = r"C:\Users\347\TEST\IDA\NIR\Luna\SendCmd.exe",
+        use_session: bool = True,
+        session_timeout_s: float = 5.0
     ):
         super().__init__()
         
@@ -32,6 +37,10 @@ class LunaController(LaserHAL):
         self.ip = ip
         self.port = port
         self.sendcmd = sendcmd_path
+        self.session = io_trace.wrap_session(
+            LunaSession(ip, int(port), timeout_s=session_timeout_s), f"luna:{ip}:{port}"
+        ) if use_session else None
+        self._session_used = False  # The session has worked at least once
 
         # Internal state 
         self.center_wavelength_nm = None
@@ -49,13 +58,56 @@ class LunaController(LaserHAL):
     # Internal SendCmd helpers
     # ==================================================================
 
+    # Timeouts and drops after a command went out are raised by the session,
+    # never re-sent through SendCmd (it may already have been executed)
     def _write(self, command: str) -> None:
+        if self.session is not None:
+            try:
+                self.session.write(command)
+                self._session_used = True
+                return
+            except LunaNotSent as e:
+                self._session_unavailable(e)
         subprocess.call([self.sendcmd, command, self.ip, self.port])
 
     def _query(self, command: str) -> str:
+        return self._exchange(command)[0]
+
+    def _exchange(self, command: str) -> Tuple[str, bool]:
+        """(response, True if the TCP session answered / False if SendCmd did)"""
+        if self.session is not None:
+            try:
+                reply = self.session.query(command)
+                self._session_used = True
+                return reply, True
+            except LunaNotSent as e:
+                self._session_unavailable(e)
         return subprocess.check_output(
             [self.sendcmd, command, self.ip, self.port]
-        ).decode().strip()
+        ).decode().strip(), False
+
+    def _query_lines(self, command: str) -> list:
+        """Data lines of a multi line response, without SendCmd's banner / status lines"""
+        raw, via_session = self._exchange(command)
+        if via_session:
+            return [l.strip('\x00 ') for l in raw.split('\r\n') if l.strip('\x00 ')]
+        return raw.split('\r\n')[2:-1]
+
+    def _session_unavailable(self, e: Exception) -> None:
+        """
+        No connection, the command goes through SendCmd.exe instead. A session
+        that never connected (remote TCP not enabled) is dropped for good, one
+        that worked before reconnects on the next command.
+        """
+        if self._session_used:
+            print(f"[LUNA] TCP session down ({e}), this command via SendCmd")
+            return
+        print(f"[LUNA] TCP session unavailable ({e}), falling back to SendCmd")
+        try:
+            self.session.close()
+        except Exception:
+            pass
+        self.session = None
 
     # ==================================================================
     # Connection management
@@ -77,8 +129,10 @@ class LunaController(LaserHAL):
 
     def disconnect(self) -> bool:
         """
-        Luna remote interface is stateless.
+        Luna remote interface is stateless, only the TCP session is closed.
         """
+        if self.session is not None:
+            self.session.close()
         self._is_connected = False
         return True
 
@@ -177,9 +231,8 @@ class LunaController(LaserHAL):
             time.sleep(0.05)
 
         # Parse list of scan values, take mean in Lin, then back to dB
-        raw = self._query("FETC:MEAS? 0")
-        raw = raw.split('\r\n')
-        values = [10**(float(v)/10) for v in raw[2:-1]]
+        raw = self._query_lines("FETC:MEAS? 0")
+        values = [10**(float(v)/10) for v in raw]
         mean_il = float(np.mean(values)) if values else None
         mean_il = float(10*np.log10(mean_il))
         return mean_il, -100.0
@@ -293,11 +346,19 @@ class LunaController(LaserHAL):
     # Data retrieval
     # ==================================================================
 
-    def retrieve_scan_data(self):
+    def retrieve_scan_data(self, columns=None, timeout_s: float = 60.0):
         """
         SYST:SAVS + file reload
         Chapter 8.4.3
 
+        Waits for the save to complete (*OPC? and a size stable file)
+        instead of a fixed delay, then loads only the requested columns.
+
+        Args:
+            columns: column indices and/or header names to load,
+                     None loads all of them
+            timeout_s: max time to wait for the file
+
         Returns:
             data[:,n]
             n:
@@ -315,17 +376,50 @@ class LunaController(LaserHAL):
         """
         fname = os.path.join(self.data_dir, "output.txt")
 
+        # Remove the last file so a stale one is never parsed
+        try:
+            os.remove(fname)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[LUNA] could not remove old data file: {e}")
+
         # Trigger the save
         self._write(f"SYST:SAVS {fname}")
-        
-        # Takes a while to retrieve the data, so wait
-        time.sleep(20)
-        data = np.loadtxt(fname, skiprows=9)
+        if not self._wait_for_file(fname, timeout_s):
+            raise TimeoutError(f"[LUNA] {fname} not written within {timeout_s} s")
 
         # Rearrange data to work wiht NIRManager
-        data_out = [data[:,i] for i in range(data.shape[1])]
-        print(data_out, len(data_out))
-        return data_out
+        data = load_ova_data(fname, columns)
+        return [data[:, i] for i in range(data.shape[1])]
+
+    def _wait_for_file(self, fname: str, timeout_s: float = 60.0,
+                       poll_s: float = 0.05, stable_polls: int = 2) -> bool:
+        """
+        Poll until the OVA reports completion and the file size stops changing
+        for stable_polls consecutive polls
+        """
+        t0 = time.time()
+        opc_done = False
+        last_size = -1
+        stable = 0
+        while time.time() - t0 < timeout_s:
+            if not opc_done:
+                try:
+                    opc_done = "1" in self._query("*OPC?")
+                except Exception:
+                    opc_done = True  # fall back on the file check only
+            if opc_done and os.path.exists(fname):
+                size = os.path.getsize(fname)
+                if size > 0 and size == last_size:
+                    stable += 1
+                    if stable >= stable_polls:
+                        return True
+                else:
+                    stable = 0
+                last_size = size
+            time.sleep(poll_s)
+        return False
 
     # ==================================================================
     # Optical sweep 
@@ -355,5 +449,38 @@ class LunaController(LaserHAL):
         self.execute_lambda_scan()
         return self.retrieve_scan_data()
 
+# ==================================================================
+# Data file parsing
+# ==================================================================
+
+OVA_HEADER_ROWS = 9  # 8 lines of metadata + column names
+
+
+def load_ova_data(fname, columns=None) -> np.ndarray:
+    """
+    Load an OVA SYST:SAVS text file into a (n_points, n_columns) array.
+
+    columns may mix indices and header names, e.g. [0, "Insertion Loss (dB)"].
+    Uses numpy's C tokenizer (numpy >= 1.23) and only converts the requested
+    columns, which is where most of the time goes on a 65k x 25 file.
+    """
+    usecols = None
+    if columns is not None:
+        names = None
+        usecols = []
+        for c in columns:
+            if isinstance(c, str):
+                if names is None:
+                    with open(fname, "r") as f:
+                        for _ in range(OVA_HEADER_ROWS - 1):
+                            f.readline()
+                        names = [n.strip() for n in f.readline().split("\t")]
+                usecols.append(names.index(c))
+            else:
+                usecols.append(int(c))
+    return np.loadtxt(fname, skiprows=OVA_HEADER_ROWS, usecols=usecols,
+                      dtype=np.float64, ndmin=2)
+
+
 from NIR.hal.nir_factory import register_driver
 register_driver("luna_controller", LunaController)
\ No newline at end of file
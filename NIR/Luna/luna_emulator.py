@@ -0,0 +1,147 @@
+import argparse
+import shutil
+import socketserver
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+"""
+Stand-in TCP server for the Luna OVA remote command set, for exercising
+LunaSession / LunaController without the instrument.
+
+    python -m NIR.Luna.luna_emulator --port 5001            # serve
+    python -m NIR.Luna.luna_emulator --port 5001 --bench    # serve + latency check
+
+Emulated: *IDN?, *OPC?, SYST:LASE, CONF:CWL, CONF:RANG, CONF:DUTL, SCAN,
+FETC:MEAS? 0 and SYST:SAVS (copies the repo's output.txt). Commands and
+responses are NUL terminated; set commands get no response.
+"""
+
+DEFAULT_DATA = Path(__file__).resolve().parents[2] / "output.txt"
+
+
+class LunaEmulatorState:
+    def __init__(self, data_file: Path = DEFAULT_DATA, scan_time_s: float = 0.2):
+        self.data_file = Path(data_file)
+        self.scan_time_s = scan_time_s
+        self.laser = 0
+        self.cwl = 1550.0
+        self.rang = 40.0
+        self.dutl = 2.5
+        self.busy_until = 0.0
+        self.lock = threading.Lock()
+        self._il = None
+
+    @property
+    def insertion_loss(self) -> np.ndarray:
+        if self._il is None:
+            self._il = np.loadtxt(self.data_file, skiprows=9, usecols=[2])
+        return self._il
+
+    def handle(self, cmd: str):
+        """Return the response text, or None for set commands"""
+        head, _, arg = cmd.strip().partition(" ")
+        head = head.upper()
+        with self.lock:
+            if head == "*IDN?":
+                return "Luna Technologies,OVA 5000,EMULATOR,1.0"
+            if head == "*OPC?":
+                return "1" if time.time() >= self.busy_until else "0"
+            if head == "SYST:LASE":
+                self.laser = int(float(arg))
+                return None
+            if head == "SYST:LASE?":
+                return str(self.laser)
+            if head == "CONF:CWL":
+                self.cwl = float(arg.split(",")[0])
+                return None
+            if head == "CONF:CWL?":
+                return f"{self.cwl:.3f}"
+            if head == "CONF:RANG":
+                self.rang = float(arg)
+                return None
+            if head == "CONF:RANG?":
+                return f"{self.rang:.3f}"
+            if head == "CONF:DUTL":
+                return None
+            if head == "CONF:DUTL?":
+                return f"{self.dutl:.3f}"
+            if head == "SCAN":
+                self.busy_until = time.time() + self.scan_time_s
+                return None
+            if head == "FETC:MEAS?":
+                return "\r\n".join(f"{v:.6f}" for v in self.insertion_loss)
+            if head == "SYST:SAVS":
+                threading.Thread(target=self._save, args=(arg.strip(),), daemon=True).start()
+                return None
+        return None
+
+    def _save(self, dest: str):
+        # Written with a short delay so the completion polling is exercised
+        time.sleep(0.05)
+        shutil.copyfile(self.data_file, dest)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        buf = b""
+        while True:
+            chunk = self.request.recv(65536)
+            if not chunk:
+                return
+            buf += chunk
+            while b"\x00" in buf:
+                raw, buf = buf.split(b"\x00", 1)
+                resp = self.server.state.handle(raw.decode("ascii", errors="replace"))
+                if resp is not None:
+                    self.request.sendall(resp.encode("ascii") + b"\x00")
+
+
+class LunaEmulator(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **state_kwargs):
+        super().__init__((host, port), _Handler)
+        self.state = LunaEmulatorState(**state_kwargs)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "LunaEmulator":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def _bench(port: int, n: int = 200):
+    from NIR.Luna.luna_session import LunaSession
+    with LunaSession("127.0.0.1", port) as s:
+        s.query("*IDN?")
+        t0 = time.perf_counter()
+        for _ in range(n):
+            s.query("CONF:CWL?")
+        dt = (time.perf_counter() - t0) / n
+    print(f"[Luna emulator] {n} queries over one session: {dt * 1e3:.3f} ms/command")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Luna OVA command emulator")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--bench", action="store_true")
+    a = parser.parse_args()
+
+    server = LunaEmulator(a.host, a.port).start()
+    print(f"[Luna emulator] listening on {a.host}:{server.port}")
+    if a.bench:
+        _bench(server.port)
+        server.shutdown()
+    else:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.shutdown()
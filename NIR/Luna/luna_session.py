@@ -0,0 +1,158 @@
+import socket
+import threading
+import time
+from typing import Optional
+
+"""
+Persistent TCP command channel to the Luna OVA remote interface.
+
+SendCmd.exe opens a connection, sends one command and exits, so every
+command pays process creation plus a TCP handshake. This keeps a single
+socket open with framed request / response handling:
+    - every command is terminated with write_termination
+    - every response ends with read_termination
+    - timeouts on connect and on each response
+    - a socket found dropped before sending is reopened; once a command
+      has gone out it is never sent again (a timeout or a drop after
+      sending raises, the next command starts on a new socket)
+"""
+
+
+class LunaNotSent(ConnectionError):
+    """No connection to Luna, the command did not go out"""
+
+
+class LunaSession:
+    def __init__(
+        self,
+        ip: str = '10.2.137.4',
+        port: int = 1,
+        timeout_s: float = 5.0,
+        connect_timeout_s: float = 2.0,
+        write_termination: str = "\x00",
+        read_termination: str = "\x00",
+        encoding: str = "ascii"
+    ):
+        self.ip = ip
+        self.port = int(port)
+        self.timeout_s = timeout_s
+        self.connect_timeout_s = connect_timeout_s
+        self.write_termination = write_termination.encode(encoding)
+        self.read_termination = read_termination.encode(encoding)
+        self.encoding = encoding
+
+        self._sock: Optional[socket.socket] = None
+        self._buf = b""
+        self._lock = threading.Lock()
+
+    # ==================================================================
+    # Connection
+    # ==================================================================
+
+    @property
+    def is_open(self) -> bool:
+        return self._sock is not None
+
+    def open(self) -> None:
+        self.close()
+        sock = socket.create_connection((self.ip, self.port), timeout=self.connect_timeout_s)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.timeout_s)
+        self._sock = sock
+        self._buf = b""
+
+    def close(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._buf = b""
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # ==================================================================
+    # Framing
+    # ==================================================================
+
+    def _drain(self) -> None:
+        """Drop stale responses (e.g. to earlier writes) before a query"""
+        self._buf = b""
+        self._sock.setblocking(False)
+        try:
+            while True:
+                chunk = self._sock.recv(65536)
+                if not chunk:
+                    raise ConnectionError("Luna closed the connection")
+        except (BlockingIOError, InterruptedError):
+            pass
+        finally:
+            self._sock.settimeout(self.timeout_s)
+
+    def _read_response(self, timeout_s: float) -> str:
+        deadline = time.monotonic() + timeout_s
+        while True:
+            idx = self._buf.find(self.read_termination)
+            if idx >= 0:
+                msg, self._buf = self._buf[:idx], self._buf[idx + len(self.read_termination):]
+                return msg.decode(self.encoding, errors="replace").strip()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Luna response timed out")
+            self._sock.settimeout(remaining)
+            chunk = self._sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Luna closed the connection")
+            self._buf += chunk
+
+    def _send(self, command: str) -> None:
+        self._sock.sendall(command.encode(self.encoding) + self.write_termination)
+
+    # ==================================================================
+    # Public API
+    # ==================================================================
+
+    def write(self, command: str) -> None:
+        with self._lock:
+            self._ready()
+            self._sent(lambda: self._send(command))
+
+    def query(self, command: str, timeout_s: Optional[float] = None) -> str:
+        timeout_s = self.timeout_s if timeout_s is None else timeout_s
+
+        def _do():
+            self._send(command)
+            return self._read_response(timeout_s)
+
+        with self._lock:
+            self._ready()
+            return self._sent(_do)
+
+    def _ready(self) -> None:
+        """Open, drained socket; reopened if the peer dropped it while idle (nothing sent yet)"""
+        try:
+            if self._sock is None:
+                self.open()
+            try:
+                self._drain()
+            except (ConnectionError, OSError):
+                self.open()
+        except OSError as e:
+            self.close()
+            raise LunaNotSent(f"Luna {self.ip}:{self.port} not reachable: {e}") from e
+
+    def _sent(self, fn):
+        """Run fn, which sends; any transport error after that is raised, never retried"""
+        try:
+            return fn()
+        except OSError:
+            # The command may have been executed, and a late reply would put
+            # the stream out of step: start clean on the next command
+            self.close()
+            raise
@@ -0,0 +1,84 @@
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from NIR.Luna import luna_controller
+from NIR.Luna.luna_controller import LunaController
+
+"""
+LunaController over the emulator: the server is killed after one query
+over the TCP session, the next multi line query then goes through
+SendCmd and has to be parsed as SendCmd output (banner, data, status).
+SendCmd.exe itself is replaced by a stand-in, no instrument needed:
+
+    python -m NIR.Luna.test_luna_session
+"""
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+SENDCMD_OUTPUT = b"SendCmd v1.0\r\nConnected to 127.0.0.1\r\n-3.000000\r\n-3.000000\r\nCommand OK"
+
+
+class _SendCmd:
+    """subprocess stand-in for SendCmd.exe"""
+    def __init__(self):
+        self.commands = []
+
+    def check_output(self, argv, *args, **kwargs):
+        self.commands.append(argv[1])
+        return SENDCMD_OUTPUT
+
+    def call(self, argv, *args, **kwargs):
+        self.commands.append(argv[1])
+        return 0
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_emulator(port: int) -> subprocess.Popen:
+    proc = subprocess.Popen([sys.executable, "-m", "NIR.Luna.luna_emulator", "--port", str(port)],
+                            cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("Luna emulator did not start")
+
+
+def test_sendcmd_fallback_after_server_killed():
+    port = _free_port()
+    proc = _start_emulator(port)
+    sendcmd = _SendCmd()
+    real_subprocess = luna_controller.subprocess
+    try:
+        luna = LunaController(ip="127.0.0.1", port=str(port), sendcmd_path="SendCmd.exe")
+        assert "EMULATOR" in luna._query("*IDN?")
+        assert sendcmd.commands == []
+
+        proc.kill()
+        proc.wait(5)
+
+        luna_controller.subprocess = sendcmd
+        lines = luna._query_lines("FETC:MEAS? 0")
+        assert sendcmd.commands == ["FETC:MEAS? 0"]
+        assert lines == ["-3.000000", "-3.000000"]
+        # A session that worked before is kept, it reconnects on the next command
+        assert luna.session is not None
+    finally:
+        luna_controller.subprocess = real_subprocess
+        if proc.poll() is None:
+            proc.kill()
+
+
+if __name__ == "__main__":
+    test_sendcmd_fallback_after_server_killed()
+    print("ok")
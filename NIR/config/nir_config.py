@@ -16,6 +16,8 @@ class NIRConfiguration:
     driver_types: str = '8164B_NIR'
     safety_password: str = "1234"
     timeout: int = 3000  # long for lambda sweep
+    sweep_engine: str = "dll"  # "dll" (hp816x, Windows) or "scpi" (VISA logging mode)
+    visa_library: str = ""     # pyvisa backend, e.g. "@py", "@sim"
     
     # Default settings
     initial_wavelength_nm: float = 1550.0
@@ -26,7 +28,18 @@ class NIRConfiguration:
     stop_nm = 1565
     step_nm = 0.1 
     laser_power_dbm = -5.0
-    
+
+    # Adaptive sweep settings (coarse pass -> fine windows around features)
+    adaptive_coarse_factor: int = 10        # coarse step = factor * fine step
+    adaptive_prominence_db: float = 3.0     # min peak/dip prominence to refine
+    adaptive_window_nm: float = 0.5         # full width of each fine window
+
+    # Reference spectrum (.npz or Spectrum CSV) sweeps are normalised against
+    reference_file: str = ""
+
+    # Detector block of sweep results, "float32" halves sweep memory
+    sweep_dtype: str = "float64"
+
     @property
     def visa_address(self) -> str:
         """Get VISA address"""
@@ -40,12 +53,19 @@ class NIRConfiguration:
             'driver_types': self.driver_types,
             'safety_password': self.safety_password,
             'timeout': self.timeout,
+            'sweep_engine': self.sweep_engine,
+            'visa_library': self.visa_library,
             'initial_wavelength_nm': self.initial_wavelength_nm,
             'initial_power_dbm': self.initial_power_dbm,
             'start_nm': self.start_nm,
             'stop_nm': self.stop_nm,
             'step_nm': self.step_nm,
             'laser_power_dbm': self.laser_power_dbm,
+            'adaptive_coarse_factor': self.adaptive_coarse_factor,
+            'adaptive_prominence_db': self.adaptive_prominence_db,
+            'adaptive_window_nm': self.adaptive_window_nm,
+            'reference_file': self.reference_file,
+            'sweep_dtype': self.sweep_dtype,
         }
     
     @classmethod
@@ -1,5 +1,3 @@
-import time
-import ctypes
 from ctypes import (c_int32,
                     c_uint16,
                     c_uint32,
@@ -16,6 +14,9 @@ import logging
 from tqdm import tqdm
 
 from NIR.hal.nir_hal import LaserHAL
+from NIR.utils.shadow_state import InstrumentShadow
+from NIR.utils.session_workers import SessionWorkers
+from utils import io_trace
 
 """
 Multi-Fram NIR Controller module for multiple Laser(s)
@@ -65,7 +66,7 @@ class MF_NIR_controller(LaserHAL):
     
     def __init__(self, visa_addresses: List[str]):
         # Load DLL
-        self.lib = ctypes.WinDLL("C:\\Program Files\\IVI Foundation\\VISA\\Win64\\Bin\\hp816x_64.dll")
+        self.lib = io_trace.load_library("C:\\Program Files\\IVI Foundation\\VISA\\Win64\\Bin\\hp816x_64.dll")
         self.visa_addresses = visa_addresses
         self.sessions = []
         self._is_connected = False
@@ -91,6 +92,14 @@ class MF_NIR_controller(LaserHAL):
         self.num_points = None
         self.laser_power = None
 
+        # Last known settings, used to skip writes that change nothing
+        self.shadow = InstrumentShadow({"wavelength": 1e-6, "power": 1e-3,
+                                        "range": 1e-3, "ref": 1e-3})
+
+        # One I/O thread per mainframe session, detector calls on
+        # different frames overlap
+        self.workers = SessionWorkers("mf-nir")
+
     def _setup_function_prototypes(self):
         """Define all DLL function signatures"""
         
@@ -259,6 +268,7 @@ class MF_NIR_controller(LaserHAL):
 
     def connect(self) -> bool:
         """Connect to instrument and auto-enumerate all modules"""
+        self.shadow.invalidate()
         try:
             # Register all mainframes
             sessions = []
@@ -458,7 +468,7 @@ class MF_NIR_controller(LaserHAL):
             
             if detector_info is None:
                 logging.warning(f"Detector slot {slot} not found in enumeration, assuming single channel")
-                self.detector_channels.append((slot, 0))
+                self.detector_channels.append((slot, 0, self.sessions[0]))
             else:
                 # Add all channels for this detector
                 for ch in range(detector_info['channels']):
@@ -478,6 +488,8 @@ class MF_NIR_controller(LaserHAL):
 
     def disconnect(self) -> bool:
         """Disconnect from instrument"""
+        self.shadow.invalidate()
+        self.workers.shutdown()
         try:
             for session in self.sessions:
                 if session:
@@ -500,31 +512,35 @@ class MF_NIR_controller(LaserHAL):
             return False
         
         try:
-            for 
             # Set laser power unit to dBm
-            power = c_double()
-            unit = c_int32()
-            self.lib.hp816x_get_TLS_parameters_Q(
-                self.session,
-                c_int32(self.laser_slot),
-                c_int32(0),
-                byref(unit),
-                byref(power)
-            )
-            
-            self._check_error(
-                self.lib.hp816x_set_TLS_parameters(
+            if not self.shadow.skip((("laser_unit",), 0)):
+                power = c_double()
+                unit = c_int32()
+                self.lib.hp816x_get_TLS_parameters_Q(
                     self.session,
                     c_int32(self.laser_slot),
                     c_int32(0),
-                    c_int32(0),  # unit: 0=dBm
-                    power
-                ),
-                "Set laser unit to dBm"
-            )
+                    byref(unit),
+                    byref(power)
+                )
+                
+                self._check_error(
+                    self.lib.hp816x_set_TLS_parameters(
+                        self.session,
+                        c_int32(self.laser_slot),
+                        c_int32(0),
+                        c_int32(0),  # unit: 0=dBm
+                        power
+                    ),
+                    "Set laser unit to dBm"
+                )
+                self.shadow.update(("laser_unit",), 0)
             
             # Set detector units to dBm for all active detector channels
             for slot, ch, session in self.detector_channels:
+                key = ("unit", session, slot, ch)
+                if self.shadow.skip((key, 0)):
+                    continue
                 self._check_error(
                     self.lib.hp816x_set_PWM_powerUnit(
                         session,
@@ -534,15 +550,19 @@ class MF_NIR_controller(LaserHAL):
                     ),
                     f"Set detector slot {slot} ch {ch} unit to dBm"
                 )
+                self.shadow.update(key, 0)
             
             return True
         except Exception as e:
+            self.shadow.invalidate()
             logging.error(f"configure_units error: {e}")
             return False
 
     def set_wavelength(self, nm: float) -> bool:
         """Set wavelength in nm"""
         try:
+            if self.shadow.skip((("wavelength",), float(nm))):
+                return True
             self._check_error(
                 self.lib.hp816x_set_TLS_wavelength(
                     self.session,
@@ -552,8 +572,10 @@ class MF_NIR_controller(LaserHAL):
                 ),
                 "Set wavelength"
             )
+            self.shadow.update(("wavelength",), float(nm))
             return True
         except Exception as e:
+            self.shadow.invalidate()
             logging.error(f"set_wavelength error: {e}")
             return False
 
@@ -570,6 +592,7 @@ class MF_NIR_controller(LaserHAL):
                 ),
                 "Get wavelength"
             )
+            self.shadow.update(("wavelength",), wavelength_m.value * 1e9, written=False)
             return wavelength_m.value * 1e9
         except Exception as e:
             logging.error(f"get_wavelength error: {e}")
@@ -578,6 +601,8 @@ class MF_NIR_controller(LaserHAL):
     def set_power(self, dbm: float) -> bool:
         """Set power in dBm"""
         try:
+            if self.shadow.skip((("power",), float(dbm)), (("laser_unit",), 0)):
+                return True
             self._check_error(
                 self.lib.hp816x_set_TLS_parameters(
                     self.session,
@@ -588,8 +613,11 @@ class MF_NIR_controller(LaserHAL):
                 ),
                 "Set power"
             )
+            self.shadow.update(("power",), float(dbm))
+            self.shadow.update(("laser_unit",), 0, written=False)
             return True
         except Exception as e:
+            self.shadow.invalidate()
             logging.error(f"set_power error: {e}")
             return False
 
@@ -616,6 +644,8 @@ class MF_NIR_controller(LaserHAL):
     def enable_output(self, on: bool) -> bool:
         """Turn laser on/off"""
         try:
+            if self.shadow.skip((("output",), bool(on))):
+                return True
             self._check_error(
                 self.lib.hp816x_set_TLS_state(
                     self.session,
@@ -625,8 +655,10 @@ class MF_NIR_controller(LaserHAL):
                 ),
                 "Set laser output state"
             )
+            self.shadow.update(("output",), bool(on))
             return True
         except Exception as e:
+            self.shadow.invalidate()
             logging.error(f"enable_output error: {e}")
             return False
 
@@ -643,6 +675,7 @@ class MF_NIR_controller(LaserHAL):
                 ),
                 "Get laser output state"
             )
+            self.shadow.update(("output",), bool(state.value), written=False)
             return bool(state.value)
         except Exception as e:
             logging.error(f"get_output_state error: {e}")
@@ -652,21 +685,40 @@ class MF_NIR_controller(LaserHAL):
     # Detector functions (work with all discovered channels)
     ######################################################################
 
+    def _targets(self, slot: Optional[int] = None,
+                 channel: Optional[int] = None) -> List[Tuple[int, int, int]]:
+        """(slot, channel, session) for one channel, or all active detector channels"""
+        if slot is None or channel is None:
+            return list(self.detector_channels)
+        for s, c, session in self.detector_channels:
+            if s == slot and c == channel:
+                return [(s, c, session)]
+        raise ValueError(f"Detector slot {slot} ch {channel} not found")
+
+    def _per_session(self, targets: List[Tuple[int, int, int]], fn) -> List:
+        """fn((slot, ch, session)) for each target, sessions in parallel, results in order"""
+        return self.workers.run_grouped(targets, key=lambda t: t[2], fn=fn)
+
     def set_detector_units(self, units: int = 0) -> bool:
         """Set detector units for all channels (0=dBm, 1=W)"""
         try:
-            for slot, ch in self.detector_channels:
+            for slot, ch, session in self.detector_channels:
+                key = ("unit", session, slot, ch)
+                if self.shadow.skip((key, units)):
+                    continue
                 self._check_error(
                     self.lib.hp816x_set_PWM_powerUnit(
-                        self.session,
+                        session,
                         c_int32(slot),
                         c_int32(ch),
                         c_int32(units)
                     ),
                     f"Set detector slot {slot} ch {ch} unit"
                 )
+                self.shadow.update(key, units)
             return True
         except Exception as e:
+            self.shadow.invalidate("unit")
             logging.error(f"set_detector_units error: {e}")
             return False
 
@@ -674,11 +726,11 @@ class MF_NIR_controller(LaserHAL):
         """Get detector units for all channels"""
         try:
             units = []
-            for slot, ch in self.detector_channels:
+            for slot, ch, session in self.detector_channels:
                 unit = c_int32()
                 self._check_error(
                     self.lib.hp816x_get_PWM_powerUnit(
-                        self.session,
+                        session,
                         c_int32(slot),
                         c_int32(ch),
                         byref(unit)
@@ -693,21 +745,22 @@ class MF_NIR_controller(LaserHAL):
 
     def read_power(self) -> Optional[List[float]]:
         """Read power from all detector channels, returns list matching detector_channels order"""
+        def _read(target):
+            slot, ch, session = target
+            power = c_double()
+            self._check_error(
+                self.lib.hp816x_readValue(
+                    session,
+                    c_int32(slot),
+                    c_int32(ch),
+                    byref(power)
+                ),
+                f"Read power slot {slot} ch {ch}"
+            )
+            return power.value
+
         try:
-            powers = []
-            for slot, ch in self.detector_channels:
-                power = c_double()
-                self._check_error(
-                    self.lib.hp816x_readValue(
-                        self.session,
-                        c_int32(slot),
-                        c_int32(ch),
-                        byref(power)
-                    ),
-                    f"Read power slot {slot} ch {ch}"
-                )
-                powers.append(power.value)
-            return powers
+            return self._per_session(self.detector_channels, _read)
         except Exception as e:
             logging.error(f"read_power error: {e}")
             return None
@@ -718,25 +771,30 @@ class MF_NIR_controller(LaserHAL):
         Enable/disable autorange for detectors.
         If slot/channel not specified, applies to all detector channels.
         """
+        def _apply(target):
+            s, c, session = target
+            key = ("autorange", session, s, c)
+            if self.shadow.skip((key, bool(enable))):
+                return
+            self._check_error(
+                self.lib.hp816x_set_PWM_powerRange(
+                    session,
+                    c_int32(s),
+                    c_int32(c),
+                    c_uint16(1 if enable else 0),
+                    c_double(0.0)
+                ),
+                f"Set autorange slot {s} ch {c}"
+            )
+            self.shadow.update(key, bool(enable))
+            self.shadow.invalidate("range", session, s, c)
+
         try:
-            if slot is not None and channel is not None:
-                targets = [(slot, channel)]
-            else:
-                targets = self.detector_channels
-            
-            for s, c in targets:
-                self._check_error(
-                    self.lib.hp816x_set_PWM_powerRange(
-                        self.session,
-                        c_int32(s),
-                        c_int32(c),
-                        c_uint16(1 if enable else 0),
-                        c_double(0.0)
-                    ),
-                    f"Set autorange slot {s} ch {c}"
-                )
+            self._per_session(self._targets(slot, channel), _apply)
             return True
         except Exception as e:
+            self.shadow.invalidate("autorange")
+            self.shadow.invalidate("range")
             logging.error(f"enable_autorange error: {e}")
             return False
 
@@ -746,25 +804,30 @@ class MF_NIR_controller(LaserHAL):
         Set manual power range in dBm.
         If slot/channel not specified, applies to all detector channels.
         """
+        def _apply(target):
+            s, c, session = target
+            auto_key, range_key = ("autorange", session, s, c), ("range", session, s, c)
+            if self.shadow.skip((auto_key, False), (range_key, float(range_dbm))):
+                return
+            self._check_error(
+                self.lib.hp816x_set_PWM_powerRange(
+                    session,
+                    c_int32(s),
+                    c_int32(c),
+                    c_uint16(0),  # MANUAL
+                    c_double(range_dbm)
+                ),
+                f"Set power range slot {s} ch {c}"
+            )
+            self.shadow.update(auto_key, False)
+            self.shadow.update(range_key, float(range_dbm))
+
         try:
-            if slot is not None and channel is not None:
-                targets = [(slot, channel)]
-            else:
-                targets = self.detector_channels
-            
-            for s, c in targets:
-                self._check_error(
-                    self.lib.hp816x_set_PWM_powerRange(
-                        self.session,
-                        c_int32(s),
-                        c_int32(c),
-                        c_uint16(0),  # MANUAL
-                        c_double(range_dbm)
-                    ),
-                    f"Set power range slot {s} ch {c}"
-                )
+            self._per_session(self._targets(slot, channel), _apply)
             return True
         except Exception as e:
+            self.shadow.invalidate("autorange")
+            self.shadow.invalidate("range")
             logging.error(f"set_power_range error: {e}")
             return False
 
@@ -777,12 +840,12 @@ class MF_NIR_controller(LaserHAL):
         """Get power range for all channels, returns list of (mode, range_dbm)"""
         try:
             ranges = []
-            for slot, ch in self.detector_channels:
+            for slot, ch, session in self.detector_channels:
                 mode = c_uint16()
                 range_val = c_double()
                 self._check_error(
                     self.lib.hp816x_get_PWM_powerRange_Q(
-                        self.session,
+                        session,
                         c_int32(slot),
                         c_int32(ch),
                         byref(mode),
@@ -802,40 +865,43 @@ class MF_NIR_controller(LaserHAL):
         Set power reference for relative measurements.
         If slot/channel not specified, applies to all detector channels.
         """
-        try:
-            if slot is not None and channel is not None:
-                targets = [(slot, channel)]
-            else:
-                targets = self.detector_channels
+        def _apply(target):
+            s, c, session = target
+            key = ("ref", session, s, c)
+            if self.shadow.skip((key, float(ref_dbm))):
+                return
+            # Set to RELATIVE mode with INTERNAL reference
+            self._check_error(
+                self.lib.hp816x_set_PWM_referenceSource(
+                    session,
+                    c_int32(s),
+                    c_int32(c),
+                    c_int32(1),  # RELATIVE
+                    c_int32(0),  # INTERNAL
+                    c_int32(0),
+                    c_int32(0)
+                ),
+                f"Set reference mode slot {s} ch {c}"
+            )
             
-            for s, c in targets:
-                # Set to RELATIVE mode with INTERNAL reference
-                self._check_error(
-                    self.lib.hp816x_set_PWM_referenceSource(
-                        self.session,
-                        c_int32(s),
-                        c_int32(c),
-                        c_int32(1),  # RELATIVE
-                        c_int32(0),  # INTERNAL
-                        c_int32(0),
-                        c_int32(0)
-                    ),
-                    f"Set reference mode slot {s} ch {c}"
-                )
-                
-                # Set reference value
-                self._check_error(
-                    self.lib.hp816x_set_PWM_referenceValue(
-                        self.session,
-                        c_int32(s),
-                        c_int32(c),
-                        c_double(ref_dbm),
-                        c_double(0.0)
-                    ),
-                    f"Set reference value slot {s} ch {c}"
-                )
+            # Set reference value
+            self._check_error(
+                self.lib.hp816x_set_PWM_referenceValue(
+                    session,
+                    c_int32(s),
+                    c_int32(c),
+                    c_double(ref_dbm),
+                    c_double(0.0)
+                ),
+                f"Set reference value slot {s} ch {c}"
+            )
+            self.shadow.update(key, float(ref_dbm))
+
+        try:
+            self._per_session(self._targets(slot, channel), _apply)
             return True
         except Exception as e:
+            self.shadow.invalidate("ref")
             logging.error(f"set_power_reference error: {e}")
             return False
 
@@ -843,12 +909,12 @@ class MF_NIR_controller(LaserHAL):
         """Get power reference value for all channels"""
         try:
             refs = []
-            for slot, ch in self.detector_channels:
+            for slot, ch, session in self.detector_channels:
                 ref_val = c_double()
                 wl_offset = c_double()
                 self._check_error(
                     self.lib.hp816x_get_PWM_referenceValue_Q(
-                        self.session,
+                        session,
                         c_int32(slot),
                         c_int32(ch),
                         byref(ref_val),
@@ -902,6 +968,9 @@ class MF_NIR_controller(LaserHAL):
         """
         if not self.session:
             raise RuntimeError("Not connected to instrument")
+
+        # The lambda scan reprograms TLS and detectors behind our back
+        self.shadow.invalidate()
         
         # Convert step to pm
         step_pm = float(step_nm) * 1000.0
@@ -1102,6 +1171,7 @@ class MF_NIR_controller(LaserHAL):
     def sweep_cancel(self):
         """Cancel ongoing sweep"""
         self._cancel = True
+        self.shadow.invalidate()
 
     ######################################################################
     #  HAL Required Methods
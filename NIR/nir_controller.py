@@ -1,10 +1,19 @@
 import time
 import struct
+import logging
+import threading
 import numpy as np
+from math import gcd
 import pyvisa
+from contextlib import contextmanager
 from typing import Optional, Tuple, List
 
 from NIR.hal.nir_hal import LaserHAL
+from NIR.utils.shadow_state import InstrumentShadow
+from NIR.utils.session_workers import SessionWorkers
+from NIR.utils.topology_cache import identify, topology_cache
+from NIR.utils.spectrum_result import SpectrumResult
+from utils import io_trace
 
 """
 Nir implementation for optical sweeps. Functionality for laser, detector configuration and methods
@@ -20,7 +29,9 @@ class NIR8164(LaserHAL):
     def __init__(self,
                  laser_slot: str = 'GPIB0::20::INSTR',
                  detector_slots: list = [],
-                 safety_password: str = "1234", timeout_ms: int = 30000):
+                 safety_password: str = "1234", timeout_ms: int = 30000,
+                 sweep_engine: str = "dll", visa_library: str = "",
+                 sweep_dtype: str = "float64"):
         """
         Controller instance for single / mf 816x machines
         
@@ -35,9 +46,20 @@ class NIR8164(LaserHAL):
         :type safety_password: str
         :param timeout_ms: visa timeout
         :type timeout_ms: int
+        :param sweep_engine: "dll" (hp816x_64.dll, Windows) or
+                             "scpi" (logging mode over VISA)
+        :type sweep_engine: str
+        :param visa_library: pyvisa backend, e.g. "@py" or "@sim",
+                             empty for the system VISA
+        :type visa_library: str
+        :param sweep_dtype: "float64" or "float32" detector block of sweep results
+        :type sweep_dtype: str
         """
 
         self.timeout_ms = timeout_ms
+        self.sweep_engine = sweep_engine
+        self.visa_library = visa_library
+        self.sweep_dtype = sweep_dtype
 
         # Connection
         self.rm: Optional[pyvisa.ResourceManager] = None
@@ -46,6 +68,7 @@ class NIR8164(LaserHAL):
         self.detector_slots = detector_slots
         self.laser_slot = laser_slot
         self.slot_info = []
+        self.pwm_map = None  # [(PWMIndex, MF, Slot, Head), ...] from the last enumeration
         self._is_connected = False
         self.is_mf = True if (len(detector_slots) > 0 and isinstance(detector_slots[0], str)) else False
 
@@ -56,12 +79,49 @@ class NIR8164(LaserHAL):
         self.num_points = None
         self.laser_power = None
         self.sweep_module = False
+        self.last_sweep_stats = None
+
+        # Last known settings, used to skip writes that change nothing
+        self.shadow = InstrumentShadow({"wavelength": 1e-6, "power": 1e-3,
+                                        "range": 1e-3, "ref": 1e-3})
+
+        # Pending writes per instrument while inside batch(), None otherwise
+        # key -1 is the laser frame, >= 0 indexes detector_insts.
+        # Thread local so per-frame workers batch independently
+        self._batch_local = threading.local()
+        self.batch_max_chars = 1000
+
+        # One I/O thread per mainframe session (key = mf index)
+        self.workers = SessionWorkers("nir8164")
+
+        # Device type of the next sweep, autorange results are cached per type
+        self.device_type = None
+
+        # Stepped burst kept configured between prepare_burst / release_burst
+        self._burst: Optional[dict] = None
+
+    @property
+    def _batch(self) -> Optional[dict]:
+        return getattr(self._batch_local, "pending", None)
+
+    @_batch.setter
+    def _batch(self, value: Optional[dict]) -> None:
+        self._batch_local.pending = value
+
+    @property
+    def _batch_sync(self) -> bool:
+        return getattr(self._batch_local, "sync", False)
+
+    @_batch_sync.setter
+    def _batch_sync(self, value: bool) -> None:
+        self._batch_local.sync = value
 
     def connect(self) -> bool:
+        self.shadow.invalidate()
         try:
             if not self.is_mf:
                 # Connect as usual
-                self.rm = pyvisa.ResourceManager()
+                self.rm = self._resource_manager()
                 self.laser_inst = self.rm.open_resource(
                     self.laser_slot,
                     timeout=self.timeout_ms,
@@ -81,7 +141,7 @@ class NIR8164(LaserHAL):
                 return True
             else:
                 # Now, open a ressource for each detector
-                self.rm = pyvisa.ResourceManager()
+                self.rm = self._resource_manager()
                 self.laser_inst = self.rm.open_resource(
                     self.laser_slot,
                     timeout=self.timeout_ms,
@@ -112,6 +172,8 @@ class NIR8164(LaserHAL):
             raise ConnectionError(f"{e}")
 
     def disconnect(self) -> bool:
+        self.release_burst()
+        self.shadow.invalidate()
         try:
             self.cleanup_scan()
         except Exception:
@@ -123,6 +185,7 @@ class NIR8164(LaserHAL):
                 for i in self.detector_insts:
                     i.close()
         finally:
+            self.workers.shutdown()
             self.laser_inst = None
             self.detector_insts = []
         if self.rm:
@@ -132,25 +195,135 @@ class NIR8164(LaserHAL):
                 self.rm = None
                 return True
 
+    def _resource_manager(self) -> pyvisa.ResourceManager:
+        return io_trace.resource_manager(self.visa_library)
+
+    def _make_sweep_module(self):
+        """Lambda scan engine selected by sweep_engine"""
+        if self.sweep_engine == "scpi":
+            from NIR.scpi_sweep import SCPILambdaScan
+            return SCPILambdaScan(
+                self.laser_slot,
+                self.detector_slots,
+                visa_library=self.visa_library,
+                timeout_ms=self.timeout_ms
+            )
+        from NIR.sweep import HP816xLambdaScan
+        return HP816xLambdaScan(
+            self.laser_slot,
+            self.detector_slots
+        )
+
+    def _inst(self, key: int):
+        return self.laser_inst if key < 0 else self.detector_insts[key]
+
     def write(self, scpi: str) -> None:
+        if self._batch is not None:
+            self._batch.setdefault(-1, []).append(scpi)
+            return
         self.laser_inst.write(scpi)
 
     def write_detector(self, scpi: str, idx: int) -> None:
+        if self._batch is not None:
+            self._batch.setdefault(idx, []).append(scpi)
+            return
         self.detector_insts[idx].write(scpi)
 
     def query(self, scpi: str, sleep_s: float = 0.02, retries: int = 1) -> str:
+        return self._query_inst(-1, scpi, retries)
+
+    def query_detector(self, scpi: str, idx: int) -> str:
+        return self._query_inst(idx, scpi, 1)
+
+    def _query_inst(self, key: int, scpi: str, retries: int = 1) -> str:
+        # Queued writes must reach the instrument before we ask about them
+        self._flush_pending(key)
+        inst = self._inst(key)
         for attempt in range(retries + 1):
-            resp = self.laser_inst.query(scpi).strip()
+            resp = inst.query(scpi).strip()
             if resp or attempt == retries:
                 return resp
-            time.sleep(0.03)
-    
-    def query_detector(self, scpi: str, idx: int) -> str:
-        for attempt in range(2):
-            resp = self.detector_insts[idx].query(scpi).strip()
-            if resp or attempt == 1:
-                return resp
-            time.sleep(0.03)
+            # Empty answer while the frame is busy: wait for it rather
+            # than for a fixed delay
+            inst.query("*OPC?")
+
+    ######################################################################
+    # Command batching
+    ######################################################################
+
+    @contextmanager
+    def batch(self, sync: bool = True):
+        """
+        Collect writes and send them per instrument as one transaction:
+
+            with nir.batch():
+                nir.set_power_range(-10, slot=1)
+                nir.set_power_reference(-80, slot=1)
+
+        Commands are joined with ";:" (root level, so each keeps its full
+        header path). With sync, every transaction ends in *OPC?, which
+        returns once the frame has executed all of it; this replaces the
+        fixed settling sleeps. Queries inside the block flush first.
+        Nested blocks join the outermost one.
+        """
+        if self._batch is not None:
+            self._batch_sync = self._batch_sync or sync
+            yield self
+            return
+        self._batch = {}
+        self._batch_sync = sync
+        try:
+            yield self
+        except BaseException:
+            # Drop what was not sent; the shadow already assumes it was
+            self._batch = None
+            self.shadow.invalidate()
+            raise
+        try:
+            self._flush_pending()
+        finally:
+            self._batch = None
+
+    def _flush_pending(self, key: Optional[int] = None) -> None:
+        """Send queued writes (of one instrument, or all)"""
+        if not self._batch:
+            return
+        keys = [key] if key is not None else list(self._batch)
+        jobs = [(k, self._batch.pop(k)) for k in keys if self._batch.get(k)]
+        sync = self._batch_sync
+
+        def _send(job):
+            k, cmds = job
+            for msg in self._join_commands(cmds):
+                if sync:
+                    self._inst(k).query(msg + ";*OPC?")
+                else:
+                    self._inst(k).write(msg)
+
+        try:
+            # Frames execute their transactions concurrently
+            self.workers.run_grouped(jobs, key=lambda j: j[0] + 1, fn=_send)
+        except Exception:
+            self.shadow.invalidate()
+            raise
+
+    def _join_commands(self, cmds: List[str]) -> List[str]:
+        """Concatenate commands into messages of at most batch_max_chars"""
+        msgs, cur = [], ""
+        for c in cmds:
+            c = c.strip()
+            if not cur:
+                cur = c
+                continue
+            sep = ";" if c.startswith((":", "*")) else ";:"
+            if len(cur) + len(sep) + len(c) > self.batch_max_chars:
+                msgs.append(cur)
+                cur = c
+            else:
+                cur += sep + c
+        if cur:
+            msgs.append(cur)
+        return msgs
 
     def get_mainframe_slot_info(self):
         """
@@ -159,13 +332,25 @@ class NIR8164(LaserHAL):
         [(MF,slot,head), ...]        
         
         Where SCPI calls will use Slot, Head
+
+        The topology is cached per set of frame identities (*IDN? / *OPT?)
+        and sweep engine, only a changed setup opens a session to enumerate again.
         """
+        frames = None
+        try:
+            insts = [self.laser_inst] + (list(self.detector_insts) if self.is_mf else [])
+            addrs = [self.laser_slot] + (list(self.detector_slots) if self.is_mf else [])
+            frames = [identify(a, i) for a, i in zip(addrs, insts)]
+            mapping = topology_cache.get(frames, self.sweep_engine)
+            if mapping is not None:
+                self.pwm_map = mapping
+                self.slot_info = sorted((mf, slot, head) for _, mf, slot, head in mapping)
+                return self.slot_info
+        except Exception as e:
+            logging.debug(f"[NIR8164] Topology check failed, enumerating: {e}")
+            frames = None
 
-        from NIR.sweep import HP816xLambdaScan
-        hp = HP816xLambdaScan(
-            self.laser_slot,
-            self.detector_slots
-        )
+        hp = self._make_sweep_module()
         try:
             if self.is_mf:
                 ok = hp.connect_mf()
@@ -178,7 +363,12 @@ class NIR8164(LaserHAL):
             mapping = hp.enumarate_slots()
             for _, mf, slot, head in mapping:
                 self.slot_info.append((mf, slot, head))
+            self.pwm_map = [tuple(m) for m in mapping]
+            if frames is not None:
+                topology_cache.put(frames, mapping, engine=self.sweep_engine)
         finally:
+            # The DLL session may have reset units / ranges
+            self.shadow.invalidate()
             try:
                 hp.disconnect()
                 self.sweep_module = False
@@ -195,21 +385,23 @@ class NIR8164(LaserHAL):
     def configure_units(self) -> bool:
         """Configured nir to dBm"""
         try:
-            # Write laser source unit
-            self.write(f"SOUR0:POW:UNIT 0")
-
-            # PWM config
-            for mf, slot, head in self.slot_info:
-                if mf > 0:
-                    self.write_detector(
-                        f"SENS{slot}:CHAN{head+1}:POW:UNIT 0",
-                        mf-1  # MF will be +1 due to laser
-                    )
-                    continue
-                self.write(f"SENS{slot}:CHAN{head+1}:POW:UNIT 0")
+            with self.batch():
+                # Write laser source unit
+                if not self.shadow.skip((("laser_unit",), 0)):
+                    self.write(f"SOUR0:POW:UNIT 0")
+                    self.shadow.update(("laser_unit",), 0)
+
+                # PWM config
+                for mf, slot, head in self.slot_info:
+                    key = ("unit", mf, slot, head + 1)
+                    if self.shadow.skip((key, 0)):
+                        continue
+                    self._write_mf(f"SENS{slot}:CHAN{head+1}:POW:UNIT 0", mf)
+                    self.shadow.update(key, 0)
             
             return True
         except Exception as e:
+            self.shadow.invalidate()
             return False
 
     # Rest of the laser functions only pertain to main laser module
@@ -217,9 +409,13 @@ class NIR8164(LaserHAL):
     def set_wavelength(self, nm: float) -> bool:
         """Set wl in nm"""
         try:
+            if self.shadow.skip((("wavelength",), float(nm))):
+                return True
             self.write(f"SOUR0:WAV {nm * 1e-9}")
+            self.shadow.update(("wavelength",), float(nm))
             return True
         except Exception as e:
+            self.shadow.invalidate()
             return False
 
     def get_wavelength(self) -> Optional[float]:
@@ -227,41 +423,66 @@ class NIR8164(LaserHAL):
         try:
             v = self.query("SOUR0:WAV?")
             x = float(v)
-            return x * 1e9 if x < 1e-3 else x
+            x = x * 1e9 if x < 1e-3 else x
+            self.shadow.update(("wavelength",), x, written=False)
+            return x
         except:
+            self.shadow.invalidate("wavelength")
             return None
 
     def set_power(self, dbm: float) -> bool:
         """Set power in dBm"""
         try:
-            self.write("SOUR0:POW:UNIT 0")
+            if self.shadow.skip((("laser_unit",), 0), (("power",), float(dbm))):
+                return True
+            if not self.shadow.matches(("laser_unit",), 0):
+                self.write("SOUR0:POW:UNIT 0")
+                self.shadow.update(("laser_unit",), 0)
             self.write(f"SOUR0:POW {dbm}")
+            self.shadow.update(("power",), float(dbm))
             return True
         except:
+            self.shadow.invalidate()
             return False
 
     def get_power(self) -> Optional[float]:
         """Get power in dBm"""
         try:
-            self.write("SOUR0:POW:UNIT 0")
+            if not self.shadow.skip((("laser_unit",), 0)):
+                self.write("SOUR0:POW:UNIT 0")
+                self.shadow.update(("laser_unit",), 0)
             v = self.query("SOUR0:POW?")
+            self.shadow.update(("power",), float(v), written=False)
             return float(v)
         except:
+            self.shadow.invalidate()
             return False
 
     def enable_output(self, on: bool) -> bool:
         """Turn laser on and off"""
         try:
+            if self.shadow.skip((("output",), bool(on))):
+                return True
             self.write(f"SOUR0:POW:STAT {'ON' if on else 'OFF'}")
+            self.shadow.update(("output",), bool(on))
             return True
         except:
+            self.shadow.invalidate()
             return False
 
     def get_output_state(self) -> bool:
         state = self.query("SOUR0:POW:STAT?")
         state = "1" in state
+        self.shadow.update(("output",), state, written=False)
         return state
 
+    def invalidate_shadow(self, *prefix) -> None:
+        """
+        Forget cached settings (all of them without a prefix), e.g. after
+        front panel changes. See NIR.utils.shadow_state.InstrumentShadow
+        """
+        self.shadow.invalidate(*prefix)
+
     ######################################################################
     # Detector functions
     # Behaviour now has to be seperated by detectors vs. Laser
@@ -269,30 +490,33 @@ class NIR8164(LaserHAL):
     # Or only for development, niche or debugging
     ######################################################################
 
+    def _write_mf(self, scpi: str, mf: int = 0) -> None:
+        """Write to the laser frame (mf 0) or to detector frame mf"""
+        if mf == 0:
+            self.write(scpi)
+        else:
+            self.write_detector(scpi, mf-1)  # MF will be +1 due to laser
+
     def set_detector_units(self, slot, units: int = 0, mf: int = 0) -> None:
         """
         Set Detector units
             unit[int]: 0 dBm, 1 W
         """
         try:
-            if mf == 0:
-                self.write(f"SENS{slot}:CHAN1:POW:UNIT {units}")
-                self.write(f"SENS{slot}:CHAN2:POW:UNIT {units}")
-            else:
-                self.write_detector(
-                    f"SENS{slot}:CHAN1:POW:UNIT {units}",
-                    mf-1
-                )
+            if not self.shadow.skip((("unit", mf, slot, 1), units)):
+                self._write_mf(f"SENS{slot}:CHAN1:POW:UNIT {units}", mf)
+                self.shadow.update(("unit", mf, slot, 1), units)
+            if not self.shadow.skip((("unit", mf, slot, 2), units)):
                 try:
-                    self.write_detector(
-                        f"SENS{slot}:CHAN2:POW:UNIT {units}",
-                        mf-1
-                    )
+                    self._write_mf(f"SENS{slot}:CHAN2:POW:UNIT {units}", mf)
+                    self.shadow.update(("unit", mf, slot, 2), units)
                 except:
                     # Some detectors will no have this functionality
-                    pass
+                    if mf == 0:
+                        raise
             return True
         except:
+            self.shadow.invalidate("unit", mf, slot)
             return False
 
     def get_detector_units(self, slot) -> Optional[Tuple]:
@@ -321,60 +545,94 @@ class NIR8164(LaserHAL):
         except:
             return False
 
+    def read_power_all(self, targets: Optional[List[Tuple[int, int, int]]] = None) -> np.ndarray:
+        """
+        Read every detector head, mainframes in parallel.
+
+        :param targets: [(mf, slot, head), ...], defaults to slot_info
+        :return: powers in the order of targets, NaN where a read failed
+        """
+        targets = list(self.slot_info if targets is None else targets)
+
+        def _read(t):
+            mf, slot, head = t
+            v = self.read_power(slot, head, mf)
+            return np.nan if v is False or v is None else float(v)
+
+        return np.asarray(
+            self.workers.run_grouped(targets, key=lambda t: t[0], fn=_read),
+            dtype=np.float64
+        )
+
+    def apply_detector_settings(self, settings: List[Tuple]) -> List[bool]:
+        """
+        Range and reference many detector slots, mainframes in parallel.
+        Each frame's writes go out as one batch.
+
+        :param settings: [(mf, slot, range_dbm or None for auto, ref_dbm or None), ...]
+        :return: success per entry, in input order
+        """
+        def _apply(entry):
+            mf, slot, range_dbm, ref_dbm = entry
+            try:
+                with self.batch():
+                    if range_dbm is None:
+                        ok = self.enable_autorange(True, slot, mf)
+                    else:
+                        ok = self.set_power_range(float(range_dbm), slot, mf)
+                    if ref_dbm is not None:
+                        ok = self.set_power_reference(float(ref_dbm), slot, mf) and ok
+                return ok
+            except Exception:
+                return False
+
+        return self.workers.run_grouped(settings, key=lambda e: e[0], fn=_apply)
+
     def enable_autorange(self, enable: bool = True, slot: int = 1, mf: int = 0) -> bool:
         """Enable/disable autorange """
         try:
-            if mf == 0:
-                self.write(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO {1 if enable else 0}")
-                return True
-            else:
-                self.write_detector(
-                    f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO {1 if enable else 0}",
-                    mf-1
-                )
+            key = ("autorange", mf, slot)
+            if self.shadow.skip((key, bool(enable))):
                 return True
+            self._write_mf(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO {1 if enable else 0}", mf)
+            self.shadow.update(key, bool(enable))
+            if enable:
+                # Range now follows the signal
+                self.shadow.invalidate("range", mf, slot)
+            return True
         except Exception as e:
+            self.shadow.invalidate("autorange", mf, slot)
+            self.shadow.invalidate("range", mf, slot)
             return False
 
     def set_power_range(self, range_dbm: float, slot: int = 1, mf: int = 0) -> bool:
         """Set power range for both slots"""
         try:
-            if mf == 0:
-                # Disable autorange first
-                self.write(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO 0")
-                # Set range
-                self.write(f"SENS{slot}:CHAN1:POW:RANG " + str(range_dbm))
-                time.sleep(0.05)
-                self.write(f"SENS{slot}:CHAN2:POW:RANG " + str(range_dbm))
+            auto_key = ("autorange", mf, slot)
+            ch1_key, ch2_key = ("range", mf, slot, 1), ("range", mf, slot, 2)
+            if self.shadow.skip((auto_key, False), (ch1_key, float(range_dbm)), (ch2_key, float(range_dbm))):
                 return True
-            else:
+
+            with self.batch():
                 # Disable autorange first
-                self.write_detector(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO 0",
-                                    mf-1)
-                # Set range
-                self.write_detector(f"SENS{slot}:CHAN1:POW:RANG " + str(range_dbm),
-                                    mf-1)
-                time.sleep(0.05)
-                self.write_detector(f"SENS{slot}:CHAN2:POW:RANG " + str(range_dbm),
-                                    mf-1)
-                return True
+                if not self.shadow.matches(auto_key, False):
+                    self._write_mf(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO 0", mf)
+                    self.shadow.update(auto_key, False)
+                # Set range, *OPC? at the end of the batch replaces the settle delay
+                self._write_mf(f"SENS{slot}:CHAN1:POW:RANG " + str(range_dbm), mf)
+                self.shadow.update(ch1_key, float(range_dbm))
+                self._write_mf(f"SENS{slot}:CHAN2:POW:RANG " + str(range_dbm), mf)
+                self.shadow.update(ch2_key, float(range_dbm))
+            return True
         except Exception as e:
+            self.shadow.invalidate("autorange", mf, slot)
+            self.shadow.invalidate("range", mf, slot)
             return False
 
     def set_power_range_auto(self, slot: int = 1, mf: int = 0) -> bool:
         """Set power range for master / slave of channel"""
-        try:
-            if mf == 0:
-                # Enable auto ranging
-                self.write(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO 1")
-                return True
-            else:
-                # Enable auto ranging
-                self.write_detector(f"SENSe{slot}:CHAN1:POWer:RANGe:AUTO 1",
-                                    mf-1)
-                return True
-        except Exception as e:
-            return False
+        # Enable auto ranging
+        return self.enable_autorange(True, slot, mf)
 
     def get_power_range(self, slot: int = 1) -> Optional[Tuple]:
         """Get power range for both slots"""
@@ -389,22 +647,19 @@ class NIR8164(LaserHAL):
     def set_power_reference(self, ref_dbm: float, slot: int = 1, mf: int = 0) -> bool:
         """Set power reference (noise floor) for detector slot"""
         try:
-            if mf == 0:
-                # Set reference level for the specified slot
-                self.write(f"SENS{slot}:CHAN1:POW:REF TOREF,{ref_dbm}DBM")
-                self.write(f"SENS{slot}:CHAN2:POW:REF TOREF,{ref_dbm}DBM")
-                time.sleep(0.05)
-                return True
-            else:
-                # Set reference level for the specified slot
-                self.write_detector(f"SENS{slot}:CHAN1:POW:REF TOREF,{ref_dbm}DBM",
-                                    mf-1)
-                self.write_detector(f"SENS{slot}:CHAN2:POW:REF TOREF,{ref_dbm}DBM",
-                                    mf-1)
-                time.sleep(0.05)
+            ch1_key, ch2_key = ("ref", mf, slot, 1), ("ref", mf, slot, 2)
+            if self.shadow.skip((ch1_key, float(ref_dbm)), (ch2_key, float(ref_dbm))):
                 return True
+            # Set reference level for the specified slot
+            with self.batch():
+                self._write_mf(f"SENS{slot}:CHAN1:POW:REF TOREF,{ref_dbm}DBM", mf)
+                self._write_mf(f"SENS{slot}:CHAN2:POW:REF TOREF,{ref_dbm}DBM", mf)
+                self.shadow.update(ch1_key, float(ref_dbm))
+                self.shadow.update(ch2_key, float(ref_dbm))
+            return True
  
         except Exception as e:
+            self.shadow.invalidate("ref", mf, slot)
             return False
 
     def get_power_reference(self, slot: int = 1) -> Optional[Tuple[float, float]]:
@@ -424,18 +679,21 @@ class NIR8164(LaserHAL):
     ######################################################################
 
     def set_sweep_range_nm(self, start_nm: float, stop_nm: float) -> None:
-        self.write(f"SOUR0:WAV:SWE:STAR {start_nm * 1e-9}")
-        self.write(f"SOUR0:WAV:SWE:STOP {stop_nm * 1e-9}")
+        with self.batch():
+            self.write(f"SOUR0:WAV:SWE:STAR {start_nm * 1e-9}")
+            self.write(f"SOUR0:WAV:SWE:STOP {stop_nm * 1e-9}")
 
     def set_sweep_step_nm(self, step_nm: float) -> None:
         self.write(f"SOUR0:WAV:SWE:STEP {step_nm}NM")
 
     def arm_sweep_cont_oneway(self) -> None:
-        self.write("SOUR0:WAV:SWE:MODE CONT")
-        self.write("SOUR0:WAV:SWE:REP ONEW")
-        self.write("SOUR0:WAV:SWE:CYCL 1")
+        with self.batch():
+            self.write("SOUR0:WAV:SWE:MODE CONT")
+            self.write("SOUR0:WAV:SWE:REP ONEW")
+            self.write("SOUR0:WAV:SWE:CYCL 1")
 
     def start_sweep(self) -> None:
+        self.shadow.invalidate("wavelength")
         self.write("SOUR0:WAV:SWE:STAT START")
 
     def stop_sweep(self) -> bool:
@@ -448,25 +706,242 @@ class NIR8164(LaserHAL):
     def get_sweep_state(self) -> str:
         return self.query("SOUR0:WAV:SWE:STAT?")
 
+    ######################################################################
+    # Multi-wavelength point measurement
+    ######################################################################
+
+    def measure_at_wavelengths(
+            self, wls: List[float],
+            channels: Optional[List[Tuple[int, int, int]]] = None,
+            avg_s: float = 1e-3, max_points: int = 1001
+    ) -> np.ndarray:
+        """
+        Power of every channel at each wavelength in one hardware timed burst.
+
+        The TLS runs a stepped sweep over a grid containing all requested
+        wavelengths (grid step = gcd of their spacings, 0.1 pm resolution)
+        and triggers the power meters on each step finish, which log one
+        sample per step. Falls back to set_wavelength + read_power_all per
+        wavelength if the grid would exceed max_points or the burst fails.
+        Detectors keep their current (manual) range while logging.
+
+        Inside prepare_burst() / release_burst() with the same wls, channels
+        and avg_s the setup is kept and a call only re-arms and reads the logs.
+
+        :param wls: wavelengths [nm], any order
+        :param channels: [(mf, slot, head), ...], defaults to slot_info
+        :param avg_s: power meter averaging time per sample [s]
+        :return: (len(wls), len(channels)) array in dBm, rows in the order of wls
+        """
+        wls = np.asarray(wls, dtype=np.float64).ravel()
+        channels = [tuple(c) for c in (self.slot_info if channels is None else channels)]
+        if wls.size == 0 or not channels:
+            return np.empty((wls.size, len(channels)))
+
+        plan = self._burst
+        prepared = plan is not None and plan["key"] == self._burst_key(wls, channels, avg_s)
+        if not prepared:
+            plan = self._burst_plan(wls, channels, avg_s, max_points)
+            if plan is None:
+                return self._measure_stepwise(wls, channels)
+        try:
+            if prepared:
+                logged = self._burst_run(plan)
+            else:
+                try:
+                    self._burst_setup(plan)
+                    logged = self._burst_run(plan)
+                finally:
+                    self._burst_teardown(plan)
+        except Exception as e:
+            logging.warning(f"[NIR8164] Triggered burst failed ({e}), stepping in software")
+            if prepared:
+                self.release_burst()
+            return self._measure_stepwise(wls, channels)
+
+        idx = np.round((wls - plan["lo_nm"]) / plan["step_nm"]).astype(np.int64)
+        return logged[idx, :]
+
+    def prepare_burst(self, wls: List[float],
+                      channels: Optional[List[Tuple[int, int, int]]] = None,
+                      avg_s: float = 1e-3, max_points: int = 1001) -> bool:
+        """
+        Configure the TLS stepped sweep and the PWM triggering / logging once
+        for repeated measure_at_wavelengths(wls, channels, avg_s) calls (e.g.
+        every point of a spiral). Until release_burst() the detectors read in
+        W with triggered logging, so plain power reads are not valid.
+        False if the wavelengths do not fit a burst or the setup failed.
+        """
+        self.release_burst()
+        wls = np.asarray(wls, dtype=np.float64).ravel()
+        channels = [tuple(c) for c in (self.slot_info if channels is None else channels)]
+        plan = self._burst_plan(wls, channels, avg_s, max_points) if channels else None
+        if plan is None:
+            return False
+        try:
+            self._burst_setup(plan)
+        except Exception as e:
+            logging.warning(f"[NIR8164] Burst setup failed ({e})")
+            self._burst_teardown(plan)
+            return False
+        self._burst = plan
+        return True
+
+    def release_burst(self) -> None:
+        """Undo prepare_burst: TLS back to continuous, detectors to dBm, logging stopped"""
+        plan, self._burst = self._burst, None
+        if plan is not None:
+            self._burst_teardown(plan)
+
+    def _measure_stepwise(self, wls: np.ndarray, channels: list) -> np.ndarray:
+        out = np.full((wls.size, len(channels)), np.nan)
+        for i, wl in enumerate(wls):
+            self.set_wavelength(float(wl))
+            self.query("*OPC?")
+            out[i] = self.read_power_all(channels)
+        return out
+
+    @staticmethod
+    def _burst_key(wls: np.ndarray, channels: list, avg_s: float) -> tuple:
+        grid = np.unique(np.round(wls * 1e4).astype(np.int64))  # 0.1 pm units
+        return tuple(int(g) for g in grid), tuple(channels), float(avg_s)
+
+    def _burst_plan(self, wls: np.ndarray, channels: list, avg_s: float,
+                    max_points: int) -> Optional[dict]:
+        """Step grid covering all wavelengths, None if it is not a burst (1 point / too many)"""
+        key = self._burst_key(wls, channels, avg_s)
+        grid = key[0]
+        step = 0
+        for d in np.diff(grid):
+            step = gcd(step, int(d))
+        n_points = 1 if step == 0 else int((grid[-1] - grid[0]) // step) + 1
+        if n_points < 2 or n_points > max_points:
+            return None
+        by_mf = {}
+        for mf, slot, head in channels:
+            by_mf.setdefault(mf, []).append((slot, head))
+        return {
+            "key": key,
+            "channels": list(channels),
+            "by_mf": by_mf,
+            "lo_nm": grid[0] * 1e-4,
+            "hi_nm": grid[-1] * 1e-4,
+            "step_nm": step * 1e-4,
+            "n_points": n_points,
+            "avg_s": float(avg_s),
+            "dwell_s": max(0.01, 2.0 * avg_s),
+        }
+
+    def _burst_setup(self, plan: dict) -> None:
+        """TLS stepped sweep + PWM trigger / logging configuration, once per burst plan"""
+        from NIR.drivers.agilent_8163a import agilent_8163a_mainframe as scpi
+
+        self.shadow.invalidate()
+        with self.batch():
+            self.write(scpi.set_laser_sweep_mode(0, "STEP"))
+            self.write(scpi.set_laser_sweep_cycles(0, 1))
+            self.write(scpi.set_laser_sweep_directionality(0, "ONEW"))
+            self.write(scpi.set_sweep_wavelength(0, "STAR", f"{plan['lo_nm']}nm"))
+            self.write(scpi.set_sweep_wavelength(0, "STOP", f"{plan['hi_nm']}nm"))
+            self.write(scpi.set_laser_sweep_step_size(0, f"{plan['step_nm']}nm"))
+            self.write(f"SOUR0:WAV:SWE:DWEL {plan['dwell_s']}S")
+            self.write(scpi.set_laser_output_trigger_timing(0, "STF"))
+            self.write(scpi.set_laser_power_state(0, 1))
+            for mf, chans in plan["by_mf"].items():
+                self._write_mf(scpi.set_hardware_trigger_config("LOOP" if mf == 0 else "DEF"), mf)
+                for slot, head in chans:
+                    self._write_mf(scpi.power_sensor_unit(slot, head + 1, "W"), mf)
+                for slot in sorted({s for s, _ in chans}):
+                    self._write_mf(scpi.set_incoming_trigger_response(slot, "SME"), mf)
+                    self._write_mf(scpi.set_detector_data_acquisition(slot, "LOGG", "STOP"), mf)
+                    self._write_mf(scpi.set_detector_sensor_logging(slot, plan["n_points"], plan["avg_s"]), mf)
+
+    def _burst_run(self, plan: dict) -> np.ndarray:
+        """Re-arm logging and the TLS, one stepped sweep -> (n_points, n_channels) dBm"""
+        from NIR.drivers.agilent_8163a import agilent_8163a_mainframe as scpi
+        from NIR.scpi_sweep import read_pwm_log, _watts_to_dbm
+
+        n_points, channels = plan["n_points"], plan["channels"]
+        with self.batch():
+            for mf, chans in plan["by_mf"].items():
+                for slot in sorted({s for s, _ in chans}):
+                    self._write_mf(scpi.set_detector_data_acquisition(slot, "LOGG", "STOP"), mf)
+                    self._write_mf(scpi.set_detector_data_acquisition(slot, "LOGG", "STAR"), mf)
+        self.write(scpi.arm_laser_sweep(0))
+        timeout_s = n_points * (plan["dwell_s"] + 0.2) + 10.0
+        t0 = time.time()
+        while not self.query("SOUR0:WAV:SWE?").lstrip("+").startswith("0"):
+            if time.time() - t0 > timeout_s:
+                raise TimeoutError("TLS stepped sweep did not finish")
+            time.sleep(0.01)
+
+        def _read(ch):
+            mf, slot, head = ch
+            inst = self._inst(mf - 1)
+            while "COMPLETE" not in inst.query(
+                    scpi.power_sensor_logging_state(slot, head + 1)).upper():
+                if time.time() - t0 > timeout_s:
+                    raise TimeoutError(f"Logging did not complete on MF {mf} slot {slot}")
+                time.sleep(0.01)
+            return _watts_to_dbm(read_pwm_log(inst, slot, head, n_points))
+
+        cols = self.workers.run_grouped(channels, key=lambda c: c[0], fn=_read)
+        out = np.full((n_points, len(channels)), np.nan)
+        for j, col in enumerate(cols):
+            out[:min(n_points, col.size), j] = col[:n_points]
+        return out
+
+    def _burst_teardown(self, plan: dict) -> None:
+        from NIR.drivers.agilent_8163a import agilent_8163a_mainframe as scpi
+
+        try:
+            with self.batch():
+                self.write(scpi.set_laser_output_trigger_timing(0, "DIS"))
+                self.write(scpi.set_laser_sweep_mode(0, "CONT"))
+                for mf, chans in plan["by_mf"].items():
+                    for slot, head in chans:
+                        self._write_mf(scpi.power_sensor_unit(slot, head + 1, "DBM"), mf)
+                    for slot in sorted({s for s, _ in chans}):
+                        self._write_mf(scpi.set_detector_data_acquisition(slot, "LOGG", "STOP"), mf)
+                        self._write_mf(scpi.set_incoming_trigger_response(slot, "IGN"), mf)
+        except Exception:
+            pass
+        self.shadow.invalidate()
+
     ######################################################################
     # Lambda scan functions
     ######################################################################
     def optical_sweep(
             self, start_nm: float, stop_nm: float, step_nm: float,
             laser_power_dbm: float, num_scans: int = 0,
-            args: list = []
-    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-        from NIR.sweep import HP816xLambdaScan
+            args: list = [], target_sem_db: Optional[float] = None
+    ) -> SpectrumResult:
+        """
+        Lambda scan, repeated and averaged when num_scans > 0.
+
+        :param num_scans: extra repetitions (zero indexed, 0 -> single sweep).
+                          Repetitions are averaged per point in mW, only the
+                          running mean / variance are kept.
+        :param target_sem_db: stop repeating early once the worst per point
+                              standard error (above the noise floor) is below
+                              this value in dB
+        Per point std / sem of the last call are kept in self.last_sweep_stats
+
+        Returns a SpectrumResult, detectors in slot_info order in one
+        (n_det, n_pts) block of sweep_dtype
+        """
+        from NIR.utils.running_stats import RunningStats
         step_pm = float(step_nm) * 1000.0
         try:
             self._preflight_cleanup()
         except Exception:
             pass
-        hp = HP816xLambdaScan(
-            self.laser_slot,
-            self.detector_slots
-        )
+        self.release_burst()
+        hp = self._make_sweep_module()
+        hp.device_type = self.device_type
         self.sweep_module = hp
+        stats = RunningStats()
+        max_repeats = max(0, int(num_scans)) + 1
         try:
             if not self.is_mf:
                 ok = hp.connect()
@@ -474,30 +949,49 @@ class NIR8164(LaserHAL):
                 ok = hp.connect_mf()
             if not ok:
                 raise RuntimeError("HP816xLambdaScan.connect() failed")
-            res = hp.lambda_scan(
-                start_nm=float(start_nm),
-                stop_nm=float(stop_nm),
-                step_pm=step_pm,
-                power_dbm=float(laser_power_dbm),
-                num_scans=0,
-                args=args
-            )
+            for rep in range(max_repeats):
+                res = hp.lambda_scan(
+                    start_nm=float(start_nm),
+                    stop_nm=float(stop_nm),
+                    step_pm=step_pm,
+                    power_dbm=float(laser_power_dbm),
+                    num_scans=0,
+                    args=args,
+                    mapping=self.pwm_map
+                )
+                power_dict = res.get('power_dbm_by_detector')
+                if not self.slot_info:
+                    break
+                stats.update_dbm(np.vstack(
+                    [power_dict[(mf, slot, head)] for mf, slot, head in self.slot_info]))
+                if (target_sem_db is not None and rep > 0
+                        and stats.max_sem_db(min_dbm=-70.0) <= float(target_sem_db)):
+                    break
         finally:
+            # Lambda scans leave wavelength, ranges and units changed
+            self.shadow.invalidate()
             try:
                 hp.disconnect()
                 self.sweep_module = False
                 self.configure_units()
             except Exception:
                 pass
-        
-        wl = np.asarray(res.get('wavelengths_nm', []), dtype=np.float64)
-        power_dict = res.get('power_dbm_by_detector')
-        chs = []
-        for mf, slot, head in self.slot_info:
-                chs.append(power_dict[(mf,slot,head)])
-        return wl, chs
+
+        # Spread needs two repetitions, an empty topology has none at all
+        repeated = stats.n_updates > 1
+        self.last_sweep_stats = {
+            "num_scans": stats.n_updates,
+            "std_db": stats.std_db if repeated else None,
+            "sem_db": stats.sem_db if repeated else None,
+        }
+        wl = res.get('wavelengths_nm', [])
+        rows = stats.mean_dbm if repeated else \
+            [power_dict[(mf, slot, head)] for mf, slot, head in self.slot_info]
+        return SpectrumResult.from_rows(wl, rows, self.slot_info, self.sweep_dtype,
+                                        meta={"num_scans": stats.n_updates})
 
     def sweep_cancel(self):
+        self.shadow.invalidate()
         try:
             if not self.sweep_module:
                 raise RuntimeError("HP816xLambdaScan not connected")
@@ -508,30 +1002,26 @@ class NIR8164(LaserHAL):
             return False
 
     def _preflight_cleanup(self) -> None:
+        # One transaction per frame instead of a write per slot
         try:
-            for slot, _ in self.slot_info:
-                self.write(f"SENS{slot}:CHAN1:FUNC:STAT LOGG,STOP")
-        except:
-            pass
-        try:
-            self.write("SOUR0:WAV:SWE:STAT STOP")
-        except:
-            pass
-        try:
-            self.configure_units()
-            self.enable_output(True)
-            pass
+            with self.batch():
+                for mf, slot, head in self.slot_info:
+                    if head == 0:
+                        self._write_mf(f"SENS{slot}:CHAN1:FUNC:STAT LOGG,STOP", mf)
+                self.write("SOUR0:WAV:SWE:STAT STOP")
+                self.configure_units()
+                self.enable_output(True)
         except:
             pass
 
     def cleanup_scan(self) -> None:
+        self.shadow.invalidate("wavelength")
         try:
-            for _, slot, _ in self.slot_info:
-                self.write(f"SENS{slot}:CHAN1:FUNC:STAT LOGG,STOP")
-        except Exception:
-            pass
-        try:
-            self.write("SOUR0:WAV:SWE:STAT STOP")
+            with self.batch():
+                for mf, slot, head in self.slot_info:
+                    if head == 0:
+                        self._write_mf(f"SENS{slot}:CHAN1:FUNC:STAT LOGG,STOP", mf)
+                self.write("SOUR0:WAV:SWE:STAT STOP")
         except Exception:
             pass
         try:
@@ -2,10 +2,16 @@ import logging
 from typing import Dict, Any, Callable, List, Optional, Tuple
 from dataclasses import dataclass, asdict
 
+import numpy as np
+
 # from NIR.nir_controller import NIR8164
 from NIR.hal.nir_hal import LaserEvent
 from NIR.hal.nir_factory import create_driver
 from NIR.config.nir_config import NIRConfiguration
+from NIR.utils.spectral_features import find_features, merge_windows, inside_windows
+from NIR.utils.reference_store import ReferenceStore
+from NIR.utils.topology_cache import topology_cache
+from NIR.utils.spectrum_result import SpectrumResult
 from utils.logging_helper import setup_logger
 
 """
@@ -33,6 +39,9 @@ class NIRManager:
         # Slot info helper
         self.slot_info = None
 
+        # Reference spectra for normalisation, loaded lazily from config
+        self.references = ReferenceStore()
+
     def _log(self, message: str, level: str = "info"):
         """Simple logging that respects debug flag"""
         if level == "debug":
@@ -144,18 +153,23 @@ class NIRManager:
         except Exception as e:
             self._log(f"Device configuration error: {e}", "error")
 
-    def get_mainframe_slot_info(self):
+    def get_mainframe_slot_info(self, refresh: bool = False):
         """ 
         Get slot information for a 816x mainframe
 
         Specify return data as follows:
 
         [(MF,slot,head), ...] 
+
+        The topology is cached across sessions, refresh=True forgets it and
+        enumerates the mainframes again (e.g. after moving modules)
         """
         try:
             if not self.controller or not self._connected:
                 return
 
+            if refresh:
+                topology_cache.invalidate()
             if hasattr(self.controller, "get_mainframe_slot_info"):
                 self.slot_info = self.controller.get_mainframe_slot_info()
             else:
@@ -285,6 +299,103 @@ class NIRManager:
             self._log(f"Read power error: {e}", "error")
             return -80.0
 
+    def read_power_all(self, targets: Optional[List[Tuple[int, int, int]]] = None) -> np.ndarray:
+        """
+        Read all (mf, slot, head) targets at once, mainframes concurrently
+        where the controller supports it. Same clamping as read_power.
+        """
+        try:
+            if not self.controller or not self._connected:
+                self._log("Controller not connected", "error")
+                return np.full(len(targets or []), -80.0)
+
+            if hasattr(self.controller, "read_power_all"):
+                p = np.asarray(self.controller.read_power_all(targets), dtype=np.float64)
+            else:
+                p = np.asarray([self.controller.read_power(slot, head, mf)
+                                for mf, slot, head in (targets or [])], dtype=np.float64)
+            p[~np.isfinite(p) | (p > 0.0)] = -80.0
+            return p
+
+        except Exception as e:
+            self._log(f"Read power error: {e}", "error")
+            return np.full(len(targets or []), -80.0)
+
+    def measure_at_wavelengths(self, wls: List[float],
+                               channels: Optional[List[Tuple[int, int, int]]] = None) -> Optional[np.ndarray]:
+        """
+        Power of each (mf, slot, head) channel at each wavelength,
+        shape (len(wls), len(channels)) in dBm. Hardware triggered on
+        controllers that support it, set_wavelength + read per point otherwise.
+        """
+        try:
+            if not self.controller or not self._connected:
+                self._log("Controller not connected", "error")
+                return None
+
+            if hasattr(self.controller, "measure_at_wavelengths"):
+                p = np.asarray(self.controller.measure_at_wavelengths(wls, channels), dtype=np.float64)
+            else:
+                p = np.vstack([self.read_power_all(channels) if self.set_wavelength(wl)
+                               else np.full(len(channels or []), np.nan) for wl in wls])
+            p[~np.isfinite(p) | (p > 0.0)] = -80.0
+            return p
+
+        except Exception as e:
+            self._log(f"Multi wavelength measurement error: {e}", "error")
+            return None
+
+    def prepare_burst(self, wls: List[float],
+                      channels: Optional[List[Tuple[int, int, int]]] = None) -> bool:
+        """
+        Keep the measure_at_wavelengths(wls, channels) setup between calls,
+        until release_burst(). False where the controller has no such setup.
+        """
+        try:
+            if not self.controller or not self._connected:
+                return False
+            if not hasattr(self.controller, "prepare_burst"):
+                return False
+            return bool(self.controller.prepare_burst(wls, channels))
+        except Exception as e:
+            self._log(f"Prepare burst error: {e}", "error")
+            return False
+
+    def release_burst(self) -> None:
+        try:
+            if self.controller and hasattr(self.controller, "release_burst"):
+                self.controller.release_burst()
+        except Exception as e:
+            self._log(f"Release burst error: {e}", "error")
+
+    def apply_detector_settings(self, settings: List[Tuple]) -> bool:
+        """
+        [(mf, slot, range_dbm or None for auto, ref_dbm or None), ...],
+        applied per mainframe concurrently where supported
+        """
+        try:
+            if not self.controller or not self._connected:
+                self._log("Controller not connected", "error")
+                return False
+
+            if hasattr(self.controller, "apply_detector_settings"):
+                results = self.controller.apply_detector_settings(settings)
+            else:
+                results = []
+                for mf, slot, range_dbm, ref_dbm in settings:
+                    ok = (self.controller.set_power_range_auto(slot, mf) if range_dbm is None
+                          else self.controller.set_power_range(range_dbm, slot, mf))
+                    if ref_dbm is not None:
+                        ok = self.controller.set_power_reference(ref_dbm, slot, mf) and ok
+                    results.append(ok)
+            if not all(results):
+                self._log(f"Detector settings failed for {[s for s, ok in zip(settings, results) if not ok]}", "error")
+                return False
+            return True
+        except Exception as e:
+            self._log(f"Apply detector settings error: {e}", "error")
+            return False
+
     def set_detector_units(self, slot, units: int = 0, mf: int = 0) -> bool:
         """Set Detector units"""
         try:
@@ -403,7 +514,7 @@ class NIRManager:
     ######################################################################
     def sweep(self, start_nm, stop_nm,
               step_nm, laser_power_dbm,
-              num_scans=0, args=[]):
+              num_scans=0, args=[], adaptive=False, target_sem_db=None):
         """
         Execute a lambda scan, auto stitches longer measurements (>20,001 points)
         params:
@@ -411,7 +522,12 @@ class NIRManager:
             stop_nm[nm]: end of sweep in nm
             step_nm[nm]: step size of sweep in nm
             laser_power_dbm[dbm]: laser power in dBm
-            num_scans[int]: num scans zero indexes up to 3,
+            num_scans[int]: extra repetitions averaged per point (zero indexed),
+            target_sem_db[dB]: stop repeating once the per point standard
+                               error is below this, None runs all num_scans
+            adaptive[bool]: coarse pass + fine windows around peaks/dips,
+                            see adaptive_sweep. The returned wavelength axis
+                            is then non-uniform.
             :param args: input arguments for changing the reference and ranging before
                       a sweep has been taken. Use these parameter naming convention,
                       should be taken from shared memory config. Group args into a 
@@ -422,23 +538,45 @@ class NIRManager:
                       :param slot[int]: master/slave channel slot
                       :param ref[float]: reference value in dBm (PWM relative internal)
                       :param range[float]: range value in dBm, if None, then autorange
+        returns:
+            (wavelengths_nm, SpectrumResult), the result iterates / indexes as
+            the detector traces and np.asarray(result) is its (n_det, n_pts)
+            block, no copies
         """
         try:
             if not self.controller or not self._connected:
                 self._log("Controller not connected", "error")
                 return None
 
+            if adaptive:
+                res = self.adaptive_sweep(
+                    start_nm, stop_nm, step_nm, laser_power_dbm,
+                    num_scans=num_scans, args=args)
+                if res is None:
+                    return None, None
+                # Same shape as the plain sweep: (wl, SpectrumResult)
+                spec = SpectrumResult.from_rows(
+                    res["wavelengths_nm"], res["power_dbm"], self.slot_info,
+                    self.config.sweep_dtype, meta={"fine_mask": res["fine_mask"]})
+                return spec.wavelengths_nm, spec
+
             # (wavelengths[nm], channels[ch1[dBm], ch2[dBm], ..., chn[dBm]])
-            results = self.controller.optical_sweep(
-                start_nm, stop_nm, step_nm, laser_power_dbm,
-                num_scans, args)
+            if target_sem_db is not None:
+                results = self.controller.optical_sweep(
+                    start_nm, stop_nm, step_nm, laser_power_dbm,
+                    num_scans, args, target_sem_db=target_sem_db)
+            else:
+                results = self.controller.optical_sweep(
+                    start_nm, stop_nm, step_nm, laser_power_dbm,
+                    num_scans, args)
             self.controller.cleanup_scan()
             self.controller.set_wavelength(self.config.initial_wavelength_nm)
             self.controller.configure_units()
             
             if results is not None:
                 self._log("Lambda scan completed successfully")
-                return results[0], results[1:]
+                spec = SpectrumResult.coerce(results, self.slot_info, self.config.sweep_dtype)
+                return spec.wavelengths_nm, spec
             else:
                 self._log("Lambda scan failed", "error")
                 return None, None
@@ -447,6 +585,177 @@ class NIRManager:
             self._log(f"Lambda scan error: {e}", "error")
             return None, None
 
+    @staticmethod
+    def _split_sweep_result(results) -> Tuple[np.ndarray, List[np.ndarray]]:
+        """
+        Normalise the controller sweep return into (wl, [ch0, ch1, ...]).
+
+        Controllers return a SpectrumResult, older ones (wl, [chs]),
+        (wl, ch0, ch1, ...) or Luna's list of columns with wavelength first;
+        SpectrumResult.coerce takes all of them.
+        """
+        spec = SpectrumResult.coerce(results)
+        return spec.wavelengths_nm, [np.asarray(c, dtype=np.float64) for c in spec.power_dbm]
+
+    def adaptive_sweep(self, start_nm, stop_nm, step_nm, laser_power_dbm,
+                       coarse_step_nm=None, prominence_db=None, window_nm=None,
+                       num_scans=0, args=[]) -> Optional[Dict[str, Any]]:
+        """
+        Two pass sweep. A coarse sweep over the full span locates peaks and dips
+        on any detector, then only the windows around them are swept again at
+        step_nm. Flat regions keep the coarse resolution.
+
+        params:
+            start_nm, stop_nm, step_nm, laser_power_dbm, num_scans, args: see sweep
+            coarse_step_nm[nm]: defaults to config.adaptive_coarse_factor * step_nm
+            prominence_db[dB]: min feature prominence, defaults to config.adaptive_prominence_db
+            window_nm[nm]: full width swept at step_nm around each feature,
+                           defaults to config.adaptive_window_nm
+        returns:
+            {
+                "wavelengths_nm": sorted, non-uniform wavelength axis,
+                "power_dbm": [ch0, ch1, ...] on that axis,
+                "fine_mask": True where the point comes from a fine window,
+                "windows_nm": [(start, stop), ...] fine windows,
+                "coarse_step_nm", "fine_step_nm", "num_points"
+            }
+            or None on failure
+        """
+        try:
+            if not self.controller or not self._connected:
+                self._log("Controller not connected", "error")
+                return None
+
+            start_nm, stop_nm, step_nm = float(start_nm), float(stop_nm), float(step_nm)
+            if coarse_step_nm is None:
+                coarse_step_nm = step_nm * float(self.config.adaptive_coarse_factor)
+            if prominence_db is None:
+                prominence_db = self.config.adaptive_prominence_db
+            if window_nm is None:
+                window_nm = self.config.adaptive_window_nm
+            coarse_step_nm = float(coarse_step_nm)
+
+            # Coarse pass
+            coarse = self.controller.optical_sweep(
+                start_nm, stop_nm, coarse_step_nm, laser_power_dbm,
+                num_scans, args)
+            self.controller.cleanup_scan()
+            if coarse is None:
+                raise RuntimeError("coarse sweep returned no data")
+            wl_c, chs_c = self._split_sweep_result(coarse)
+
+            # Features on any detector; the feature is only located to within
+            # one coarse step so the window is never narrower than that
+            centers = np.unique(np.concatenate(
+                [wl_c[find_features(ch, prominence_db)] for ch in chs_c]
+                + [np.empty(0)]))
+            half_width = max(float(window_nm) / 2.0, 2.0 * coarse_step_nm)
+            windows = merge_windows(centers, half_width, start_nm, stop_nm)
+            self._log(f"Adaptive sweep: {centers.size} features, {len(windows)} fine windows")
+
+            # Fine pass, coarse points inside a window are replaced
+            keep = ~inside_windows(wl_c, windows)
+            wl_parts = [wl_c[keep]]
+            ch_parts = [[ch[keep]] for ch in chs_c]
+            fine_parts = [np.zeros(int(keep.sum()), dtype=bool)]
+            for lo, hi in windows:
+                fine = self.controller.optical_sweep(
+                    lo, hi, step_nm, laser_power_dbm, num_scans, args)
+                self.controller.cleanup_scan()
+                if fine is None:
+                    raise RuntimeError(f"fine sweep {lo:.3f}-{hi:.3f} nm returned no data")
+                wl_f, chs_f = self._split_sweep_result(fine)
+                wl_parts.append(wl_f)
+                for parts, ch in zip(ch_parts, chs_f):
+                    parts.append(ch)
+                fine_parts.append(np.ones(wl_f.size, dtype=bool))
+
+            wl = np.concatenate(wl_parts)
+            order = np.argsort(wl, kind="stable")
+            power = [np.concatenate(parts)[order] for parts in ch_parts]
+
+            self.controller.set_wavelength(self.config.initial_wavelength_nm)
+            self.controller.configure_units()
+            self._log("Adaptive lambda scan completed successfully")
+            return {
+                "wavelengths_nm": wl[order],
+                "power_dbm": power,
+                "fine_mask": np.concatenate(fine_parts)[order],
+                "windows_nm": windows,
+                "coarse_step_nm": coarse_step_nm,
+                "fine_step_nm": step_nm,
+                "num_points": int(wl.size),
+            }
+
+        except Exception as e:
+            self._log(f"Adaptive lambda scan error: {e}", "error")
+            return None
+
+    def get_last_sweep_stats(self) -> Optional[Dict[str, Any]]:
+        """Per point std / sem [dB] and repetitions used by the last averaged sweep"""
+        return getattr(self.controller, "last_sweep_stats", None)
+
+    ######################################################################
+    # Reference normalisation
+    ######################################################################
+
+    def load_reference(self, path: str, channels: Optional[List[Tuple[int, int, int]]] = None) -> bool:
+        """Load reference spectra (.npz, or Spectrum CSV with columns in channels / slot_info order)"""
+        try:
+            if not path:
+                return False
+            if path == self.references.source:
+                return True
+            self.references.clear()
+            self.references.load(path, channels or self.slot_info)
+            self._log(f"Loaded reference spectra for {len(self.references.channels())} channel(s) from {path}")
+            return True
+        except Exception as e:
+            self._log(f"Load reference error: {e}", "error")
+            return False
+
+    def set_reference_from_sweep(self, wl, chs, channels: Optional[List[Tuple[int, int, int]]] = None,
+                                 save_path: Optional[str] = None) -> bool:
+        """Use a (fiber to fiber / loopback) sweep result as the reference, optionally saved as .npz"""
+        try:
+            channels = channels or self.slot_info
+            self.references.set_from_sweep(wl, np.vstack(chs), channels)
+            if save_path:
+                self.references.save(save_path)
+                self.references.source = save_path
+            return True
+        except Exception as e:
+            self._log(f"Set reference error: {e}", "error")
+            return False
+
+    def normalise_sweep(self, wl, chs, channels: Optional[List[Tuple[int, int, int]]] = None) -> Optional[np.ndarray]:
+        """
+        Sweep result minus reference [dB], rows in channel order. None when
+        no reference is known for any channel.
+        """
+        try:
+            channels = channels or self.slot_info or []
+            if not self.references.channels() and getattr(self.config, "reference_file", ""):
+                self.load_reference(self.config.reference_file, channels)
+            if not any(self.references.has(ch) for ch in channels):
+                return None
+            return self.references.normalise(wl, np.asarray(chs), channels)
+        except Exception as e:
+            self._log(f"Normalise error: {e}", "error")
+            return None
+
+    def set_device_type(self, device_type) -> bool:
+        """Tag the next sweeps, so autoranging can reuse ranges found for this type"""
+        if not self.controller or not hasattr(self.controller, "device_type"):
+            return False
+        self.controller.device_type = device_type
+        return True
+
+    def get_shadow_stats(self) -> Optional[Dict[str, int]]:
+        """Written / suppressed instrument setting writes since connect"""
+        shadow = getattr(self.controller, "shadow", None)
+        return shadow.stats() if shadow is not None else None
+
     def cancel_sweep(self):
         try:
             if not self.controller or not self._connected:
@@ -0,0 +1,521 @@
+import time
+import logging
+import numpy as np
+import pyvisa
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Tuple, Dict
+
+from NIR.drivers.agilent_8163a import agilent_8163a_mainframe as scpi
+from utils.progress_write_helpers import FileProgressTqdm, write_progress_file
+from NIR.utils.autorange import probe_wavelengths, range_for, range_cache
+from utils import io_trace
+
+"""
+Pure SCPI lambda scan engine for 816x mainframes.
+
+Drop in alternative to HP816xLambdaScan (same connect / enumarate_slots /
+lambda_scan / cancel / disconnect interface and the same result dict) that
+does not need hp816x_64.dll, so it also runs on Linux hosts and against a
+pyvisa simulator backend (visa_library="@sim").
+
+The sweep uses the TLS in continuous mode with lambda logging and the
+power meters in logging mode, one sample per laser step trigger:
+    - laser frame (MF 0): TRIG:CONF LOOP, TLS output trigger on step finish
+    - detector frames (MF > 0): TRIG:CONF DEF, their trigger input must be
+      cabled to the laser frame trigger output
+Logged results are IEEE 488.2 binary blocks (little endian float32 in W for
+the PWMs, float64 in m for the lambda log) and are decoded with np.frombuffer.
+Each mainframe is polled and read on its own thread.
+"""
+
+
+def parse_binary_block(raw: bytes, dtype: str = "<f4") -> np.ndarray:
+    """
+    Decode an IEEE 488.2 definite (#<n><len><data>) or indefinite (#0<data>)
+    length block into a numpy array.
+    """
+    start = raw.find(b"#")
+    if start < 0 or len(raw) < start + 2:
+        raise ValueError("Not a binary block")
+    n = int(raw[start + 1:start + 2])
+    if n == 0:
+        data = raw[start + 2:].rstrip(b"\r\n")
+    else:
+        length = int(raw[start + 2:start + 2 + n])
+        data = raw[start + 2 + n:start + 2 + n + length]
+    itemsize = np.dtype(dtype).itemsize
+    usable = len(data) - (len(data) % itemsize)
+    return np.frombuffer(data[:usable], dtype=dtype)
+
+
+def query_block(inst, cmd: str, dtype: str) -> np.ndarray:
+    """Query a binary block without tripping over termination bytes in the payload"""
+    inst.write(cmd)
+    head = inst.read_bytes(2, break_on_termchar=False)
+    if head[:1] != b"#":
+        raise RuntimeError(f"{cmd}: expected binary block, got {head!r}")
+    n = int(head[1:2])
+    if n == 0:
+        return parse_binary_block(head + inst.read_raw(), dtype)
+    length = int(inst.read_bytes(n, break_on_termchar=False))
+    data = inst.read_bytes(length, break_on_termchar=False) if length else b""
+    try:
+        inst.read_bytes(1)  # trailing LF
+    except Exception:
+        pass
+    itemsize = np.dtype(dtype).itemsize
+    return np.frombuffer(data[:len(data) - len(data) % itemsize], dtype=dtype)
+
+
+def read_pwm_log(inst, slot: int, head: int, points: int) -> np.ndarray:
+    """Read a PWM logging buffer (W) in max-block-size chunks"""
+    chan = head + 1
+    try:
+        maxb = int(float(inst.query(scpi.read_max_block_size(slot, chan)).strip()))
+    except Exception:
+        maxb = 0
+    if maxb <= 0 or maxb >= points:
+        return query_block(inst, scpi.read_data(slot, chan), "<f4")[:points]
+
+    out = np.empty(points, dtype=np.float32)
+    for offset in range(0, points, maxb):
+        n = min(maxb, points - offset)
+        out[offset:offset + n] = query_block(
+            inst, scpi.read_block(slot, chan, offset, n), "<f4")[:n]
+    return out
+
+
+def _watts_to_dbm(w: np.ndarray) -> np.ndarray:
+    """Vectorized W -> dBm, non positive readings become NaN"""
+    w = np.asarray(w, dtype=np.float64)
+    out = np.full(w.shape, np.nan)
+    pos = w > 0
+    out[pos] = 10.0 * np.log10(w[pos] * 1000.0)
+    return out
+
+
+class SCPILambdaScan:
+    # Module models (from *OPT?) that are power meters, and the dual head ones
+    PWM_MODELS = ("8161", "8162", "8163")
+    DUAL_HEAD_MODELS = ("81635", "81619")
+
+    # Allowed TLS continuous sweep speeds [nm/s] and PWM averaging times [s]
+    SWEEP_SPEEDS_NM_S = (40.0, 20.0, 10.0, 5.0, 2.0, 1.0, 0.5)
+    AVG_TIMES_S = (1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2)
+
+    def __init__(
+            self,
+            laser_gpib: str = 'GPIB0::20::INSTR',
+            detectors_gpib: Optional[list] = None,
+            visa_library: str = "",
+            timeout_ms: int = 30000):
+        self.laser_gpib = laser_gpib
+        self.detectors_gpib = detectors_gpib or []
+        self.visa_library = visa_library
+        self.timeout_ms = timeout_ms
+
+        self.rm: Optional[pyvisa.ResourceManager] = None
+        self.session = None             # laser mainframe (MF 0)
+        self.detector_sessions = []     # MF 1..n
+        self.connected = False
+        self._cancel = False
+        self.device_type = None  # Autorange results are cached per device type
+        self._power_dbm = 0.0
+
+    ######################################################################
+    # Connection
+    ######################################################################
+
+    def _open(self, addr: str):
+        inst = self.rm.open_resource(addr, timeout=self.timeout_ms)
+        inst.read_termination = "\n"
+        inst.write_termination = "\n"
+        try:
+            inst.clear()
+        except Exception:
+            pass
+        return inst
+
+    def connect(self) -> bool:
+        try:
+            self.rm = io_trace.resource_manager(self.visa_library)
+            self.session = self._open(self.laser_gpib)
+            if not self.session.query(scpi.identity()).strip():
+                return False
+            self.connected = True
+            return True
+        except Exception as e:
+            logging.error(f"[SCPI LSC] Connection error: {e}")
+            return False
+
+    def connect_mf(self) -> bool:
+        """Connect to the laser mainframe and every detector mainframe"""
+        try:
+            if not self.connect():
+                return False
+            for gpib in self.detectors_gpib:
+                self.detector_sessions.append(self._open(gpib))
+            return True
+        except Exception as e:
+            logging.error(f"[SCPI LSC] Connection error: {e}")
+            return False
+
+    @property
+    def sessions(self) -> list:
+        """Sessions indexed by MF"""
+        return [self.session] + list(self.detector_sessions)
+
+    def disconnect(self):
+        for inst in self.sessions:
+            if inst is None:
+                continue
+            try:
+                inst.close()
+            except Exception:
+                pass
+        self.session = None
+        self.detector_sessions = []
+        if self.rm:
+            try:
+                self.rm.close()
+            except Exception:
+                pass
+            self.rm = None
+        self.connected = None
+
+    def cancel(self):
+        self._cancel = True
+        try:
+            self.session.write("SOUR0:WAV:SWE STOP")
+        except Exception:
+            pass
+
+    ######################################################################
+    # Enumeration
+    ######################################################################
+
+    def enumarate_slots(self) -> List[Tuple[int, int, int, int]]:
+        """
+        Returns slot mapping built from *OPT? of every mainframe
+            [(PWMIndex, MF, Slot, Head), (...)]
+        """
+        mapping = []
+        pwm = 0
+        for mf, inst in enumerate(self.sessions):
+            idn = inst.query(scpi.identity()).strip()
+            opts = [o.strip() for o in inst.query(scpi.options()).strip().split(",")]
+            # 8164 reports the back (laser) slot 0 first, 8163/8166 start at slot 1
+            first_slot = 0 if "8164" in idn else 1
+            for i, model in enumerate(opts):
+                if not model.startswith(self.PWM_MODELS):
+                    continue
+                heads = 2 if model.startswith(self.DUAL_HEAD_MODELS) else 1
+                for head in range(heads):
+                    mapping.append((pwm, mf, first_slot + i, head))
+                    pwm += 1
+        return mapping
+
+    ######################################################################
+    # Binary transfers
+    ######################################################################
+
+    @staticmethod
+    def _query_block(inst, cmd: str, dtype: str) -> np.ndarray:
+        return query_block(inst, cmd, dtype)
+
+    def _read_pwm_log(self, inst, slot: int, head: int, points: int) -> np.ndarray:
+        return read_pwm_log(inst, slot, head, points)
+
+    ######################################################################
+    # Lambda scan
+    ######################################################################
+
+    def _laser_limits(self) -> Tuple[float, float]:
+        try:
+            lo = float(self.session.query("SOUR0:WAV? MIN").strip()) * 1e9
+            hi = float(self.session.query("SOUR0:WAV? MAX").strip()) * 1e9
+            return lo + 0.45, hi - 0.45  # Same buffer as the DLL engine
+        except Exception:
+            return 1490.0, 1640.0  # Default for 1550 lasers
+
+    def _timing(self, step_nm: float) -> Tuple[float, float]:
+        """Fastest sweep speed leaving room for >= 100 us averaging per step"""
+        for speed in self.SWEEP_SPEEDS_NM_S:
+            dwell = step_nm / speed
+            usable = [t for t in self.AVG_TIMES_S if t <= 0.8 * dwell]
+            if usable:
+                return speed, usable[-1]
+        return self.SWEEP_SPEEDS_NM_S[-1], self.AVG_TIMES_S[0]
+
+    def lambda_scan(
+        self,
+        start_nm: float = 1490.0,
+        stop_nm: float = 1600.0,
+        step_pm: float = 0.5,
+        power_dbm: float = 3.0,
+        num_scans: int = 0,
+        args: Optional[list] = None,
+        mapping: Optional[list] = None
+    ):
+        """
+        Logging mode lambda scan over all connected mainframes, same
+        parameters and result as HP816xLambdaScan.lambda_scan.
+        num_scans is not used, a logging sweep is always a single cycle.
+
+        :param mapping: [(PWMIndex, MF, Slot, Head), ...], enumerated if None
+        """
+        if not self.session:
+            raise RuntimeError("Not connected to instrument")
+        self._cancel = False
+        args = args or []
+        if mapping is None:
+            mapping = self.enumarate_slots()
+
+        # --- Normalize sweep parameters ---
+        min_wavelength, max_wavelength = self._laser_limits()
+        start_nm = max(min_wavelength, float(start_nm))
+        stop_nm = min(max_wavelength, float(stop_nm))
+        if stop_nm <= start_nm:
+            raise ValueError("stop_nm must be greater than start_nm")
+
+        step_pm = max(0.1, float(step_pm))
+        step_nm = step_pm / 1000.0
+        power_dbm = min(max(float(power_dbm), 3e-7), 13.5)
+        self._power_dbm = power_dbm
+
+        n_target = int(round((stop_nm - start_nm) / step_nm)) + 1
+        wl_target = start_nm + np.arange(n_target, dtype=np.float64) * step_nm
+
+        max_points_per_scan = 20001
+        segments = max(1, int(np.ceil(n_target / float(max_points_per_scan))))
+        speed, avg_s = self._timing(step_nm)
+
+        out_by_ch = {
+            (mf, slot, head): np.full(n_target, np.nan, dtype=np.float64)
+            for (pwm, mf, slot, head) in mapping
+        }
+        by_mf: Dict[int, list] = {}
+        for pwm, mf, slot, head in mapping:
+            by_mf.setdefault(mf, []).append((slot, head))
+
+        def progress_cb(percent, n, total, eta_seconds):
+            write_progress_file(
+                activity="Lambda Scan Stitching",
+                percent=percent,
+                eta_seconds=eta_seconds,
+                n=n,
+                total=total,
+            )
+
+        self._setup_frames(by_mf, power_dbm, speed)
+        try:
+            # VISA sessions are not thread safe: the laser frame (mf 0, self.session)
+            # is only used from this thread, the detector frames go to the pool
+            remote = {mf: chans for mf, chans in by_mf.items() if mf != 0}
+            with ThreadPoolExecutor(max_workers=max(1, len(remote))) as pool:
+                bottom_nm = float(start_nm)
+                for _ in FileProgressTqdm(
+                    range(segments),
+                    desc="Lambda Scan Stitching",
+                    unit="seg",
+                    progress_cb=progress_cb,
+                ):
+                    if self._cancel:
+                        raise RuntimeError("Cancelling Lambda Scan Stitching")
+
+                    top_nm = min(bottom_nm + (max_points_per_scan - 1) * step_nm, float(stop_nm))
+                    points_seg = int(round((top_nm - bottom_nm) / step_nm)) + 1
+                    if points_seg < 2:
+                        break
+
+                    self._apply_ranging(mapping, args, bottom_nm, top_nm)
+                    self._arm_segment(by_mf, bottom_nm, top_nm, step_nm, points_seg, avg_s)
+                    self.session.write(scpi.arm_laser_sweep(0))
+
+                    # Each detector frame waits for its own loggers and reads them back in parallel
+                    timeout_s = 2.0 * (top_nm - bottom_nm) / speed + 10.0
+                    futures = {
+                        mf: pool.submit(self._collect_frame, mf, chans, points_seg, timeout_s)
+                        for mf, chans in remote.items()
+                    }
+                    self._wait_laser(timeout_s)
+                    wl_seg_nm = self._query_block(
+                        self.session, scpi.read_laser_wavelength_log(0), "<f8") * 1e9
+                    frames = {}
+                    if 0 in by_mf:
+                        frames[0] = self._collect_frame(0, by_mf[0], points_seg, timeout_s)
+
+                    idx = np.round((wl_seg_nm - float(start_nm)) / step_nm).astype(np.int64)
+                    valid = (idx >= 0) & (idx < n_target)
+                    for mf, fut in futures.items():
+                        frames[mf] = fut.result()
+                    for mf, logs in frames.items():
+                        for (slot, head), pwr_w in logs.items():
+                            pwr_dbm = _watts_to_dbm(pwr_w)
+                            m = min(pwr_dbm.size, idx.size)
+                            ok = valid[:m]
+                            out_by_ch[(mf, slot, head)][idx[:m][ok]] = pwr_dbm[:m][ok]
+
+                    if top_nm >= stop_nm - 1e-12:
+                        break
+                    bottom_nm = top_nm + step_nm
+        finally:
+            # Also on cancel / timeout: no frame left in W with triggers and logging armed
+            self._restore_frames(by_mf)
+
+        # --- post-processing / clipping ---
+        dbm_floor = -80.0
+        for key in out_by_ch:
+            np.clip(out_by_ch[key], a_min=dbm_floor, a_max=0.0, out=out_by_ch[key])
+            if n_target > 1 and np.isnan(out_by_ch[key][-1]):
+                nz = np.where(~np.isnan(out_by_ch[key]))[0]
+                if nz.size:
+                    out_by_ch[key][-1] = out_by_ch[key][nz[-1]]
+            # Probe here first when autoranging the next device
+            range_cache.note_peak(key, wl_target, out_by_ch[key])
+
+        return {
+            "wavelengths_nm": wl_target,
+            "power_dbm_by_detector": out_by_ch,
+            "num_points": int(n_target),
+        }
+
+    def _setup_frames(self, by_mf: dict, power_dbm: float, speed: float):
+        """One time TLS / trigger / PWM unit setup for the whole scan"""
+        laser = self.session
+        laser.write(scpi.laser_power_units(0, 0))
+        laser.write(scpi.set_laser_current_power(0, power_dbm))
+        laser.write(scpi.set_laser_power_state(0, 1))
+        laser.write(scpi.set_laser_sweep_mode(0, "CONT"))
+        laser.write(scpi.set_continuous_sweep_speed(0, f"{speed}nm/s"))
+        laser.write(scpi.set_laser_sweep_cycles(0, 1))
+        laser.write(scpi.set_laser_sweep_directionality(0, "ONEW"))
+        laser.write(scpi.set_laser_output_trigger_timing(0, "STF"))
+        laser.write(scpi.set_laser_lambda_logging(0, 1))
+        for mf, chans in by_mf.items():
+            inst = self.sessions[mf]
+            inst.write(scpi.set_hardware_trigger_config("LOOP" if mf == 0 else "DEF"))
+            for slot, head in chans:
+                inst.write(scpi.power_sensor_unit(slot, head + 1, "W"))
+                inst.write(scpi.set_incoming_trigger_response(slot, "SME"))
+
+    def _arm_segment(self, by_mf, lo_nm, hi_nm, step_nm, points, avg_s):
+        laser = self.session
+        laser.write(scpi.set_sweep_wavelength(0, "STAR", f"{lo_nm}nm"))
+        laser.write(scpi.set_sweep_wavelength(0, "STOP", f"{hi_nm}nm"))
+        laser.write(scpi.set_laser_sweep_step_size(0, f"{step_nm}nm"))
+        for mf, chans in by_mf.items():
+            inst = self.sessions[mf]
+            for slot in sorted({s for s, _ in chans}):
+                inst.write(scpi.set_detector_data_acquisition(slot, "LOGG", "STOP"))
+                inst.write(scpi.set_detector_sensor_logging(slot, points, avg_s))
+                inst.write(scpi.set_detector_data_acquisition(slot, "LOGG", "STAR"))
+
+    def _wait_laser(self, timeout_s: float):
+        t0 = time.time()
+        while True:
+            if self._cancel:
+                raise RuntimeError("Cancelling Lambda Scan")
+            state = self.session.query("SOUR0:WAV:SWE?").strip()
+            if state.lstrip("+").startswith("0"):
+                return
+            if time.time() - t0 > timeout_s:
+                raise TimeoutError("TLS sweep did not finish")
+            time.sleep(0.05)
+
+    def _collect_frame(self, mf, chans, points, timeout_s) -> Dict[Tuple[int, int], np.ndarray]:
+        """Wait for logging to complete on one frame and read all of its channels"""
+        inst = self.sessions[mf]
+        t0 = time.time()
+        pending = set(chans)
+        while pending:
+            if self._cancel:
+                raise RuntimeError("Cancelling Lambda Scan")
+            for slot, head in list(pending):
+                state = inst.query(scpi.power_sensor_logging_state(slot, head + 1)).strip()
+                if "COMPLETE" in state.upper():
+                    pending.discard((slot, head))
+            if pending:
+                if time.time() - t0 > timeout_s:
+                    raise TimeoutError(f"Logging did not complete on MF {mf}: {sorted(pending)}")
+                time.sleep(0.05)
+        return {
+            (slot, head): self._read_pwm_log(inst, slot, head, points)
+            for slot, head in chans
+        }
+
+    def _restore_frames(self, by_mf: dict):
+        """Stop logging, back to dBm / autorange like the DLL leaves things"""
+        try:
+            self.session.write(scpi.set_laser_lambda_logging(0, 0))
+        except Exception:
+            pass
+        for mf, chans in by_mf.items():
+            inst = self.sessions[mf]
+            for slot, head in chans:
+                try:
+                    inst.write(scpi.set_detector_data_acquisition(slot, "LOGG", "STOP"))
+                    inst.write(scpi.power_sensor_unit(slot, head + 1, "DBM"))
+                    inst.write(scpi.set_incoming_trigger_response(slot, "IGN"))
+                except Exception:
+                    pass
+
+    ######################################################################
+    # Ranging
+    ######################################################################
+
+    def _apply_ranging(self, mapping, args_list, lo_nm, hi_nm):
+        """
+        Logging needs a fixed range. Manual entries are applied directly,
+        range=None reuses the range cached for the device type, or probes the
+        segment with autorange on (see NIR.utils.autorange) and locks the
+        range found, rounded up to the next 10 dBm like the DLL engine.
+        """
+        args_dict = {}
+        for slot, mf, _, rng in args_list:
+            args_dict[(mf, slot)] = rng
+
+        def lock(mf, slot, head, rng):
+            inst = self.sessions[mf]
+            inst.write(f"SENS{slot}:CHAN{head + 1}:POW:RANG:AUTO 0")
+            inst.write(scpi.set_power_sensor_range(slot, head + 1, f"{rng}DBM"))
+
+        auto = []
+        for _, mf, slot, head in mapping:
+            rng = args_dict.get((mf, slot), 0.0)  # Default to 0 dBm
+            if rng is None:
+                # Same device type, band and power as before: reuse its range
+                rng = range_cache.get(self.device_type, (mf, slot, head), lo_nm, hi_nm, self._power_dbm)
+            if rng is None:
+                auto.append((mf, slot, head))
+            else:
+                lock(mf, slot, head, rng)
+        if not auto:
+            return
+
+        by_mf: Dict[int, list] = {}
+        for mf, slot, head in auto:
+            self.sessions[mf].write(f"SENS{slot}:CHAN{head + 1}:POW:RANG:AUTO 1")
+            by_mf.setdefault(mf, []).append((slot, head))
+
+        def read_frame(mf):
+            inst = self.sessions[mf]
+            return [float(inst.query(scpi.read_power(slot, head + 1)).strip())
+                    for slot, head in by_mf[mf]]
+
+        # Band edges plus last peaks only, one TLS move each, frames read in parallel
+        readings = {key: [] for key in auto}
+        hints = [range_cache.peak_hint(key) for key in auto]
+        with ThreadPoolExecutor(max_workers=len(by_mf)) as pool:
+            for wl in probe_wavelengths(lo_nm, hi_nm, hints):
+                self.session.write(scpi.set_laser_current_wavelength(0, wl))
+                time.sleep(0.05)
+                for mf, values in zip(by_mf, pool.map(read_frame, by_mf)):
+                    p = _watts_to_dbm(np.asarray(values, dtype=np.float64))
+                    for (slot, head), v in zip(by_mf[mf], p):
+                        readings[(mf, slot, head)].append(v)
+
+        for (mf, slot, head), values in readings.items():
+            rng = range_for(values)
+            range_cache.put(self.device_type, (mf, slot, head), lo_nm, hi_nm, self._power_dbm, rng)
+            lock(mf, slot, head, rng)
@@ -1,4 +1,3 @@
-import ctypes
 import numpy as np
 import pyvisa
 import pandas as pd
@@ -11,7 +10,7 @@ from ctypes import (c_double,
                     POINTER,
                     byref,
                     create_string_buffer)
-from math import ceil, floor, log10
+from math import log10
 from typing import Optional
 from tqdm import tqdm
 import time
@@ -23,6 +22,8 @@ pyvisa_logger = logging.getLogger('pyvisa')
 pyvisa_logger.setLevel(logging.WARNING)
 
 from utils.progress_write_helpers import FileProgressTqdm, write_progress_file
+from NIR.utils.autorange import probe_wavelengths, range_for, range_cache
+from utils import io_trace
 
 """
 This class currently has a few working implemenations and variations
@@ -66,8 +67,8 @@ class HP816xLambdaScan:
             detectors_gpib: Optional[list] = None):
         # Load the HP 816x library
         self.gpib_addr = gpib_addr
-        self.lib = ctypes.WinDLL("C:\\Program Files\\IVI Foundation\\VISA\\Win64\\Bin\\hp816x_64.dll")  # or .lib path
-        self.visa_lib = ctypes.WinDLL("visa32.dll")
+        self.lib = io_trace.load_library("C:\\Program Files\\IVI Foundation\\VISA\\Win64\\Bin\\hp816x_64.dll")  # or .lib path
+        self.visa_lib = io_trace.load_library("visa32.dll")
         self.session = None
         self.detector_sessions = []  # Should contain non (primary) laser 816x or N77xx detectors
         self.laser_gpib = laser_gpib
@@ -75,6 +76,8 @@ class HP816xLambdaScan:
         self.connected = False
         self._setup_function_prototypes()
         self._cancel = False
+        self.device_type = None  # Autorange results are cached per device type
+        self._power_dbm = 0.0
 
     def _setup_function_prototypes(self):
         ###################################################
@@ -395,7 +398,8 @@ class HP816xLambdaScan:
         step_pm: float = 0.5,
         power_dbm: float = 3.0,
         num_scans: int = 0,
-        args: Optional[list] = None
+        args: Optional[list] = None,
+        mapping: Optional[list] = None
     ):
         """
         Multiframe lambda scan that works for all registered mainframes.
@@ -413,28 +417,27 @@ class HP816xLambdaScan:
         :param num_scans: Num of scans, 0-indexed
         :type num_scans: int
         :param args: Detector window params, for ranging, and referencing
-                     Set range=None for Autoranging option, but is Beta and slower
+                     Set range=None for Autoranging (cached per device_type)
                      Pass as a list of 4-tuples, e.g.
                             args = [(slot, mf, ref, range), (...)]
                         Defaults to 0 dBm manual ranging
         :type args: Optional[list]
+        :param mapping: [(PWMIndex, MF, Slot, Head), ...] from an earlier
+                        enumeration (cached topology), enumerated if None
+        :type mapping: Optional[list]
         """
 
         # --- Safety Checks ---
         if not self.session:
             raise RuntimeError("Not connected to instrument")
 
-        # --- Detect PWM channels, and enumerate ---
-        # --- This will dynamically allocate PWM chns, heads, slots ---
-        n_pwm = c_int32()
-        self.lib.hp816x_getNoOfRegPWMChannels_Q(self.session, byref(n_pwm))
-        n_pwm = n_pwm.value
-
         # --- Determine Detector settings using map ---
         # list of 3 tuples -> PWMIndex, MF, Slot, Head
         # This will be passed with args into 
         # Apply ranging for each slot, head
-        mapping = self.get_pwm_map(n_pwm)
+        if mapping is None:
+            mapping = self.enumarate_slots()
+        n_pwm = len(mapping)
         
         # --- Get laser limits for sweep ---
         min_wl = c_double()
@@ -479,6 +482,7 @@ class HP816xLambdaScan:
             power_dbm = 3e-7
         if power_dbm > 13.5:
             power_dbm = 13.5
+        self._power_dbm = power_dbm
 
         # target wavelength grid (what we return)
         n_target = int(round((stop_nm - start_nm) / step_nm)) + 1
@@ -636,6 +640,8 @@ class HP816xLambdaScan:
                 nz = np.where(~np.isnan(out_by_ch[key]))[0]
                 if nz.size:
                     out_by_ch[key][-1] = out_by_ch[key][nz[-1]]
+            # Probe here first when autoranging the next device
+            range_cache.note_peak(key, wl_target, out_by_ch[key])
 
         return {
             "wavelengths_nm": wl_target,
@@ -645,19 +651,23 @@ class HP816xLambdaScan:
 
     def apply_ranging(self, mapping, args_list, btm_wl, top_wl):
         """
+        Manual entries are applied directly, range=None entries are
+        autoranged together (see apply_auto_ranging)
         """
         args_dict = {}
         for slot, mf, _, range in args_list:
             args_dict[(mf,slot)] = range
 
+        auto = []
         for pwm, mf, slot, head in mapping:
             range_dbm = args_dict.get((mf,slot), 0.0)  # Default to 0 dBm
             if range_dbm is None:
-                # print(f'Applying Autoranging for slot: {slot}, {pwm},{head}')
-                self.apply_auto_ranging(pwm, slot, head, (btm_wl, top_wl))
+                auto.append((pwm, mf, slot, head))
             else:
                 # print(f'Applying Manual Ranging for slot: {slot}, {pwm},{head}')
                 self.apply_manual_ranging(pwm, slot, head, range_dbm)
+        if auto:
+            self.apply_auto_ranging(auto, (btm_wl, top_wl))
 
     def apply_manual_ranging(self, pwm, slot, head, range_dbm):
         """Apply manual power ranging to all PWM channels."""
@@ -680,73 +690,58 @@ class HP816xLambdaScan:
         self.check(st, f"set_PWM_powerRange failed (slot {slot}, head {head})")
         time.sleep(0.15)
 
-    def apply_auto_ranging(self, pwm, slot, head, wl_len):
+    def apply_auto_ranging(self, channels, wl_len):
         """
-        Apply Autoranging by querying range value detected by autorange
-        For values throughout the wavelength sweep
+        Autorange channels [(pwm, mf, slot, head), ...] over wl_len (m).
+
+        Ranges chosen earlier for the same device type, channel, band and
+        laser power are reused as is. The rest are probed at the band edges
+        and where each channel peaked on the previous device: one TLS move
+        per probe wavelength, every head read there, then the range fitting
+        the strongest sane reading is locked.
         """
-        # --- Get wl span ---
-        wl_span = float(wl_len[1]) - float(wl_len[0])
-        steps = int(max(2, floor(wl_span / 5e-9)))
-        wl_samples = np.linspace(wl_len[0], wl_len[1], steps)
-        if wl_samples.size <= 1:
-            # If no values are found, small reading
-            # Take the bottom and top of wavelength
-            wl_samples = [wl_len[0], wl_len[1]]
-
-        # -- Step the span, fetch PWM readings ---
-        pwm_list = []
-        for wl in wl_samples:
+        lo_nm, hi_nm = float(wl_len[0]) * 1e9, float(wl_len[1]) * 1e9
+
+        todo = []
+        for pwm, mf, slot, head in channels:
+            cached = range_cache.get(self.device_type, (mf, slot, head), lo_nm, hi_nm, self._power_dbm)
+            if cached is not None:
+                self.apply_manual_ranging(pwm, slot, head, cached)
+            else:
+                todo.append((pwm, mf, slot, head))
+        if not todo:
+            return
+
+        # Let the meters find their own range while probing, note W vs dBm once
+        watts = {}
+        for pwm, mf, slot, head in todo:
+            self.lib.hp816x_set_PWM_powerRange(self.session, slot, head, 1, c_double(0))
+            ptype = c_int32()
+            self.lib.hp816x_get_PWM_powerUnit_Q(self.session, slot, head, byref(ptype))
+            watts[pwm] = ptype.value == 1
+
+        hints = [range_cache.peak_hint((mf, slot, head)) for _, mf, slot, head in todo]
+        readings = {pwm: [] for pwm, _, _, _ in todo}
+        for wl_nm in probe_wavelengths(lo_nm, hi_nm, hints):
             self.lib.hp816x_set_TLS_wavelength(
                 self.session,
                 c_int32(0),
                 c_int32(3),  # Manual
-                c_double(wl)  # in m
+                c_double(wl_nm * 1e-9)  # in m
             )
             time.sleep(0.05)
-            sample = c_double()
-            self.lib.hp816x_PWM_fetchValue(
-                self.session,
-                slot,
-                head,
-                byref(sample)
-            )
-            # Get the power unit
-            ptype = c_int32()
-            self.lib.hp816x_get_PWM_powerUnit_Q(
-                self.session,
-                slot,
-                head,
-                byref(ptype)
-            )
-            if ptype.value == 1:
-                sample = watts_to_dbm(sample.value)
-                pwm_list.append(sample)
-                continue
-            pwm_list.append(sample.value)
-        
-        # Filter nan readings
-        pwm_arr = np.array(pwm_list, dtype=float)
-        pwm_arr = np.nan_to_num(pwm_arr, nan=-np.inf)
-
-        # Filter -> sane readings
-        get_sane = pwm_arr[pwm_arr > -70.0]
-        final_arr = get_sane[get_sane <= 0.0]
-        
-        if len(final_arr) == 0:
-            # We are in noise
-            self.apply_manual_ranging(pwm, slot, head, -20.0)
-            return
-        
-        # --- Determine range ---
-        # Some cases the reading may span a larger range than 43 dBm
-        # But those values will at LEAST be = 40 dBm if we have incredible 
-        # Coupling; this is not a valid reading for autoranging. If a
-        # but more realistically will be around 50 dBm or 60 dBm 
-        # Which ends up being noise in most cases. 
-        p_max = max(final_arr)
-        range_val = ceil(p_max / 10) * 10
-        self.apply_manual_ranging(pwm, slot, head, range_val)
+            for pwm, mf, slot, head in todo:
+                sample = c_double()
+                self.lib.hp816x_PWM_fetchValue(self.session, slot, head, byref(sample))
+                readings[pwm].append(
+                    watts_to_dbm(sample.value) if watts[pwm] else sample.value)
+
+        # Some cases the reading may span a larger range than 43 dBm,
+        # anything below -70 dBm is noise and ends up at -20 dBm
+        for pwm, mf, slot, head in todo:
+            range_val = range_for(readings[pwm])
+            range_cache.put(self.device_type, (mf, slot, head), lo_nm, hi_nm, self._power_dbm, range_val)
+            self.apply_manual_ranging(pwm, slot, head, range_val)
 
     def get_pwm_map(self, n_pwm):
         """Return list of tuples (pwmIndex, MF, slot, head)."""
@@ -0,0 +1,86 @@
+import logging
+
+import numpy as np
+
+from NIR.config.nir_config import NIRConfiguration
+from NIR.nir_manager import NIRManager
+from NIR.utils.spectrum_result import SpectrumResult
+
+"""
+NIRManager.adaptive_sweep against a stub controller returning
+SpectrumResult, like NIR8164.optical_sweep does. No instrument needed:
+
+    python -m NIR.test_adaptive_sweep
+"""
+
+DIPS_NM = (1530.0, 1547.3, 1562.8)
+
+
+def _spectrum(wl):
+    """-5 dBm baseline with a few 20 dB deep Lorentzian dips"""
+    lin = np.ones_like(wl)
+    for c in DIPS_NM:
+        lin -= 0.99 / (1.0 + ((wl - c) / 0.05) ** 2)
+    return 10.0 * np.log10(np.clip(lin, 1e-6, None)) - 5.0
+
+
+class StubController:
+    def __init__(self):
+        self.calls = []
+
+    def optical_sweep(self, start_nm, stop_nm, step_nm, laser_power_dbm, num_scans=0, args=[]):
+        self.calls.append((start_nm, stop_nm, step_nm))
+        n = int(round((stop_nm - start_nm) / step_nm)) + 1
+        wl = start_nm + np.arange(n) * step_nm
+        y = _spectrum(wl)
+        return SpectrumResult(wl, np.vstack([y, y - 1.0]), [(0, 1, 0), (0, 1, 1)])
+
+    def cleanup_scan(self):
+        pass
+
+    def set_wavelength(self, wl):
+        pass
+
+    def configure_units(self):
+        pass
+
+
+def _manager(controller):
+    mgr = NIRManager.__new__(NIRManager)
+    mgr.config = NIRConfiguration()
+    mgr.debug = False
+    mgr.logger = logging.getLogger("test_adaptive_sweep")
+    mgr.controller = controller
+    mgr._connected = True
+    mgr.slot_info = [(0, 1, 0), (0, 1, 1)]
+    return mgr
+
+
+def test_adaptive_sweep_refines_spectrum_result():
+    ctrl = StubController()
+    res = _manager(ctrl).adaptive_sweep(1520.0, 1570.0, 0.001, 0.0,
+                                        coarse_step_nm=0.01, window_nm=0.5)
+    assert res is not None
+
+    # Coarse axis read as wavelengths: every dip is inside a fine window
+    # (the maxima between dips are features too, at most one each)
+    windows = res["windows_nm"]
+    assert len(DIPS_NM) <= len(windows) <= 2 * len(DIPS_NM) - 1
+    assert len(ctrl.calls) == 1 + len(windows)
+    for c in DIPS_NM:
+        assert any(lo <= c <= hi for lo, hi in windows)
+
+    wl = res["wavelengths_nm"]
+    assert np.all(np.diff(wl) >= 0)
+    assert wl[0] == 1520.0 and wl[-1] == 1570.0
+    assert res["fine_mask"].sum() > 0
+
+    # Merged traces are the detector data on that axis, not shifted columns
+    assert len(res["power_dbm"]) == 2
+    np.testing.assert_allclose(res["power_dbm"][0], _spectrum(wl), atol=1e-9)
+    np.testing.assert_allclose(res["power_dbm"][1], _spectrum(wl) - 1.0, atol=1e-9)
+
+
+if __name__ == "__main__":
+    test_adaptive_sweep_refines_spectrum_result()
+    print("ok")
@@ -0,0 +1,101 @@
+import threading
+from math import ceil
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+"""
+Detector autoranging helpers shared by the lambda scan engines.
+
+Logging / lambda scans need a fixed power meter range, so "auto" means:
+probe the band at a few wavelengths with the meters autoranging, then lock
+the range that fits the strongest reading. Instead of stepping the laser
+every 5 nm for each head separately, the engines now
+    - probe only the band edges plus where the previous device peaked
+    - read every autoranged head at each probe wavelength (one TLS move)
+    - remember the chosen range per device type, so repeated device types
+      on a chip skip the probing entirely
+
+range_cache is module level so it outlives the per sweep engine objects.
+"""
+
+SANE_MIN_DBM = -70.0   # below this a reading is treated as noise
+NOISE_RANGE_DBM = -20.0
+MIN_PROBE_SPACING_NM = 1.0
+
+
+def probe_wavelengths(lo_nm: float, hi_nm: float,
+                      hints_nm: Iterable[float] = ()) -> List[float]:
+    """Band edges plus hinted peak wavelengths inside the band (band centre without hints)"""
+    lo_nm, hi_nm = float(lo_nm), float(hi_nm)
+    inner = [float(h) for h in hints_nm if h is not None and lo_nm < h < hi_nm]
+    if not inner:
+        inner = [0.5 * (lo_nm + hi_nm)]
+    out: List[float] = []
+    for wl in sorted([lo_nm, hi_nm] + inner):
+        if not out or wl - out[-1] >= MIN_PROBE_SPACING_NM:
+            out.append(wl)
+    if out[-1] != hi_nm and hi_nm - lo_nm >= MIN_PROBE_SPACING_NM:
+        out[-1] = hi_nm  # keep the band edge rather than a hint next to it
+    return out
+
+
+def range_for(readings_dbm) -> float:
+    """Range [dBm] for the strongest sane reading, rounded up to 10 dB; noise -> -20 dBm"""
+    p = np.asarray(readings_dbm, dtype=np.float64)
+    p = p[np.isfinite(p) & (p > SANE_MIN_DBM) & (p <= 0.0)]
+    if p.size == 0:
+        return NOISE_RANGE_DBM
+    return float(ceil(p.max() / 10.0) * 10)
+
+
+class RangeCache:
+    def __init__(self):
+        self._ranges: Dict[Hashable, float] = {}
+        self._peaks: Dict[Tuple[int, int, int], float] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(device_type, channel, lo_nm, hi_nm, power_dbm):
+        return (str(device_type), tuple(channel), round(float(lo_nm), 1),
+                round(float(hi_nm), 1), round(float(power_dbm), 1))
+
+    def get(self, device_type, channel, lo_nm, hi_nm, power_dbm) -> Optional[float]:
+        """Range chosen before for this device type / channel / band / laser power"""
+        if not device_type:
+            return None
+        with self._lock:
+            rng = self._ranges.get(self._key(device_type, channel, lo_nm, hi_nm, power_dbm))
+            if rng is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return rng
+
+    def put(self, device_type, channel, lo_nm, hi_nm, power_dbm, range_dbm: float) -> None:
+        if not device_type:
+            return
+        with self._lock:
+            self._ranges[self._key(device_type, channel, lo_nm, hi_nm, power_dbm)] = float(range_dbm)
+
+    def note_peak(self, channel, wl_nm, power_dbm) -> None:
+        """Remember where a channel peaked in its last sweep"""
+        p = np.asarray(power_dbm, dtype=np.float64)
+        if p.size == 0 or not np.isfinite(p).any():
+            return
+        with self._lock:
+            self._peaks[tuple(channel)] = float(np.asarray(wl_nm)[int(np.nanargmax(p))])
+
+    def peak_hint(self, channel) -> Optional[float]:
+        with self._lock:
+            return self._peaks.get(tuple(channel))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ranges.clear()
+            self._peaks.clear()
+
+
+range_cache = RangeCache()
@@ -1,22 +1,28 @@
 import pyvisa as visa
 import re
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 
+from NIR.utils.topology_cache import identify, topology_cache
+
 """
 Device mapper to get PWM and TLS slots from VISA address
 To be used in nir controllers
+Results are cached per (address, *IDN?, *OPT?), a known device costs two
+queries instead of one per slot
 Cameron Basara, 2025
 """
 
 @dataclass
 class DeviceSlots:
     """Container for TLS and PWM info"""
-    visa_addr: str
-    model: str
-    TLS: List = [] # TLS slot numbs
-    PWM: List
+    visa_addr: str = ""
+    model: str = ""
+    TLS: List = field(default_factory=list) # TLS slot numbs
+    PWM: List = field(default_factory=list)
+    ATT: List = field(default_factory=list)
+    SWITCH: List = field(default_factory=list)
 
     def __repr__(self):
         return (f"{self.model} @ {self.visa_addr}: "
@@ -53,6 +59,11 @@ class DeviceMap():
         for visa_addr in self.visa_list:
             try:
                 dev = self._enumerate_device(visa_addr)
+                if dev is not None:
+                    self.instruments[visa_addr] = dev
+            except Exception as e:
+                print(f'[Device Mapper] {visa_addr} failed: {e}')
+        return self.instruments
     
     def _enumerate_device(self, visa_addr):
         """
@@ -64,19 +75,32 @@ class DeviceMap():
         try:
             # Connect to instr and identify
             inst = self.rm.open_resource(visa_addr)
-            idn = self._q(inst, "*IDN?")
+            frame = [identify(visa_addr, inst)]
+            idn = frame[0][1]
             parts = idn.split(',')
             model = parts[1].strip() if len(parts) > 1 else "Unknown"
 
+            cached = topology_cache.get_extra(frame)
+            if cached:
+                return DeviceSlots(visa_addr=visa_addr, model=model,
+                                   **{k: list(v) for k, v in cached.items()})
+
             # Device type and enumerate
             if "816" in model:
                 enumed_device = self._get_816x(inst, model)
             elif "N77" in model:
-                enumed_device = self._get_n77(inst, model)
+                enumed_device = self._get_N77(inst, model)
             else:
                 print(f'[Device Mapper] Device unknown')
                 return None
+            topology_cache.put(frame, extra={
+                "TLS": enumed_device.TLS, "PWM": enumed_device.PWM,
+                "ATT": enumed_device.ATT, "SWITCH": enumed_device.SWITCH,
+            })
             return enumed_device
+        except Exception as e:
+            print(f'[Device Mapper] Enumeration of {visa_addr} failed: {e}')
+            return None
     
     def _get_816x(self, inst, model):
         plugins = {
@@ -143,7 +167,9 @@ class DeviceMap():
                 ("N7745A", 8),  
                 ("N7747A", 2),  
                 ("N7748A", 4),  
-            ]
+            ],
+            "ATT": [],
+            "SWITCH": [],
         }
 
 
@@ -155,10 +181,10 @@ class DeviceMap():
             try:
                 res = self._q(inst, f":SLOT[{slot}]:IDN?")
                 idn = res.split(',')[1].strip()
-                if idn in plugins["TLS"]:
+                if idn in [m for m, _ in plugins["TLS"]]:
                     tls_list.append(slot)
                     continue
-                if idn in plugins["PWM"]:
+                if idn in [m for m, _ in plugins["PWM"]]:
                     pwm_list.append(slot)
                     continue
                 if idn in plugins["ATT"]:
@@ -0,0 +1,177 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+"""
+Reference spectra (fiber to fiber / loopback) for normalising sweeps.
+
+References are kept per detector channel, (mf, slot, head), and per sweep
+grid, so a detector can hold references taken on several grids. A device
+sweep is normalised by a vectorized dB subtraction against the reference
+whose grid matches exactly, or else the finest one covering the sweep,
+interpolated onto the sweep grid. Interpolations are cached per
+(channel, reference grid, target grid), so a batch of devices swept on the
+same grid only interpolates once.
+
+Files: .npz (save / load, keeps channels and grids) or the Spectrum CSV
+written by lib_gui.plot ("Wavelength [nm]", "Detector 1", ...), whose
+columns map onto the given channels in order.
+"""
+
+GridKey = Tuple
+
+
+def grid_key(wl_nm) -> GridKey:
+    """Hashable signature of a wavelength grid"""
+    wl = np.asarray(wl_nm, dtype=np.float64)
+    if wl.size < 2:
+        return ("p", tuple(np.round(wl, 6)))
+    d = np.diff(wl)
+    if np.allclose(d, d[0], rtol=0.0, atol=1e-7):
+        return ("u", round(float(wl[0]), 6), round(float(d[0]), 7), int(wl.size))
+    return ("h", int(wl.size), hash(np.round(wl, 6).tobytes()))
+
+
+class ReferenceStore:
+    def __init__(self, max_cached: int = 64):
+        # channel -> grid key -> (wl_nm, power_dbm)
+        self._refs: Dict[Hashable, Dict[GridKey, Tuple[np.ndarray, np.ndarray]]] = {}
+        self._cache: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_cached = max_cached
+        self.source: Optional[str] = None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    ######################################################################
+    # References
+    ######################################################################
+
+    def set_reference(self, channel: Sequence[int], wl_nm, power_dbm) -> None:
+        wl = np.asarray(wl_nm, dtype=np.float64).ravel()
+        p = np.asarray(power_dbm, dtype=np.float64).ravel()
+        if wl.size != p.size or wl.size < 2:
+            raise ValueError("reference needs matching wavelength / power arrays (>= 2 points)")
+        order = np.argsort(wl)
+        wl, p = wl[order], p[order]
+        with self._lock:
+            self._refs.setdefault(tuple(channel), {})[grid_key(wl)] = (wl, p)
+            # Anything interpolated for this channel may now pick another reference
+            for k in [k for k in self._cache if k[0] == tuple(channel)]:
+                del self._cache[k]
+
+    def set_from_sweep(self, wl_nm, powers_dbm, channels: List[Sequence[int]]) -> None:
+        """One reference per channel from a sweep result (rows in channel order)"""
+        for ch, p in zip(channels, powers_dbm):
+            self.set_reference(ch, wl_nm, p)
+
+    def channels(self) -> List[tuple]:
+        with self._lock:
+            return list(self._refs)
+
+    def has(self, channel: Sequence[int]) -> bool:
+        with self._lock:
+            return bool(self._refs.get(tuple(channel)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._refs.clear()
+            self._cache.clear()
+            self.source = None
+
+    def _pick(self, channel: tuple, target: np.ndarray, tkey: GridKey):
+        """Exact grid match, else the finest reference covering the target span"""
+        refs = self._refs.get(channel)
+        if not refs:
+            return None, None
+        if tkey in refs:
+            return tkey, refs[tkey]
+        lo, hi = np.nanmin(target), np.nanmax(target)
+        best = None
+        for key, (wl, p) in refs.items():
+            covers = wl[0] <= lo + 1e-9 and wl[-1] >= hi - 1e-9
+            step = (wl[-1] - wl[0]) / (wl.size - 1)
+            rank = (not covers, step)
+            if best is None or rank < best[0]:
+                best = (rank, key, (wl, p))
+        return best[1], best[2]
+
+    def interpolated(self, channel: Sequence[int], wl_nm) -> Optional[np.ndarray]:
+        """Reference of channel on grid wl_nm [dBm], NaN outside its span, None if unknown"""
+        channel = tuple(channel)
+        target = np.asarray(wl_nm, dtype=np.float64)
+        tkey = grid_key(target)
+        with self._lock:
+            rkey, ref = self._pick(channel, target, tkey)
+            if ref is None:
+                return None
+            ckey = (channel, rkey, tkey)
+            hit = self._cache.get(ckey)
+            if hit is not None:
+                self._cache.move_to_end(ckey)
+                self.cache_hits += 1
+                return hit
+            self.cache_misses += 1
+
+        wl, p = ref
+        if rkey == tkey:
+            out = p
+        else:
+            out = np.interp(target, wl, p, left=np.nan, right=np.nan)
+        out = np.asarray(out)
+        out.setflags(write=False)
+        with self._lock:
+            self._cache[ckey] = out
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        return out
+
+    ######################################################################
+    # Normalisation
+    ######################################################################
+
+    def normalise(self, wl_nm, powers_dbm, channels: List[Sequence[int]]) -> np.ndarray:
+        """
+        Insertion loss [dB] = device [dBm] - reference [dBm], per channel row.
+        Rows without a reference are NaN.
+        """
+        p = np.atleast_2d(np.asarray(powers_dbm, dtype=np.float64))
+        ref = np.full(p.shape, np.nan)
+        for i, ch in enumerate(channels[:p.shape[0]]):
+            r = self.interpolated(ch, wl_nm)
+            if r is not None:
+                ref[i] = r
+        return p - ref
+
+    ######################################################################
+    # Files
+    ######################################################################
+
+    def save(self, path: str) -> None:
+        arrays = {}
+        with self._lock:
+            n = 0
+            for ch, refs in self._refs.items():
+                for wl, p in refs.values():
+                    arrays[f"ch{n}"] = np.asarray(ch, dtype=np.int64)
+                    arrays[f"wl{n}"] = wl
+                    arrays[f"p{n}"] = p
+                    n += 1
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(path, count=n, **arrays)
+
+    def load(self, path: str, channels: Optional[List[Sequence[int]]] = None) -> None:
+        """Load .npz (from save) or a Spectrum CSV (needs channels, in column order)"""
+        if path.lower().endswith(".npz"):
+            with np.load(path) as z:
+                for n in range(int(z["count"])):
+                    self.set_reference(tuple(int(v) for v in z[f"ch{n}"]), z[f"wl{n}"], z[f"p{n}"])
+        else:
+            if channels is None:
+                raise ValueError("CSV references need the channel list for their columns")
+            data = np.loadtxt(path, delimiter=",", skiprows=1, ndmin=2)
+            self.set_from_sweep(data[:, 0], data[:, 1:].T, channels)
+        self.source = path
@@ -0,0 +1,79 @@
+import numpy as np
+from typing import Optional
+
+"""
+Per point running statistics for repeated sweeps (Welford's algorithm).
+
+Power is accumulated in linear units (mW) so averaging is physically
+correct, and converted back to dBm on the way out. Only the mean, M2 and
+count arrays are kept, never the individual repetitions.
+"""
+
+_DB_PER_REL = 10.0 / np.log(10.0)  # d(dB) / d(ln P)
+
+
+class RunningStats:
+    def __init__(self):
+        self.count: Optional[np.ndarray] = None
+        self.mean: Optional[np.ndarray] = None   # mW
+        self.m2: Optional[np.ndarray] = None     # mW^2
+        self.n_updates = 0
+
+    def update_dbm(self, power_dbm) -> None:
+        """Add one repetition, shape (n_points,) or (n_channels, n_points), NaN skipped"""
+        p_dbm = np.asarray(power_dbm, dtype=np.float64)
+        self.update_mw(np.power(10.0, p_dbm / 10.0))
+
+    def update_mw(self, power_mw) -> None:
+        x = np.asarray(power_mw, dtype=np.float64)
+        if self.mean is None:
+            self.count = np.zeros(x.shape, dtype=np.int64)
+            self.mean = np.zeros(x.shape, dtype=np.float64)
+            self.m2 = np.zeros(x.shape, dtype=np.float64)
+        elif x.shape != self.mean.shape:
+            raise ValueError(f"shape mismatch: {x.shape} vs {self.mean.shape}")
+
+        valid = np.isfinite(x)
+        self.count += valid
+        delta = np.where(valid, x - self.mean, 0.0)
+        n = np.maximum(self.count, 1)
+        self.mean += delta / n
+        self.m2 += delta * np.where(valid, x - self.mean, 0.0)
+        self.n_updates += 1
+
+    @property
+    def variance_mw(self) -> np.ndarray:
+        """Sample variance (ddof=1), NaN where fewer than 2 samples"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2 / (self.count - 1), np.nan)
+
+    @property
+    def mean_dbm(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.count > 0, 10.0 * np.log10(self.mean), np.nan)
+
+    @property
+    def std_db(self) -> np.ndarray:
+        """Per point standard deviation expressed in dB (relative to the mean)"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return _DB_PER_REL * np.sqrt(self.variance_mw) / self.mean
+
+    @property
+    def sem_db(self) -> np.ndarray:
+        """Per point standard error of the mean in dB"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.std_db / np.sqrt(self.count)
+
+    def max_sem_db(self, min_dbm: Optional[float] = None) -> float:
+        """
+        Worst standard error over all points, inf until it can be estimated.
+        Points with a mean below min_dbm (noise floor) are ignored.
+        """
+        if self.mean is None or self.n_updates < 2:
+            return float("inf")
+        sem = self.sem_db
+        keep = np.isfinite(sem)
+        if min_dbm is not None:
+            keep &= self.mean_dbm > min_dbm
+        sem = sem[keep]
+        return float(sem.max()) if sem.size else float("inf")
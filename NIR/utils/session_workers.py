@@ -0,0 +1,91 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, List
+
+"""
+One worker thread per instrument session.
+
+Each GPIB / LAN session is independent, so operations on different
+mainframes can overlap, while everything sent to one session stays on a
+single thread and in order (VISA sessions are not safe to share between
+threads mid transaction).
+
+    workers = SessionWorkers()
+    powers = workers.run_grouped(targets, key=lambda t: t[0], fn=read_one)
+
+Results come back in the order of the input, whatever order the frames
+answered in.
+"""
+
+
+class SessionWorkers:
+    def __init__(self, name: str = "nir-io"):
+        self.name = name
+        self._executors: Dict[Hashable, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _executor(self, key: Hashable) -> ThreadPoolExecutor:
+        with self._lock:
+            ex = self._executors.get(key)
+            if ex is None:
+                ex = ThreadPoolExecutor(max_workers=1,
+                                        thread_name_prefix=f"{self.name}-{key}")
+                self._executors[key] = ex
+            return ex
+
+    @property
+    def in_worker(self) -> bool:
+        return getattr(self._local, "active", False)
+
+    def _run_serial(self, fn: Callable, items: List) -> List:
+        self._local.active = True
+        try:
+            return [fn(item) for item in items]
+        finally:
+            self._local.active = False
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """Queue fn on the worker of session key, returns a Future"""
+        return self._executor(key).submit(fn, *args, **kwargs)
+
+    def run_grouped(self, items: Iterable, key: Callable[[Any], Hashable],
+                    fn: Callable[[Any], Any]) -> List:
+        """
+        fn(item) for every item. Items with the same key run in order on
+        that key's worker, different keys run concurrently. Returns the
+        results in input order; the first exception is raised once every
+        group has finished.
+        """
+        items = list(items)
+        groups: "OrderedDict[Hashable, List[int]]" = OrderedDict()
+        for i, item in enumerate(items):
+            groups.setdefault(key(item), []).append(i)
+
+        # Single session, or already on a worker (submitting to our own
+        # executor would deadlock): run inline
+        if len(groups) <= 1 or self.in_worker:
+            return [fn(item) for item in items]
+
+        futures = {
+            k: self.submit(k, self._run_serial, fn, [items[i] for i in idxs])
+            for k, idxs in groups.items()
+        }
+        results: List[Any] = [None] * len(items)
+        error = None
+        for k, idxs in groups.items():
+            try:
+                for i, r in zip(idxs, futures[k].result()):
+                    results[i] = r
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return results
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executors, self._executors = list(self._executors.values()), {}
+        for ex in executors:
+            ex.shutdown(wait=True)
@@ -0,0 +1,88 @@
+import threading
+from typing import Any, Dict, Hashable, Optional
+
+"""
+Write-through shadow registers for instrument settings.
+
+Controllers record every setting they successfully write (or read back)
+and ask the shadow before writing again; a write of the value the
+instrument already holds is skipped and counted. Anything that can change
+settings behind our back (errors, sweeps, reconnects, front panel use)
+must invalidate the affected keys, or everything.
+
+Keys are plain tuples, e.g. ("wavelength",) or ("range", mf, slot, chan).
+"""
+
+_MISSING = object()
+
+
+class InstrumentShadow:
+    def __init__(self, tolerances: Optional[Dict[str, float]] = None):
+        """
+        :param tolerances: absolute tolerance per key name (first tuple item)
+                           for float settings, e.g. {"wavelength": 1e-6}
+        """
+        self._state: Dict[Hashable, Any] = {}
+        self._tol = dict(tolerances or {})
+        self._lock = threading.Lock()
+        self.suppressed = 0
+        self.written = 0
+        self.invalidations = 0
+
+    def _equal(self, key, a, b) -> bool:
+        tol = self._tol.get(key[0])
+        if tol is not None and isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            return abs(float(a) - float(b)) <= tol
+        return a == b
+
+    def matches(self, key: tuple, value) -> bool:
+        """True if the last known value of key equals value"""
+        with self._lock:
+            cur = self._state.get(key, _MISSING)
+            return cur is not _MISSING and self._equal(key, cur, value)
+
+    def skip(self, *items) -> bool:
+        """
+        skip((key, value), ...) -> True (and counted) if every key already
+        holds its value, i.e. the whole write can be suppressed
+        """
+        if all(self.matches(k, v) for k, v in items):
+            with self._lock:
+                self.suppressed += 1
+            return True
+        return False
+
+    def update(self, key: tuple, value, written: bool = True) -> None:
+        """Record a value after a successful write (or a read back with written=False)"""
+        with self._lock:
+            self._state[key] = value
+            if written:
+                self.written += 1
+
+    def get(self, key: tuple, default=None):
+        with self._lock:
+            return self._state.get(key, default)
+
+    def invalidate(self, *prefix) -> None:
+        """
+        Forget keys starting with prefix, e.g. invalidate("range", 0, 1)
+        drops the range of every channel on MF 0 slot 1. No prefix forgets
+        everything.
+        """
+        with self._lock:
+            self.invalidations += 1
+            if not prefix:
+                self._state.clear()
+                return
+            n = len(prefix)
+            for key in [k for k in self._state if k[:n] == prefix]:
+                del self._state[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "written": self.written,
+                "suppressed": self.suppressed,
+                "invalidations": self.invalidations,
+                "known": len(self._state),
+            }
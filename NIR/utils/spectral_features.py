@@ -0,0 +1,101 @@
+import numpy as np
+from typing import List, Tuple
+
+from scipy.signal import peak_prominences
+
+"""
+Vectorized spectral feature helpers (peaks, dips and feature windows)
+for lambda scan results. Everything here works on plain NumPy arrays
+so it can be used by the managers as well as offline analysis.
+"""
+
+
+def find_peaks(y, prominence: float = 3.0, wlen: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find local maxima with at least `prominence` (same units as y, dB).
+
+    :param y: 1D array (e.g. power in dBm)
+    :param prominence: minimum prominence to keep a peak
+    :param wlen: half window in samples the bases are searched in,
+                 None for the whole trace
+    :return: (indices, prominences)
+
+    Prominence is the contour prominence (scipy.signal.peak_prominences):
+    the base on each side is the lowest sample before the first higher
+    one, so ripple on the slope of a larger feature is not prominent.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if n < 3:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    if np.isnan(y).any():
+        y = np.where(np.isnan(y), np.nanmin(y) if np.isfinite(y).any() else 0.0, y)
+
+    if wlen is not None:
+        wlen = 2 * int(max(1, min(wlen, n))) + 1  # scipy's wlen is the full window
+
+    # Strict rise on the left, non-strict fall on the right -> first sample of a plateau
+    mid = y[1:-1]
+    is_max = (mid > y[:-2]) & (mid >= y[2:])
+    idx = np.flatnonzero(is_max) + 1
+
+    if idx.size == 0:
+        return idx, np.empty(0, dtype=np.float64)
+    prom = peak_prominences(y, idx, wlen=wlen)[0]
+    keep = prom >= float(prominence)
+    return idx[keep], prom[keep]
+
+
+def find_dips(y, prominence: float = 3.0, wlen: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Find local minima (e.g. ring resonances), see find_peaks"""
+    y = np.asarray(y, dtype=np.float64)
+    return find_peaks(-y, prominence=prominence, wlen=wlen)
+
+
+def find_features(y, prominence: float = 3.0, wlen: int = None) -> np.ndarray:
+    """Sorted indices of both peaks and dips above the prominence threshold"""
+    p_idx, _ = find_peaks(y, prominence, wlen)
+    d_idx, _ = find_dips(y, prominence, wlen)
+    return np.union1d(p_idx, d_idx)
+
+
+def merge_windows(centers_nm, half_width_nm: float,
+                  lo_nm: float, hi_nm: float) -> List[Tuple[float, float]]:
+    """
+    Build [center - hw, center + hw] windows clipped to [lo, hi]
+    and merge the overlapping ones.
+
+    :return: list of (start_nm, stop_nm) sorted by start
+    """
+    c = np.sort(np.asarray(centers_nm, dtype=np.float64))
+    if c.size == 0:
+        return []
+
+    starts = np.clip(c - half_width_nm, lo_nm, hi_nm)
+    ends = np.clip(c + half_width_nm, lo_nm, hi_nm)
+
+    # A new window starts whenever the start is past every previous end
+    run_end = np.maximum.accumulate(ends)
+    new_group = np.ones(c.size, dtype=bool)
+    new_group[1:] = starts[1:] > run_end[:-1]
+    group = np.cumsum(new_group) - 1
+
+    g_start = starts[new_group]
+    g_end = np.full(g_start.size, -np.inf)
+    np.maximum.at(g_end, group, ends)
+    return [(float(a), float(b)) for a, b in zip(g_start, g_end) if b > a]
+
+
+def inside_windows(wl_nm, windows: List[Tuple[float, float]]) -> np.ndarray:
+    """Boolean mask of wavelengths that fall inside any of the (sorted, merged) windows"""
+    wl = np.asarray(wl_nm, dtype=np.float64)
+    if not windows:
+        return np.zeros(wl.shape, dtype=bool)
+    starts = np.array([w[0] for w in windows])
+    ends = np.array([w[1] for w in windows])
+    k = np.searchsorted(starts, wl, side="right") - 1
+    valid = k >= 0
+    out = np.zeros(wl.shape, dtype=bool)
+    out[valid] = wl[valid] <= ends[k[valid]]
+    return out
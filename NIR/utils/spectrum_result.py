@@ -0,0 +1,157 @@
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+"""
+Contiguous container for one sweep result.
+
+    wavelengths_nm  (n_pts,) float64
+    power_dbm       (n_det, n_pts) C contiguous block, float64 or float32
+    channels        [(mf, slot, head), ...] detector identity per row
+    meta            free form (stats, sweep settings, ...)
+
+The controller writes each detector straight into its row of a block
+allocated once, and the same object is handed through NIRManager.sweep
+to the GUI, normalisation, plotting and export. Consumers that expect
+the old "list of channel arrays" keep working: iterating / indexing gives
+row views, np.asarray(result) gives the block itself, neither copies.
+float32 halves the block (0.1 mdB resolution at -80 dBm, far below
+detector noise), wavelengths stay float64 since pm steps need it.
+"""
+
+DTYPES = {"float64": np.float64, "float32": np.float32}
+
+
+def resolve_dtype(dtype) -> np.dtype:
+    """'float32' / 'float64' / numpy dtype -> numpy dtype"""
+    if isinstance(dtype, str):
+        dtype = DTYPES.get(dtype.lower(), np.float64)
+    return np.dtype(dtype)
+
+
+def _channel_list(channels, n: int) -> List[Tuple[int, int, int]]:
+    """channels cut / padded to n rows, unknown rows numbered like lib_gui does"""
+    out = [tuple(c) for c in (channels or [])][:n]
+    out += [(0, 1, i) for i in range(len(out), n)]
+    return out
+
+
+class SpectrumResult:
+    __slots__ = ("wavelengths_nm", "power_dbm", "channels", "meta")
+
+    def __init__(self, wavelengths_nm, power_dbm,
+                 channels: Optional[Sequence[Tuple[int, int, int]]] = None,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.wavelengths_nm = np.ascontiguousarray(wavelengths_nm, dtype=np.float64)
+        block = np.asarray(power_dbm)
+        if block.ndim == 1:
+            block = block[None, :]
+        self.power_dbm = np.ascontiguousarray(block)
+        if self.power_dbm.shape[1] != self.wavelengths_nm.size:
+            raise ValueError(f"{self.power_dbm.shape[1]} points per detector for "
+                             f"{self.wavelengths_nm.size} wavelengths")
+        self.channels = _channel_list(channels, self.power_dbm.shape[0])
+        self.meta: Dict[str, Any] = dict(meta or {})
+
+    ######################################################################
+    # Construction
+    ######################################################################
+
+    @classmethod
+    def allocate(cls, wavelengths_nm, channels: Sequence[Tuple[int, int, int]],
+                 dtype="float64", fill=np.nan) -> "SpectrumResult":
+        """Empty block to be filled row by row (result.power_dbm[i] = ...)"""
+        wl = np.asarray(wavelengths_nm, dtype=np.float64)
+        block = np.full((len(channels), wl.size), fill, dtype=resolve_dtype(dtype))
+        return cls(wl, block, channels)
+
+    @classmethod
+    def from_rows(cls, wavelengths_nm, rows, channels=None, dtype="float64",
+                  meta=None) -> "SpectrumResult":
+        """One copy of every row into a fresh block (with the dtype cast)"""
+        rows = list(rows)
+        wl = np.asarray(wavelengths_nm, dtype=np.float64)
+        out = cls.allocate(wl, _channel_list(channels, len(rows)), dtype)
+        for i, r in enumerate(rows[:out.n_det]):
+            out.power_dbm[i] = r
+        out.meta.update(meta or {})
+        return out
+
+    @classmethod
+    def coerce(cls, results, channels=None, dtype=None) -> "SpectrumResult":
+        """
+        Any controller sweep return as a SpectrumResult, without copying when
+        it already is one of the requested dtype:
+            SpectrumResult, (wl, [chs]) from NIR8164, (wl, ch0, ch1, ...) from
+            the MF controller, [wl, ch0, ...] columns from Luna
+        """
+        if isinstance(results, cls):
+            if dtype is None or results.power_dbm.dtype == resolve_dtype(dtype):
+                return results
+            return results.astype(dtype)
+        wl = results[0]
+        if len(results) == 2 and np.ndim(results[1]) == 2:
+            rows = results[1]
+        else:
+            rows = results[1:]
+        if isinstance(rows, np.ndarray) and rows.ndim == 2 and \
+                (dtype is None or rows.dtype == resolve_dtype(dtype)):
+            return cls(wl, rows, channels)
+        return cls.from_rows(wl, rows, channels, dtype or "float64")
+
+    def astype(self, dtype) -> "SpectrumResult":
+        dtype = resolve_dtype(dtype)
+        if self.power_dbm.dtype == dtype:
+            return self
+        return SpectrumResult(self.wavelengths_nm, self.power_dbm.astype(dtype),
+                              self.channels, self.meta)
+
+    ######################################################################
+    # Access
+    ######################################################################
+
+    @property
+    def n_det(self) -> int:
+        return self.power_dbm.shape[0]
+
+    @property
+    def n_pts(self) -> int:
+        return self.power_dbm.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.wavelengths_nm.nbytes + self.power_dbm.nbytes
+
+    def row(self, channel: Tuple[int, int, int]) -> np.ndarray:
+        """View of the trace of one detector (mf, slot, head)"""
+        return self.power_dbm[self.channels.index(tuple(channel))]
+
+    def names(self) -> List[str]:
+        return [f"MF{mf}:{slot}.{head}" for mf, slot, head in self.channels]
+
+    def to_frame(self, columns: Optional[Sequence[str]] = None):
+        """pandas DataFrame over the block (no copy of the detector data)"""
+        import pandas as pd
+        cols = list(columns) if columns is not None else self.names()
+        df = pd.DataFrame(self.power_dbm.T, columns=cols, copy=False)
+        df.insert(0, "Wavelength [nm]", self.wavelengths_nm)
+        return df
+
+    # Sequence of channel rows, like the old list of arrays
+    def __len__(self) -> int:
+        return self.n_det
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.power_dbm)
+
+    def __getitem__(self, item):
+        return self.power_dbm[item]
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None or np.dtype(dtype) == self.power_dbm.dtype:
+            return self.power_dbm.copy() if copy else self.power_dbm
+        return self.power_dbm.astype(dtype)
+
+    def __repr__(self) -> str:
+        return (f"SpectrumResult({self.n_det} det x {self.n_pts} pts, "
+                f"{self.power_dbm.dtype}, {self.nbytes / 1e6:.1f} MB)")
@@ -0,0 +1,57 @@
+import numpy as np
+
+from NIR.utils.spectral_features import find_dips, find_features, merge_windows
+
+"""
+Feature detection on a multi-resonance ring spectrum with ripple and
+noise: only the resonances (and the maxima between them) may be found,
+so the adaptive sweep's fine windows stay a fraction of the span.
+
+    python -m NIR.utils.test_spectral_features
+"""
+
+SPAN_NM = (1500.0, 1600.0)
+FSR_NM = 2.0
+
+
+def _ring(wl, fsr=FSR_NM, a=0.98, r=0.97):
+    """All-pass ring through port [dB]"""
+    c = np.cos(2 * np.pi * (wl - wl[0]) / fsr)
+    t = (a * a - 2 * a * r * c + r * r) / (1 - 2 * a * r * c + (a * r) ** 2)
+    return 10.0 * np.log10(t)
+
+
+def _spectrum(seed=1):
+    rng = np.random.default_rng(seed)
+    wl = np.arange(SPAN_NM[0], SPAN_NM[1] + 1e-9, 0.01)
+    # 0.8 dB pk-pk ripple (e.g. facet reflections) and detector noise
+    y = _ring(wl) - 5.0 + 0.4 * np.sin(2 * np.pi * wl / 0.07) + rng.normal(0.0, 0.05, wl.size)
+    return wl, y
+
+
+def test_ring_resonances_only():
+    wl, y = _spectrum()
+    n_res = int(round((SPAN_NM[1] - SPAN_NM[0]) / FSR_NM)) - 1  # Inside the span, edges are no dips
+
+    d_idx, d_prom = find_dips(y, prominence=3.0)
+    assert abs(d_idx.size - n_res) <= 1
+    assert np.all(d_prom >= 3.0)
+    # Every dip sits on a resonance
+    phase = ((wl[d_idx] - SPAN_NM[0]) / FSR_NM) % 1.0
+    assert np.all(np.minimum(phase, 1.0 - phase) < 0.05)
+
+    features = find_features(y, prominence=3.0)
+    assert features.size <= 2 * n_res + 1
+
+
+def test_fine_windows_fraction_of_span():
+    wl, y = _spectrum()
+    windows = merge_windows(wl[find_features(y, prominence=3.0)], 0.25, *SPAN_NM)
+    covered = sum(b - a for a, b in windows)
+    assert covered < 0.6 * (SPAN_NM[1] - SPAN_NM[0])
+
+
+if __name__ == "__main__":
+    test_ring_resonances_only()
+    test_fine_windows_fraction_of_span()
+    print("ok")
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+"""
+Persistent cache of the enumerated mainframe topology.
+
+Enumerating PWM channels (hp816x getChannelLocation per channel, or a DLL
+session just to count them) and probing every slot costs seconds per
+connect. The result only changes when modules are moved, so it is stored
+on disk keyed by the identity of every mainframe, in MF order:
+    (visa address, *IDN?, *OPT?)
+*OPT? lists the installed modules per slot, so a swapped module or a
+different frame changes the key and forces a full enumeration again.
+The PWM numbering depends on the sweep engine that enumerated it (*OPT?
+order for SCPI, hp816x getChannelLocation for the DLL), so mappings are
+also keyed by engine.
+
+    frames = [identify(addr, inst) for addr, inst in ...]
+    mapping = topology_cache.get(frames, engine)
+    if mapping is None:
+        mapping = <full enumeration>
+        topology_cache.put(frames, mapping, engine=engine)
+
+mapping is [(PWMIndex, MF, Slot, Head), ...] as returned by
+enumarate_slots; extra (e.g. TLS slots) is free form.
+"""
+
+DEFAULT_PATH = Path(__file__).resolve().parent.parent / "config" / "topology_cache.json"
+
+Frame = Tuple[str, str, str]
+
+
+def identify(addr: str, inst) -> Frame:
+    """(address, *IDN?, *OPT?) of an open pyvisa session, the cheap validation"""
+    idn = inst.query("*IDN?").strip()
+    try:
+        opt = inst.query("*OPT?").strip()
+    except Exception:
+        opt = ""
+    return str(addr), idn, opt
+
+
+def frame_key(frames: Sequence[Frame], engine: Optional[str] = None) -> str:
+    key = "|".join("{}#{}#{}".format(*f) for f in frames)
+    return key if not engine else f"{engine}@{key}"
+
+
+class TopologyCache:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._data: Optional[Dict[str, dict]] = None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> Dict[str, dict]:
+        if self._data is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(self.path.parent, exist_ok=True)
+            tmp = self.path.with_suffix(".tmp")
+            with open(tmp, "w") as f:
+                json.dump(self._data, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[Topology] Could not write cache: {e}")
+
+    def get(self, frames: Sequence[Frame],
+            engine: Optional[str] = None) -> Optional[List[Tuple[int, int, int, int]]]:
+        """Cached mapping for exactly these frames (as enumerated by engine), None if unknown"""
+        with self._lock:
+            entry = self._load().get(frame_key(frames, engine))
+            if entry is None or entry.get("mapping") is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [tuple(int(v) for v in m) for m in entry["mapping"]]
+
+    def get_extra(self, frames: Sequence[Frame], engine: Optional[str] = None) -> Optional[dict]:
+        with self._lock:
+            entry = self._load().get(frame_key(frames, engine))
+            return None if entry is None else entry.get("extra")
+
+    def put(self, frames: Sequence[Frame], mapping=None, extra: Optional[dict] = None,
+            engine: Optional[str] = None) -> None:
+        """Store mapping and / or extra, whichever is given, for these frames"""
+        with self._lock:
+            entry = self._load().setdefault(frame_key(frames, engine), {})
+            if mapping is not None:
+                entry["mapping"] = [[int(v) for v in m] for m in mapping]
+            if extra is not None:
+                entry["extra"] = dict(extra)
+            self._save()
+
+    def invalidate(self, frames: Optional[Sequence[Frame]] = None,
+                   engine: Optional[str] = None) -> None:
+        """Forget one setup, or everything"""
+        with self._lock:
+            data = self._load()
+            if frames is None:
+                data.clear()
+            else:
+                data.pop(frame_key(frames, engine), None)
+            self._save()
+
+
+topology_cache = TopologyCache()
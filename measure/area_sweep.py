@@ -28,7 +28,8 @@ class AreaSweep:
               nir_manager: NIRManager,
                 progress: Optional[Callable[[float, str], None]] = None,
                 cancel_event: Optional[Any] = None,
-                debug: bool = False
+                debug: bool = False,
+                live_channel: Optional[Any] = None
         ):
         # Init
         self.stage_manager = stage_manager
@@ -53,6 +54,14 @@ class AreaSweep:
         self._stop_requested = False
         self._cancel_event = cancel_event  
         self._progress = progress
+        # Receives open((rows, cols), step) and publish(row, col, value)
+        # per cell (GUI.lib_live_map.LiveMapChannel)
+        self._live = live_channel
+
+        # Grid geometry of the last scan, for measure.peak_localiser
+        self.origin = None          # stage (x, y) of the centre cell
+        self.center_index = None    # (row, col) of the centre cell
+        self.step = None            # um
         
         # Setup logger
         self.logger = setup_logger("AreaSweep", "SWEEP", debug_mode=debug)
@@ -65,6 +74,14 @@ class AreaSweep:
             p = 0.0 if percent < 0.0 else (100.0 if percent > 100.0 else percent)
             self._progress(p, msg)
 
+    def _publish(self, row: int, col: int, value: float) -> None:
+        """Send a freshly read cell to the live view, if any."""
+        if self._live is not None:
+            try:
+                self._live.publish(row, col, value)
+            except Exception:
+                pass
+
     def _log(self, message: str, level: str = "info"):
         """Log Helper function"""
         if level == "debug":
@@ -133,6 +150,11 @@ class AreaSweep:
             #  buffers 
             data = np.full((y_cells, x_cells), np.nan, dtype=float)
             visited = np.zeros((y_cells, x_cells), dtype=bool)
+            if self._live is not None:
+                try:
+                    self._live.open((y_cells, x_cells), step)
+                except Exception:
+                    pass
 
             #  anchor at current physical pose (this is the spiral center) 
             x0 = (await self.stage_manager.get_position(AxisType.X)).actual
@@ -144,6 +166,7 @@ class AreaSweep:
             cx = (x_cells - 1) // 2
             cy = (y_cells - 1) // 2
             x_idx, y_idx = cx, cy
+            self.origin, self.center_index, self.step = (x0, y0), (cy, cx), step
 
             # first sample (center)
             # def read_value() -> float:
@@ -152,6 +175,7 @@ class AreaSweep:
 
             visited[y_idx, x_idx] = True
             data[y_idx, x_idx] = self.read_value()
+            self._publish(y_idx, x_idx, data[y_idx, x_idx])
             covered = 1
             self._report(10.0, f"Area sweep (spiral): point {covered}/{total_cells}")
 
@@ -190,6 +214,7 @@ class AreaSweep:
                             x_idx, y_idx = vx, vy
                             visited[y_idx, x_idx] = True
                             data[y_idx, x_idx] = self.read_value()
+                            self._publish(y_idx, x_idx, data[y_idx, x_idx])
                             covered += 1
                             
                             # Report progress
@@ -225,11 +250,8 @@ class AreaSweep:
         """Return the requested power by method"""
         if "ch" not in self.primary_detector:
             # Max
-            best = -100
-            for mf, slot, head in self.slots:
-                loss = self.nir_manager.read_power(slot=slot, head=head, mf=mf)
-                best = max(best, loss)
-            return best
+            powers = self.nir_manager.read_power_all(self.slots)
+            return max(-100, float(max(powers))) if len(powers) else -100
         else:
             mf, slot, head = self.slots[0]
             loss = self.nir_manager.read_power(slot=slot, head=head, mf=mf)
@@ -17,6 +17,7 @@ class FineAlignConfiguration:
     ref_wl: float = 1550.0          # nm
     secondary_wl = 1540.0           # nm
     secondary_loss = -50.0           # dBm 
+    multi_wl_spiral: bool = False   # log ref + secondary wl at each spiral point
     slots: list[int] = field(
         default_factory=lambda: [1]
     )       # only set to len > 1 if max
@@ -34,6 +35,7 @@ class FineAlignConfiguration:
             'ref_wl': self.ref_wl,
             'secondary_wl': self.secondary_wl,
             'secondary_loss': self.secondary_loss,
+            'multi_wl_spiral': self.multi_wl_spiral,
             'slots': self.slots,
             'timeout_s': self.timeout_s,
         }
@@ -99,6 +99,10 @@ class FineAlign:
         self.ref_wl = config.get("ref_wl", 1550.0)
         self.secondary_wl = config.get("secondary_wl", 1540)
         self.secondary_loss = config.get("secondary_loss", -50.0)  # dBm 
+        # Log ref and secondary wl together at every spiral point
+        # (one triggered burst), so the secondary fallback needs no second spiral
+        self.multi_wl = bool(config.get("multi_wl_spiral", False))
+        self._secondary_best = None  # (dBm, [x, y])
         self.timeout_s = float(config.get("timeout_s", 180.0))
         self._start_time = 0.0
 
@@ -110,6 +114,16 @@ class FineAlign:
         self.lowest_loss = -80
         self.spiral_threshold_met = False
 
+    def seed(self, x: float, y: float, radius: Optional[float] = None) -> None:
+        """
+        Start from a known estimate (e.g. measure.peak_localiser on an area
+        scan) instead of the current pose; radius bounds the spiral window.
+        """
+        self.best_position = [float(x), float(y)]
+        if radius is not None:
+            self.scan_window = max(float(radius), float(self.step_size))
+        self.log(f"Seeded at ({x:.3f}, {y:.3f}), window {self.scan_window:.2f} um", "info")
+
     def _report(self, percent: float, msg: str) -> None:
         """Report progress to GUI if a callback was provided."""
         if self._progress is not None:
@@ -154,7 +168,18 @@ class FineAlign:
                     self.log("Spiral search failed.", "error")
                 return False
 
-            if self.lowest_loss <= self.secondary_loss:
+            if self.multi_wl:
+                # The bursts leave the TLS at the end of their step grid
+                self.nir_manager.set_wavelength(self.ref_wl)
+
+            if self.lowest_loss <= self.secondary_loss and self.multi_wl and self._secondary_best:
+                # Secondary wl was logged alongside, take its best point directly
+                self.log(f"Loss not met, changing to 2ndary wl {self.secondary_wl} "
+                         f"(best {self._secondary_best[0]:.2f} dBm from spiral).", "info")
+                self.nir_manager.set_wavelength(self.secondary_wl)
+                self.lowest_loss, self.best_position = self._secondary_best
+
+            elif self.lowest_loss <= self.secondary_loss:
                 # dBm thresh not met, proceed with secondary wl
                 self.log(f"Loss not met, changing to 2ndary wl {self.secondary_wl}.", "info")
                 self.nir_manager.set_wavelength(self.secondary_wl)
@@ -211,6 +236,10 @@ class FineAlign:
             Returns:
                 bool: True if successful False if limit reached / canceled / error
         """
+        # Dual wavelength: TLS / detector trigger setup once for the whole spiral,
+        # each point then only re-arms and reads the logs
+        burst = self.multi_wl and self.secondary_wl != self.ref_wl and \
+            self.nir_manager.prepare_burst([self.ref_wl, self.secondary_wl], self.slots)
         try:
             # Ensure exact start
             await self.stage_manager.move_axis(AxisType.X, x_pos, relative=False, wait_for_completion=True)
@@ -227,7 +256,8 @@ class FineAlign:
             # initial sample
             # lm, ls = self.nir_manager.read_power(slot=self.slot)
             # best_loss = self._select_detector_channel(lm, ls)
-            best_loss = self.get_power()
+            self._secondary_best = None
+            best_loss = await self._spiral_sample()
             x = await self.stage_manager.get_position(AxisType.X)
             y = await self.stage_manager.get_position(AxisType.Y)
             best_pos = [x.actual, y.actual]
@@ -248,7 +278,7 @@ class FineAlign:
                     await self.stage_manager.move_axis(AxisType.X, step * direction, relative=True, wait_for_completion=True)
                     # lm, ls = self.nir_manager.read_power(slot=self.slot)
                     # val = self._select_detector_channel(lm, ls)
-                    val = self.get_power()
+                    val = await self._spiral_sample()
 
                     if val > best_loss:
                         best_loss = val
@@ -275,7 +305,7 @@ class FineAlign:
                     await self.stage_manager.move_axis(AxisType.Y, step * direction, relative=True, wait_for_completion=True)
                     # lm, ls = self.nir_manager.read_power(slot=self.slot)
                     # val = self._select_detector_channel(lm, ls)
-                    val = self.get_power()
+                    val = await self._spiral_sample()
                     if val > best_loss:
                         best_loss = val
                         x = await self.stage_manager.get_position(AxisType.X)
@@ -321,6 +351,9 @@ class FineAlign:
             self.log(f"Spiral search error: {e}", "error")
             self._report(100.0, f"Spiral: error ({e})")
             return False
+        finally:
+            if burst:
+                self.nir_manager.release_burst()
 
     async def gradient_search(self) -> bool:
         try:
@@ -428,15 +461,32 @@ class FineAlign:
             self._report(100.0, f"Gradient: error ({e})")
             return False
     
+    def _reduce(self, powers) -> float:
+        """Max over slots, or the single selected channel"""
+        if "ch" not in self.primary_detector:
+            return max(-100, float(max(powers))) if len(powers) else -100
+        return float(powers[0])
+
+    async def _spiral_sample(self) -> float:
+        """Primary wl power; with multi_wl also tracks the best secondary wl point"""
+        if not self.multi_wl or self.secondary_wl == self.ref_wl:
+            return self.get_power()
+        p = self.nir_manager.measure_at_wavelengths([self.ref_wl, self.secondary_wl], self.slots)
+        if p is None:
+            return self.get_power()
+        primary, secondary = self._reduce(p[0]), self._reduce(p[1])
+        if self._secondary_best is None or secondary > self._secondary_best[0]:
+            x = await self.stage_manager.get_position(AxisType.X)
+            y = await self.stage_manager.get_position(AxisType.Y)
+            self._secondary_best = (secondary, [x.actual, y.actual])
+        return primary
+
     def get_power(self):
         """Return the requested power by method"""
         if "ch" not in self.primary_detector:
             # Max
-            best = -100
-            for mf,slot,head in self.slots:
-                m = self.nir_manager.read_power(slot=slot, head=head, mf=mf)
-                best = max(best, m)
-            return best
+            powers = self.nir_manager.read_power_all(self.slots)
+            return max(-100, float(max(powers))) if len(powers) else -100
         else:
             mf, slot, head = self.slots[0]
             loss = self.nir_manager.read_power(slot=slot, head=head, mf=mf)
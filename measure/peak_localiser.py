@@ -0,0 +1,178 @@
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+
+"""
+Sub-cell coupling peak from an area scan grid (AreaSweep.begin_sweep).
+
+The coupling spot is close to a 2D Gaussian in linear power, so in dBm it
+is a quadratic surface:
+    dBm = a + b x + c y + d x^2 + e y^2 + f x y
+fitted by least squares to the cells within fit_db of the brightest one
+(around it, noise floor left out). The vertex of the surface is the peak,
+its covariance (residual variance through the fit, propagated to the
+vertex) the uncertainty; the curvature gives the Gaussian 1/e^2 radius.
+
+Falls back to the centroid of the cells within centroid_db of the
+maximum, weighted by linear power above the window's floor, when the
+fit is not a clean maximum (too few cells, saddle, vertex off the
+fitted window).
+
+Coordinates follow AreaSweep: cell (row, col) sits at
+    origin + ((col - center_col) * step, (row - center_row) * step)
+with the scan centre cell at the stage pose the scan started from.
+
+    est = locate_peak(data, step, center_index=sweep.center_index, origin=sweep.origin)
+    aligner.seed(est.x, est.y, est.search_radius())
+"""
+
+_DB_LN = 10.0 / np.log(10.0)  # dB per neper of power
+
+
+@dataclass
+class PeakEstimate:
+    row: float                  # sub-cell grid position
+    col: float
+    dx_um: float                # from the scan centre
+    dy_um: float
+    sigma_x_um: float           # 1 sigma position uncertainty
+    sigma_y_um: float
+    peak_dbm: float
+    method: str                 # "gaussian" / "centroid" / "max"
+    width_um: float = np.nan    # Gaussian 1/e^2 radius (mean of both axes)
+    n_cells: int = 0
+    x: Optional[float] = None   # absolute stage position, when origin is known
+    y: Optional[float] = None
+
+    @property
+    def sigma_um(self) -> float:
+        return float(max(self.sigma_x_um, self.sigma_y_um))
+
+    def search_radius(self, k: float = 3.0, min_radius: float = 0.0,
+                      max_radius: Optional[float] = None) -> float:
+        """k sigma, clamped, for a search around the estimate"""
+        r = max(k * self.sigma_um, min_radius)
+        return float(r if max_radius is None else min(r, max_radius))
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+def _fit_quadratic(cols: np.ndarray, rows: np.ndarray, z: np.ndarray):
+    """Least squares quadratic surface, returns (beta, covariance) or None"""
+    X = np.column_stack([np.ones_like(cols), cols, rows, cols ** 2, rows ** 2, cols * rows])
+    if len(z) <= X.shape[1]:
+        return None
+    beta, _, rank, _ = np.linalg.lstsq(X, z, rcond=None)
+    if rank < X.shape[1]:
+        return None
+    dof = len(z) - X.shape[1]
+    resid = z - X @ beta
+    s2 = float(resid @ resid) / dof
+    cov = s2 * np.linalg.pinv(X.T @ X)
+    return beta, cov
+
+
+def _vertex(beta: np.ndarray, cov: np.ndarray):
+    """Vertex of the surface and its 2x2 covariance (delta method), None unless a maximum"""
+    _, b, c, d, e, f = beta
+    H = np.array([[2 * d, f], [f, 2 * e]])
+    if not (H[0, 0] < 0 and np.linalg.det(H) > 0):
+        return None  # Not a maximum
+    Hinv = np.linalg.inv(H)
+    p = -Hinv @ np.array([b, c])
+    # H dp = -(dH) p - dg for every coefficient
+    dH_p = np.array([
+        [0.0, 0.0],           # a
+        [1.0, 0.0],           # b (dg)
+        [0.0, 1.0],           # c (dg)
+        [2 * p[0], 0.0],      # d
+        [0.0, 2 * p[1]],      # e
+        [p[1], p[0]],         # f
+    ])
+    J = -(Hinv @ dH_p.T)      # (2, 6)
+    return p, J @ cov @ J.T, H
+
+
+def locate_peak(data, step: float, center_index: Optional[Tuple[int, int]] = None,
+                origin: Optional[Tuple[float, float]] = None,
+                fit_db: float = 6.0, centroid_db: float = 3.0,
+                window: int = 3) -> Optional[PeakEstimate]:
+    """
+    Peak of an area scan.
+
+    :param data: (rows, cols) dBm grid, NaN for cells not measured
+    :param step: pitch between cells [um]
+    :param center_index: (row, col) of the scan centre, default AreaSweep's ((rows-1)//2, (cols-1)//2)
+    :param origin: stage (x, y) of the scan centre, gives est.x / est.y
+    :param fit_db: cells this far below the maximum take part in the fit
+    :param window: fit only within +-window cells of the maximum
+    :return: PeakEstimate, None when the grid holds no finite value
+    """
+    z = np.asarray(data, dtype=np.float64)
+    if z.ndim != 2 or not np.isfinite(z).any():
+        return None
+    rows_n, cols_n = z.shape
+    if center_index is None:
+        center_index = ((rows_n - 1) // 2, (cols_n - 1) // 2)
+    step = float(step)
+
+    zmax = float(np.nanmax(z))
+    # Flat top (saturated detector): the window goes around the middle of
+    # the plateau, not its first cell
+    tops = np.argwhere(z == zmax)
+    r0, c0 = tops[np.argmin(((tops - tops.mean(axis=0)) ** 2).sum(axis=1))]
+    rr, cc = np.mgrid[0:rows_n, 0:cols_n]
+    near = (np.abs(rr - r0) <= window) & (np.abs(cc - c0) <= window) & np.isfinite(z)
+    quantisation = step / np.sqrt(12.0)
+
+    est = None
+    use = near & (z >= zmax - fit_db)
+    fit = _fit_quadratic((cc[use] - c0).astype(float), (rr[use] - r0).astype(float), z[use])
+    if fit is not None:
+        vertex = _vertex(*fit)
+        if vertex is not None:
+            p, pcov, H = vertex
+            if np.all(np.abs(p) <= window):
+                beta = fit[0]
+                peak = float(beta[0] + beta[1] * p[0] + beta[2] * p[1]
+                             + beta[3] * p[0] ** 2 + beta[4] * p[1] ** 2 + beta[5] * p[0] * p[1])
+                # dBm curvature -> Gaussian 1/e^2 radius: dBm = -2 * _DB_LN * r^2 / w^2
+                curv = -np.linalg.eigvalsh(H) / 2.0  # per cell^2, > 0
+                w = np.sqrt(2.0 * _DB_LN / curv) * step
+                sig = np.sqrt(np.clip(np.diag(pcov), 0.0, None)) * step
+                est = PeakEstimate(
+                    row=float(r0 + p[1]), col=float(c0 + p[0]), dx_um=0.0, dy_um=0.0,
+                    sigma_x_um=float(sig[0]), sigma_y_um=float(sig[1]),
+                    peak_dbm=peak, method="gaussian", width_um=float(np.mean(w)),
+                    n_cells=int(use.sum()))
+
+    if est is None:
+        use = near & (z >= zmax - centroid_db)
+        # Linear power above the window's floor, a pedestal would pull the
+        # centroid towards the middle of the cells taken
+        floor = np.power(10.0, (np.min(z[near]) - zmax) / 10.0)
+        wgt = np.clip(np.power(10.0, (z[use] - zmax) / 10.0) - floor, 0.0, None)
+        wsum = wgt.sum()
+        if use.sum() >= 2 and wsum > 0:
+            col = float((wgt * cc[use]).sum() / wsum)
+            row = float((wgt * rr[use]).sum() / wsum)
+            n_eff = wsum ** 2 / (wgt ** 2).sum()
+            sx = np.sqrt((wgt * (cc[use] - col) ** 2).sum() / wsum / n_eff) * step
+            sy = np.sqrt((wgt * (rr[use] - row) ** 2).sum() / wsum / n_eff) * step
+            est = PeakEstimate(row=row, col=col, dx_um=0.0, dy_um=0.0,
+                               sigma_x_um=float(np.hypot(sx, quantisation)),
+                               sigma_y_um=float(np.hypot(sy, quantisation)),
+                               peak_dbm=zmax, method="centroid", n_cells=int(use.sum()))
+        else:
+            est = PeakEstimate(row=float(r0), col=float(c0), dx_um=0.0, dy_um=0.0,
+                               sigma_x_um=float(step / 2.0), sigma_y_um=float(step / 2.0),
+                               peak_dbm=zmax, method="max", n_cells=1)
+
+    est.dx_um = float((est.col - center_index[1]) * step)
+    est.dy_um = float((est.row - center_index[0]) * step)
+    if origin is not None:
+        est.x = float(origin[0]) + est.dx_um
+        est.y = float(origin[1]) + est.dy_um
+    return est
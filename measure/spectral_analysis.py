@@ -0,0 +1,232 @@
+"""
+Spectral analysis of lambda scan results, the (wavelength, detectors)
+arrays returned by NIRManager.sweep.
+
+Per detector channel:
+    - insertion loss peak (max power) and its wavelength
+    - 1 dB / 3 dB bandwidth around that peak
+    - resonances (dips), each Lorentzian fitted for centre and Q
+    - extinction ratio per resonance and the free spectral range
+
+Dip detection reuses NIR.utils.spectral_features. The Lorentzian
+fits of all resonances of a channel are solved together: 1 / depth of a
+Lorentzian is a quadratic in wavelength, so every fit is a 3x3 weighted
+least squares system and they are stacked and solved in one call.
+
+SpectralAnalysisPool runs analyse_sweep in worker processes so the auto
+measurement loop only pays for a submit, and appends finished results to
+a per-project CSV table.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from NIR.utils.spectral_features import find_dips
+
+TABLE_NAME = "spectral_analysis.csv"
+
+
+def _bandwidth(wl: np.ndarray, y: np.ndarray, k: int, drop_db: float) -> float:
+    """Width of the contiguous region around index k within drop_db of y[k]"""
+    below = np.flatnonzero(~(y >= y[k] - drop_db))  # NaN counts as below
+    left = below[below < k]
+    right = below[below > k]
+    if left.size == 0 or right.size == 0:
+        return np.nan  # Not resolved inside the sweep
+    return float(wl[right[0]] - wl[left[-1]])
+
+
+def fit_lorentzian_dips(wl, y_dbm, idx, half_window: int) -> Dict[str, np.ndarray]:
+    """
+    Fit a Lorentzian to every dip at idx at once.
+
+    :param half_window: samples on each side of a dip used for its fit
+    :return: dict of arrays (one entry per dip): center_nm, fwhm_nm, q
+    """
+    wl = np.asarray(wl, dtype=np.float64)
+    idx = np.asarray(idx, dtype=np.int64)
+    n_dips = idx.size
+    nan = np.full(n_dips, np.nan)
+    if n_dips == 0:
+        return {"center_nm": nan, "fwhm_nm": nan, "q": nan}
+
+    p = np.power(10.0, np.asarray(y_dbm, dtype=np.float64) / 10.0)
+    offs = np.arange(-half_window, half_window + 1)
+    cols = idx[:, None] + offs[None, :]
+    inside = (cols >= 0) & (cols < wl.size)
+    cols = np.clip(cols, 0, wl.size - 1)
+
+    x = wl[cols] - wl[idx][:, None]   # centred for conditioning
+    pw = np.where(inside, p[cols], np.nan)
+    base = np.nanmax(pw, axis=1, keepdims=True)
+    depth = base - pw
+    dmax = np.nanmax(depth, axis=1, keepdims=True)
+
+    # Only the core of each dip, where the signal is well above the noise
+    w = (inside & np.isfinite(depth) & (depth >= 0.3 * dmax)).astype(np.float64)
+    inv = np.where(w > 0, 1.0 / np.where(depth > 0, depth, 1.0), 0.0)
+
+    X = np.stack((x * x, x, np.ones_like(x)), axis=2)
+    A = np.einsum("nwi,nw,nwj->nij", X, w, X)
+    b = np.einsum("nwi,nw,nw->ni", X, w, inv)
+
+    ok = (w.sum(axis=1) >= 3) & (np.abs(np.linalg.det(A)) > 1e-300)
+    coef = np.full((n_dips, 3), np.nan)
+    if ok.any():
+        coef[ok] = np.linalg.solve(A[ok], b[ok][..., None])[..., 0]
+
+    c2, c1, c0 = coef[:, 0], coef[:, 1], coef[:, 2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        shift = -c1 / (2.0 * c2)
+        g2 = c0 / c2 - shift * shift
+        valid = (c2 > 0) & (g2 > 0) & (np.abs(shift) <= np.abs(x).max(axis=1))
+        center = np.where(valid, wl[idx] + shift, np.nan)
+        fwhm = np.where(valid, 2.0 * np.sqrt(np.abs(g2)), np.nan)
+        q = center / fwhm
+    return {"center_nm": center, "fwhm_nm": fwhm, "q": q}
+
+
+def analyse_channel(wl, y_dbm, prominence_db: float = 3.0) -> Dict[str, Any]:
+    """All figures of merit of one detector trace"""
+    wl = np.asarray(wl, dtype=np.float64)
+    y = np.asarray(y_dbm, dtype=np.float64)
+    out: Dict[str, Any] = {
+        "il_peak_dbm": np.nan, "il_peak_wl_nm": np.nan,
+        "bw_1db_nm": np.nan, "bw_3db_nm": np.nan,
+        "n_resonances": 0, "resonance_wl_nm": [], "q_factor": [],
+        "extinction_ratio_db": [], "fsr_nm": np.nan,
+    }
+    if wl.size < 3 or not np.isfinite(y).any():
+        return out
+
+    k = int(np.nanargmax(y))
+    out["il_peak_dbm"] = float(y[k])
+    out["il_peak_wl_nm"] = float(wl[k])
+    out["bw_1db_nm"] = _bandwidth(wl, y, k, 1.0)
+    out["bw_3db_nm"] = _bandwidth(wl, y, k, 3.0)
+
+    d_idx, d_prom = find_dips(y, prominence=prominence_db)
+    if d_idx.size == 0:
+        return out
+
+    spacing = np.diff(d_idx)
+    half = int(np.median(spacing) // 2) if spacing.size else wl.size // 10
+    half = int(min(max(3, half), 500))
+    fit = fit_lorentzian_dips(wl, y, d_idx, half)
+    centers = np.where(np.isfinite(fit["center_nm"]), fit["center_nm"], wl[d_idx])
+
+    out["n_resonances"] = int(d_idx.size)
+    out["resonance_wl_nm"] = centers.tolist()
+    out["q_factor"] = fit["q"].tolist()
+    out["extinction_ratio_db"] = d_prom.tolist()
+    if centers.size > 1:
+        out["fsr_nm"] = float(np.median(np.diff(centers)))
+    return out
+
+
+def analyse_sweep(wl, detectors, channels: Optional[Sequence] = None,
+                  device: str = "", prominence_db: float = 3.0,
+                  meta: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    One table row per detector channel of a sweep. List valued results
+    are ";" joined so rows go straight into a CSV.
+    """
+    ys = np.atleast_2d(np.asarray(detectors, dtype=np.float64))
+    rows = []
+    for i, y in enumerate(ys):
+        res = analyse_channel(wl, y, prominence_db)
+        ch = tuple(channels[i]) if channels is not None and i < len(channels) else (0, 1, i)
+        q = np.asarray(res["q_factor"], dtype=np.float64)
+        er = np.asarray(res["extinction_ratio_db"], dtype=np.float64)
+        row = {"device": device, "mf": ch[0], "slot": ch[1], "head": ch[2]}
+        row.update(meta or {})
+        row.update({
+            "il_peak_dbm": res["il_peak_dbm"],
+            "il_peak_wl_nm": res["il_peak_wl_nm"],
+            "bw_1db_nm": res["bw_1db_nm"],
+            "bw_3db_nm": res["bw_3db_nm"],
+            "n_resonances": res["n_resonances"],
+            "fsr_nm": res["fsr_nm"],
+            "q_median": float(np.nanmedian(q)) if np.isfinite(q).any() else np.nan,
+            "er_max_db": float(er.max()) if er.size else np.nan,
+            "resonance_wl_nm": ";".join(f"{v:.5f}" for v in res["resonance_wl_nm"]),
+            "q_factor": ";".join(f"{v:.1f}" for v in res["q_factor"]),
+            "extinction_ratio_db": ";".join(f"{v:.2f}" for v in res["extinction_ratio_db"]),
+        })
+        rows.append(row)
+    return rows
+
+
+class SpectralAnalysisPool:
+    """
+    Background analysis of sweeps, one row per channel appended to
+    table_path as results come in (completion order).
+
+        pool = SpectralAnalysisPool(".../Spectrum/spectral_analysis.csv")
+        pool.submit("device_12", wl, detectors, slot_info)
+        ...
+        pool.close()
+    """
+
+    def __init__(self, table_path: str, max_workers: Optional[int] = None,
+                 prominence_db: float = 3.0):
+        self.table_path = table_path
+        self.prominence_db = prominence_db
+        self.max_workers = max_workers or max(1, (os.cpu_count() or 2) - 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.errors: List[str] = []
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def submit(self, device: str, wl, detectors, channels: Optional[Sequence] = None,
+               meta: Optional[Dict[str, Any]] = None) -> Future:
+        """Queue a sweep for analysis, returns immediately"""
+        fut = self._pool().submit(
+            analyse_sweep,
+            np.asarray(wl, dtype=np.float64),
+            np.atleast_2d(np.asarray(detectors, dtype=np.float64)),
+            [tuple(c) for c in channels] if channels is not None else None,
+            str(device), self.prominence_db, meta
+        )
+        with self._lock:
+            self._pending += 1
+        fut.add_done_callback(lambda f, d=device: self._on_done(d, f))
+        return fut
+
+    def _on_done(self, device: str, fut: Future) -> None:
+        try:
+            self._append_rows(fut.result())
+        except Exception as e:
+            self.errors.append(f"{device}: {e}")
+            print(f"[Analysis] {device} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _append_rows(self, rows: List[Dict[str, Any]]) -> None:
+        import pandas as pd
+        if not rows:
+            return
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.table_path)), exist_ok=True)
+            new = not os.path.exists(self.table_path)
+            pd.DataFrame(rows).to_csv(self.table_path, mode="a", header=new, index=False)
+
+    def close(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
@@ -0,0 +1,47 @@
+import numpy as np
+
+from measure.peak_localiser import locate_peak
+
+"""
+locate_peak's centroid fallback on a saturated (flat topped) coupling
+spot away from the scan centre, over a noise floor pedestal. No stage
+needed:
+
+    python -m measure.test_peak_localiser
+"""
+
+N = 21                  # AreaSweep grid, scan centre at cell (10, 10)
+SPOT = (11.5, 8.0)      # (row, col) of the spot centre
+STEP_UM = 0.5
+
+
+def _area_scan(sat_db=-0.3, w=7.0, floor=1e-3):
+    """dBm grid: elliptic Gaussian spot on a pedestal, clipped at sat_db (2 x 3 cell plateau)"""
+    rr, cc = np.mgrid[0:N, 0:N]
+    lin = np.exp(-2.0 * ((rr - SPOT[0]) ** 2 + (cc - SPOT[1]) ** 2 / 2.0) / w ** 2) + floor
+    return np.minimum(10.0 * np.log10(lin), sat_db)
+
+
+def test_plateau_centroid():
+    z = _area_scan()
+    assert (z == z.max()).sum() == 6
+    # Only the plateau within fit_db: too few cells to fit, centroid it is
+    est = locate_peak(z, STEP_UM, origin=(100.0, 200.0), fit_db=0.0)
+    assert est.method == "centroid"
+    assert abs(est.row - SPOT[0]) * STEP_UM <= est.sigma_y_um
+    assert abs(est.col - SPOT[1]) * STEP_UM <= est.sigma_x_um
+    assert est.x == 100.0 + est.dx_um and est.y == 200.0 + est.dy_um
+    assert np.isclose(est.dx_um, (est.col - 10) * STEP_UM)
+
+
+def test_flat_window_falls_back_to_max():
+    # Nothing above the window's floor to weight (6 cells, no fit either)
+    est = locate_peak(np.full((2, 3), -40.0), STEP_UM)
+    assert est.method == "max"
+    assert (est.row, est.col) == (0.0, 1.0)
+
+
+if __name__ == "__main__":
+    test_plateau_centroid()
+    test_flat_window_falls_back_to_max()
+    print("ok")
@@ -37,6 +37,7 @@ import time
 from typing import Optional, Dict, Tuple, ClassVar, Any
 from numpy import nan
 import pyvisa as visa
+from utils import io_trace
 
 from motors.hal.motors_hal import (
     MotorHAL, AxisType, MotorState, Position, MotorConfig, MotorEventType
@@ -214,7 +215,7 @@ class CorvusController(MotorHAL):
                   f"{[ax.name for ax in self._axes]}")
         print(outstr)
         try:
-            self._rm = self._external_rm or visa.ResourceManager()
+            self._rm = self._external_rm or io_trace.resource_manager()
             self._inst = self._rm.open_resource(self._addr)
             
             try:
@@ -6,6 +6,8 @@ from concurrent.futures import ThreadPoolExecutor
 import serial
 import re
 
+from utils import io_trace
+
 from motors.hal.motors_hal import (MotorHAL,
                                    AxisType,
                                    MotorState,
@@ -31,10 +33,10 @@ def _get_shared_serial(port="COM4", timeout=0.3):
     global _global_serial_port
 
     if _global_serial_port is None:
-        _global_serial_port = serial.Serial(
-            port=port,
-            baudrate=_GLOBAL_BAUDRATE,
-            timeout=timeout
+        _global_serial_port = io_trace.wrap_session(
+            serial.Serial(port=port, baudrate=_GLOBAL_BAUDRATE, timeout=timeout)
+            if io_trace.mode() != "replay" else None,
+            f"serial:{port}"
         )
     return _global_serial_port
 
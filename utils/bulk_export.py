@@ -0,0 +1,179 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from utils.progress_write_helpers import FileProgressTqdm, write_progress_file
+
+"""
+Incremental, parallel copy of a project tree to an export destination.
+
+    result = export_tree(src_project_root, dest_project_root)
+    print(result.summary())
+
+1. build_manifest walks the source once and pairs every file with its
+   destination, marking it "copy" or "skip":
+       mtime  (default) skip when the destination has the same size and
+              mtime (copy2 keeps the mtime, MTIME_SLACK covers FAT / SMB
+              rounding)
+       hash   skip when size and blake2b of the content match, for
+              destinations that do not keep mtimes
+2. The files to copy are spread over a thread pool (copies are I/O bound,
+   shutil releases the GIL), written to a temp name and renamed so an
+   interrupted export never leaves a half file that looks up to date.
+3. Progress goes to the GUI progress dialog (progress.json) like the
+   sweeps do.
+
+converters maps a file suffix to fn(src, dst) used instead of a copy
+(e.g. render / convert on the way out). Nothing in the destination is
+ever deleted: auto sweeps write their results straight into it.
+"""
+
+MTIME_SLACK = 2.0  # s
+HASH_CHUNK = 1 << 20
+PROGRESS_INTERVAL = 0.25  # s
+SKIP_NAMES = {"__pycache__", ".DS_Store", "Thumbs.db"}
+
+
+@dataclass
+class ExportItem:
+    rel: str
+    src: str
+    dst: str
+    size: int
+    action: str = "copy"  # copy / skip
+    error: Optional[str] = None
+
+
+@dataclass
+class ExportResult:
+    items: List[ExportItem] = field(default_factory=list)
+    copied: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_copied: int = 0
+    seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (f"{self.copied} copied ({self.bytes_copied / 1e6:.1f} MB), "
+                f"{self.skipped} unchanged, {self.failed} failed in {self.seconds:.1f}s")
+
+
+def _digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _unchanged(src: str, dst: str, src_stat: os.stat_result, mode: str) -> bool:
+    try:
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    if dst_stat.st_size != src_stat.st_size:
+        return False
+    if mode == "hash":
+        return _digest(src) == _digest(dst)
+    return abs(dst_stat.st_mtime - src_stat.st_mtime) <= MTIME_SLACK
+
+
+def build_manifest(src_root: str, dest_root: str, mode: str = "mtime",
+                   exclude: Iterable[str] = (), max_workers: int = 8) -> List[ExportItem]:
+    """Every file below src_root with its destination and copy / skip decision"""
+    exclude = set(exclude) | SKIP_NAMES
+    found = []
+    for dirpath, dirnames, filenames in os.walk(src_root):
+        dirnames[:] = [d for d in dirnames if d not in exclude]
+        for name in filenames:
+            if name in exclude or name.endswith(".tmp"):
+                continue
+            src = os.path.join(dirpath, name)
+            rel = os.path.relpath(src, src_root)
+            found.append((rel, src, os.path.join(dest_root, rel)))
+
+    def check(entry):
+        rel, src, dst = entry
+        st = os.stat(src)
+        item = ExportItem(rel, src, dst, st.st_size)
+        if _unchanged(src, dst, st, mode):
+            item.action = "skip"
+        return item
+
+    if mode == "hash" and len(found) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(check, found))
+    return [check(e) for e in found]
+
+
+def _copy(item: ExportItem, converters: Dict[str, Callable[[str, str], None]]) -> None:
+    os.makedirs(os.path.dirname(item.dst), exist_ok=True)
+    tmp = f"{item.dst}.{threading.get_ident()}.tmp"
+    try:
+        convert = next((fn for suffix, fn in converters.items() if item.rel.endswith(suffix)), None)
+        if convert is not None:
+            convert(item.src, tmp)
+        else:
+            shutil.copy2(item.src, tmp)
+        os.replace(tmp, item.dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def export_tree(src_root: str, dest_root: str, mode: str = "mtime",
+                max_workers: int = 8, exclude: Iterable[str] = (),
+                converters: Optional[Dict[str, Callable[[str, str], None]]] = None,
+                activity: str = "Exporting project",
+                progress: bool = True) -> ExportResult:
+    """Copy what changed from src_root into dest_root"""
+    t0 = time.perf_counter()
+    result = ExportResult()
+    if not os.path.isdir(src_root):
+        print(f"[Export] Source does not exist: {src_root}")
+        return result
+    os.makedirs(dest_root, exist_ok=True)
+    result.items = build_manifest(src_root, dest_root, mode, exclude, max_workers)
+    todo = [i for i in result.items if i.action == "copy"]
+    result.skipped = len(result.items) - len(todo)
+
+    last = [0.0]
+
+    def progress_cb(percent, n, total, eta_seconds):
+        now = time.monotonic()
+        if n < total and now - last[0] < PROGRESS_INTERVAL:
+            return  # progress.json is fsynced, not once per file
+        last[0] = now
+        write_progress_file(activity=activity, percent=percent,
+                            eta_seconds=eta_seconds, n=n, total=total)
+
+    if todo:
+        bar = FileProgressTqdm(total=len(todo), desc=activity, unit="file",
+                               progress_cb=progress_cb if progress else None)
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as pool:
+                futures = {pool.submit(_copy, item, converters or {}): item for item in todo}
+                for fut in as_completed(futures):
+                    item = futures[fut]
+                    try:
+                        fut.result()
+                        result.copied += 1
+                        result.bytes_copied += item.size
+                    except Exception as e:
+                        item.error = f"{type(e).__name__}: {e}"
+                        result.failed += 1
+                        print(f"[Export] {item.rel}: {item.error}")
+                    bar.update(1)
+        finally:
+            bar.close()
+    elif progress:
+        progress_cb(100.0, 0, 0, 0.0)
+
+    result.seconds = time.perf_counter() - t0
+    print(f"[Export] {src_root} -> {dest_root}: {result.summary()}")
+    return result
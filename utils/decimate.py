@@ -0,0 +1,150 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+"""
+Display decimation for large spectra and maps.
+
+A 220k point sweep drawn into a 1500 px wide PNG, or shipped to the
+webview as plotly JSON, carries ~100x more points than can be seen. These
+reduce what is drawn while keeping what the eye would see; the data that
+is exported (CSV / MAT / dataset / .sweep.npz) is never touched.
+
+    minmax(x, y_block, n_buckets)   min and max of every bucket, in order.
+                                    One bucket per pixel column draws the
+                                    same envelope as the full trace, so
+                                    narrow resonances / spikes survive.
+    lttb(x, y_block, n_out)         Largest-Triangle-Three-Buckets, closer
+                                    to the trace shape at fewer points.
+    for_plot(x, y_block, n_out)     either of them, untouched when short.
+    image(data, max_side)           block max of a 2D map (heat map preview).
+
+Rows of y_block are detectors sharing x; every row keeps its own points,
+so x comes back per row: (n_det, n_out).
+"""
+
+HTML_POINTS = 8000  # per trace, leaves some detail for zooming in the viewer
+
+
+def _rows(x, y_block) -> Tuple[np.ndarray, np.ndarray]:
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.atleast_2d(np.asarray(y_block))
+    if y.shape[1] != x.size:
+        raise ValueError(f"{y.shape[1]} points per row for {x.size} x values")
+    return x, y
+
+
+def _full(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return np.broadcast_to(x, y.shape), y
+
+
+def pixel_columns(fig, dpi: Optional[float] = None) -> int:
+    """Width of a matplotlib figure in pixels at dpi (default: its own)"""
+    return int(round(fig.get_figwidth() * (dpi or fig.dpi)))
+
+
+def minmax(x, y_block, n_buckets: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    2 * n_buckets + 2 points per row: first point, (min, max) of each
+    equal width bucket in x order, last point. NaN only buckets keep a NaN.
+    """
+    x, y = _rows(x, y_block)
+    n = x.size
+    n_buckets = int(n_buckets)
+    if n_buckets < 1 or 2 * n_buckets + 2 >= n:
+        return _full(x, y)
+    size = -(-n // n_buckets)
+    nb = -(-n // size)
+    nan = np.isnan(y)
+    lo = np.full((y.shape[0], nb * size), np.inf)
+    hi = np.full((y.shape[0], nb * size), -np.inf)
+    lo[:, :n] = np.where(nan, np.inf, y)
+    hi[:, :n] = np.where(nan, -np.inf, y)
+    base = np.arange(nb) * size
+    i_min = lo.reshape(-1, nb, size).argmin(axis=2) + base
+    i_max = hi.reshape(-1, nb, size).argmax(axis=2) + base
+    pairs = np.stack([np.minimum(i_min, i_max), np.maximum(i_min, i_max)], axis=2)
+    idx = np.empty((y.shape[0], 2 * nb + 2), dtype=np.intp)
+    idx[:, 0] = 0
+    idx[:, 1:-1] = pairs.reshape(y.shape[0], -1)
+    idx[:, -1] = n - 1
+    return x[idx], np.take_along_axis(y, idx, axis=1)
+
+
+def lttb(x, y_block, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets to n_out points per row. The choice in a
+    bucket depends on the previous one, so buckets are walked in order, all
+    rows and every point of a bucket at once.
+    """
+    x, y = _rows(x, y_block)
+    n = x.size
+    n_out = int(n_out)
+    if n_out < 3 or n_out >= n:
+        return _full(x, y)
+    rows = np.arange(y.shape[0])
+    yf = y.astype(np.float64)
+    finite = np.isfinite(yf)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)  # n_out - 2 buckets
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    # Bucket centroids, the third corner of every triangle
+    avg_x = np.add.reduceat(x[:-1], starts) / counts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_y = np.add.reduceat(np.where(finite, yf, 0.0)[:, :-1], starts, axis=1) / \
+            np.add.reduceat(finite[:, :-1], starts, axis=1)
+    idx = np.empty((y.shape[0], n_out), dtype=np.intp)
+    idx[:, 0] = 0
+    idx[:, -1] = n - 1
+    prev_x = np.full(y.shape[0], x[0])
+    prev_y = yf[:, 0]
+    last = len(starts) - 1
+    for b, (s, e) in enumerate(zip(starts, edges[1:])):
+        if b < last:
+            nx, ny = avg_x[b + 1], avg_y[:, b + 1]
+        else:
+            nx, ny = x[-1], yf[:, -1]
+        xs, ys = x[s:e], yf[:, s:e]
+        area = np.abs((prev_x - nx)[:, None] * (ys - prev_y[:, None])
+                      - (prev_x[:, None] - xs) * (ny - prev_y)[:, None])
+        area[~np.isfinite(area)] = -1.0
+        pick = s + area.argmax(axis=1)
+        idx[:, b + 1] = pick
+        prev_x = x[pick]
+        prev_y = yf[rows, pick]
+    return x[idx], np.take_along_axis(y, idx, axis=1)
+
+
+def for_plot(x, y_block, n_out: Optional[int] = HTML_POINTS,
+             method: str = "minmax") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    At most ~n_out points per row for drawing, (x rows, y rows).
+    n_out None draws everything.
+    """
+    x, y = _rows(x, y_block)
+    if n_out is None or x.size <= n_out:
+        return _full(x, y)
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    return minmax(x, y, max(1, (n_out - 2) // 2))
+
+
+def image(data, max_side: int = 512) -> np.ndarray:
+    """
+    data reduced to at most max_side per axis by the nanmax of each block
+    (peaks of a power map stay visible). Same extent, coarser pixels.
+    """
+    data = np.asarray(data)
+    ny, nx = data.shape
+    fy = -(-ny // max_side) if ny > max_side else 1
+    fx = -(-nx // max_side) if nx > max_side else 1
+    if fy == 1 and fx == 1:
+        return data
+    out_y, out_x = -(-ny // fy), -(-nx // fx)
+    padded = np.full((out_y * fy, out_x * fx), np.nan)
+    padded[:ny, :nx] = data
+    blocks = padded.reshape(out_y, fy, out_x, fx)
+    with np.errstate(invalid="ignore"):
+        finite = np.isfinite(blocks).any(axis=(1, 3))
+        reduced = np.where(np.isnan(blocks), -np.inf, blocks).max(axis=(1, 3))
+    return np.where(finite, reduced, np.nan)
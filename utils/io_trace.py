@@ -0,0 +1,551 @@
+import ctypes
+import os
+import struct
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+"""
+Record / replay of instrument I/O.
+
+Wraps the instrument channels the drivers talk through:
+    - pyvisa resources (NIR 816x frames, Corvus stage, ...)
+    - ctypes libraries (hp816x_64.dll)
+    - line based sessions (Luna TCP session, Iris serial port)
+and logs every call as (channel, method, command, response, start, duration)
+to a compact binary trace. Replay serves the responses of a trace back in
+the same per channel order, sleeping the recorded durations (times scale),
+so NIRManager / StageManager / measurement code runs offline with production
+latencies and can be benchmarked or profiled.
+
+Drivers get their handles through resource_manager(), load_library() and
+wrap_session(), which are transparent while tracing is off. Tracing is set
+up before connecting, either from code or with the IDA_IO_TRACE environment
+variable:
+    IDA_IO_TRACE=record:C:/traces/run1.idt
+    IDA_IO_TRACE=replay:C:/traces/run1.idt[:scale]
+
+File layout: MAGIC, then records of
+    <B kind><B flags><H channel><d start s><d duration s><I len cmd><I len resp>
+followed by the command and response bytes. Kind 0 declares a channel name
+(command = name), kind 1 is a call. Responses are tagged (_encode).
+"""
+
+MAGIC = b"IDATRC\x00\x01"
+_HEADER = struct.Struct("<BBHddII")
+
+KIND_CHANNEL = 0
+KIND_CALL = 1
+FLAG_ERROR = 1
+
+_SEP = "\x1f"  # method / command separator inside a call record
+
+# Methods recorded per session kind
+VISA_METHODS = ("write", "query", "read", "write_raw", "read_raw", "read_bytes",
+                "query_binary_values", "query_ascii_values", "clear")
+SESSION_METHODS = ("write", "query", "read", "read_until", "readline",
+                   "reset_input_buffer", "reset_output_buffer", "flush")
+
+
+class TraceMismatch(RuntimeError):
+    """Replay got a call the trace has no response for"""
+
+
+class TraceRecord(NamedTuple):
+    channel: str
+    method: str
+    command: str
+    response: Any
+    start_s: float
+    duration_s: float
+    error: bool
+
+
+######################################################################
+# Value encoding
+######################################################################
+
+def _encode(value) -> bytes:
+    """Type tagged bytes for str / bytes / numbers / arrays / ctypes outputs"""
+    if value is None:
+        return b"n"
+    if isinstance(value, str):
+        return b"s" + value.encode("utf-8", "surrogateescape")
+    if isinstance(value, (bytes, bytearray)):
+        return b"b" + bytes(value)
+    if isinstance(value, (bool, np.bool_)):
+        return b"?" + (b"\x01" if value else b"\x00")
+    if isinstance(value, (int, np.integer)):
+        return b"i" + struct.pack("<q", int(value))
+    if isinstance(value, (float, np.floating)):
+        return b"f" + struct.pack("<d", float(value))
+    if isinstance(value, np.ndarray):
+        dt = value.dtype.str.encode("ascii")
+        return b"a" + bytes([len(dt)]) + dt + np.ascontiguousarray(value).tobytes()
+    if isinstance(value, list):
+        return b"l" + np.asarray(value, dtype=np.float64).tobytes()
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], dict):
+        # ctypes call: (return value, {arg index: output buffer bytes})
+        ret, outs = value
+        body = _encode(ret)
+        parts = [struct.pack("<HI", len(outs), len(body)), body]
+        for idx, data in outs.items():
+            parts.append(struct.pack("<HI", idx, len(data)))
+            parts.append(data)
+        return b"c" + b"".join(parts)
+    return b"s" + repr(value).encode("utf-8", "surrogateescape")
+
+
+def _decode(data: bytes):
+    tag, body = data[:1], data[1:]
+    if tag == b"n":
+        return None
+    if tag == b"s":
+        return body.decode("utf-8", "surrogateescape")
+    if tag == b"b":
+        return body
+    if tag == b"?":
+        return body == b"\x01"
+    if tag == b"i":
+        return struct.unpack("<q", body)[0]
+    if tag == b"f":
+        return struct.unpack("<d", body)[0]
+    if tag == b"a":
+        n = body[0]
+        return np.frombuffer(body[1 + n:], dtype=np.dtype(body[1:1 + n].decode("ascii"))).copy()
+    if tag == b"l":
+        return np.frombuffer(body, dtype=np.float64).tolist()
+    if tag == b"c":
+        n_out, n_ret = struct.unpack_from("<HI", body, 0)
+        pos = 6
+        ret = _decode(body[pos:pos + n_ret])
+        pos += n_ret
+        outs = {}
+        for _ in range(n_out):
+            idx, n = struct.unpack_from("<HI", body, pos)
+            pos += 6
+            outs[idx] = body[pos:pos + n]
+            pos += n
+        return ret, outs
+    raise ValueError(f"unknown trace value tag {tag!r}")
+
+
+def _ctypes_target(arg):
+    """ctypes object an argument points at (byref / pointer / array / struct), else None"""
+    if type(arg).__name__ == "CArgObject":
+        return getattr(arg, "_obj", None)
+    if isinstance(arg, ctypes._Pointer):
+        return arg.contents if arg else None
+    if isinstance(arg, (ctypes.Array, ctypes.Structure, ctypes.Union)):
+        return arg
+    return None
+
+
+def _ctypes_outputs(args) -> Dict[int, bytes]:
+    outs = {}
+    for i, arg in enumerate(args):
+        obj = _ctypes_target(arg)
+        if obj is not None:
+            outs[i] = ctypes.string_at(ctypes.addressof(obj), ctypes.sizeof(obj))
+    return outs
+
+
+def _ctypes_command(name: str, args) -> str:
+    """Call signature used for matching, pointer arguments shown as *"""
+    shown = []
+    for arg in args:
+        if _ctypes_target(arg) is not None:
+            shown.append("*")
+        elif isinstance(arg, ctypes._SimpleCData):
+            shown.append(repr(arg.value))
+        else:
+            shown.append(repr(arg))
+    return f"{name}({', '.join(shown)})"
+
+
+######################################################################
+# Recording
+######################################################################
+
+class TraceRecorder:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._fh = open(path, "wb")
+        self._fh.write(MAGIC)
+        self._lock = threading.Lock()
+        self._channels: Dict[str, int] = {}
+        self._t0 = time.perf_counter()
+        self.records = 0
+
+    def _channel_id(self, name: str) -> int:
+        cid = self._channels.get(name)
+        if cid is None:
+            cid = len(self._channels)
+            self._channels[name] = cid
+            data = name.encode("utf-8")
+            self._fh.write(_HEADER.pack(KIND_CHANNEL, 0, cid, 0.0, 0.0, len(data), 0) + data)
+        return cid
+
+    def record(self, channel: str, method: str, command, response,
+               start: float, duration: float, error: bool = False) -> None:
+        cmd = (method + _SEP + (command if isinstance(command, str) else repr(command))).encode(
+            "utf-8", "surrogateescape")
+        resp = _encode(response)
+        with self._lock:
+            if self._fh is None:
+                return
+            cid = self._channel_id(channel)
+            self._fh.write(_HEADER.pack(KIND_CALL, FLAG_ERROR if error else 0, cid,
+                                        start - self._t0, duration, len(cmd), len(resp)))
+            self._fh.write(cmd)
+            self._fh.write(resp)
+            self.records += 1
+
+    def call(self, channel: str, method: str, command, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) and record it, exceptions recorded and re-raised"""
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(channel, method, command, f"{type(e).__name__}: {e}",
+                        t0, time.perf_counter() - t0, error=True)
+            raise
+        self.record(channel, method, command, result, t0, time.perf_counter() - t0)
+        return result
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class _TracedObject:
+    """Proxy recording the listed methods of a session, everything else passes through"""
+
+    def __init__(self, target, recorder: TraceRecorder, channel: str, methods: Sequence[str]):
+        object.__setattr__(self, "_target", target)
+        object.__setattr__(self, "_recorder", recorder)
+        object.__setattr__(self, "_channel", channel)
+        object.__setattr__(self, "_methods", frozenset(methods))
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name not in self._methods or not callable(attr):
+            return attr
+
+        def traced(*args, **kwargs):
+            command = args[0] if len(args) == 1 and not kwargs else repr((args, kwargs))
+            return self._recorder.call(self._channel, name, command, attr, *args, **kwargs)
+        return traced
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+
+class TracedResourceManager:
+    def __init__(self, rm, recorder: TraceRecorder):
+        self._rm = rm
+        self._recorder = recorder
+
+    def open_resource(self, resource_name: str, *args, **kwargs):
+        inst = self._recorder.call(f"visa:{resource_name}", "open_resource", resource_name,
+                                   self._rm.open_resource, resource_name, *args, **kwargs)
+        return _TracedObject(inst, self._recorder, f"visa:{resource_name}", VISA_METHODS)
+
+    def __getattr__(self, name):
+        return getattr(self._rm, name)
+
+
+class _TracedFunction:
+    def __init__(self, fn, recorder: TraceRecorder, channel: str, name: str):
+        self.__dict__.update(_fn=fn, _recorder=recorder, _channel=channel, _name=name)
+
+    def __call__(self, *args):
+        t0 = time.perf_counter()
+        ret = self._fn(*args)
+        self._recorder.record(self._channel, "call", _ctypes_command(self._name, args),
+                              (ret, _ctypes_outputs(args)), t0, time.perf_counter() - t0)
+        return ret
+
+    # argtypes / restype set by the drivers go to the real function
+    def __getattr__(self, name):
+        return getattr(self._fn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._fn, name, value)
+
+
+class TracedLibrary:
+    def __init__(self, lib, recorder: TraceRecorder, channel: str):
+        self._lib = lib
+        self._recorder = recorder
+        self._channel = channel
+        self._functions: Dict[str, _TracedFunction] = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        fn = self._functions.get(name)
+        if fn is None:
+            fn = _TracedFunction(getattr(self._lib, name), self._recorder, self._channel, name)
+            self._functions[name] = fn
+        return fn
+
+
+######################################################################
+# Replay
+######################################################################
+
+def read_trace(path: str) -> Iterator[TraceRecord]:
+    with open(path, "rb") as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an I/O trace")
+        names: Dict[int, str] = {}
+        while True:
+            head = fh.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                return
+            kind, flags, cid, start, dur, n_cmd, n_resp = _HEADER.unpack(head)
+            cmd = fh.read(n_cmd)
+            resp = fh.read(n_resp)
+            if kind == KIND_CHANNEL:
+                names[cid] = cmd.decode("utf-8")
+                continue
+            method, _, command = cmd.decode("utf-8", "surrogateescape").partition(_SEP)
+            yield TraceRecord(names.get(cid, str(cid)), method, command, _decode(resp),
+                              start, dur, bool(flags & FLAG_ERROR))
+
+
+def summarise(path: str) -> List[Dict[str, Any]]:
+    """Calls and I/O time per (channel, method), slowest first"""
+    acc: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+    for rec in read_trace(path):
+        a = acc[(rec.channel, rec.method)]
+        a[0] += 1
+        a[1] += rec.duration_s
+        a[2] = max(a[2], rec.duration_s)
+    rows = [{"channel": ch, "method": m, "calls": int(n), "total_s": tot,
+             "mean_ms": 1e3 * tot / n, "max_ms": 1e3 * mx}
+            for (ch, m), (n, tot, mx) in acc.items()]
+    return sorted(rows, key=lambda r: r["total_s"], reverse=True)
+
+
+class TraceReplay:
+    def __init__(self, path: str, scale: float = 1.0, lookahead: int = 64):
+        """
+        :param scale: recorded durations are slept times scale, 0 = no waiting
+        :param lookahead: records a call may skip on its channel to find its match
+        """
+        self.path = path
+        self.scale = float(scale)
+        self.lookahead = lookahead
+        self._queues: Dict[str, Deque[TraceRecord]] = defaultdict(deque)
+        for rec in read_trace(path):
+            self._queues[rec.channel].append(rec)
+        self._lock = threading.Lock()
+        self.served = 0
+        self.skipped = 0
+
+    def take(self, channel: str, method: str, command: str) -> TraceRecord:
+        with self._lock:
+            q = self._queues.get(channel)
+            if not q:
+                raise TraceMismatch(f"trace has no more calls on {channel} ({method} {command!r})")
+            for i, rec in enumerate(q):
+                if i > self.lookahead:
+                    break
+                if rec.method == method and rec.command == command:
+                    for _ in range(i):
+                        q.popleft()
+                    q.popleft()
+                    self.skipped += i
+                    self.served += 1
+                    break
+            else:
+                raise TraceMismatch(f"{channel}: {method} {command!r} not found, next is "
+                                    f"{q[0].method} {q[0].command!r}")
+        if self.scale > 0 and rec.duration_s > 0:
+            time.sleep(rec.duration_s * self.scale)
+        return rec
+
+    def serve(self, channel: str, method: str, command: str):
+        rec = self.take(channel, method, command)
+        if rec.error:
+            raise RuntimeError(f"(replayed) {rec.response}")
+        return rec.response
+
+    def peek(self, channel: str) -> Optional[TraceRecord]:
+        with self._lock:
+            q = self._queues.get(channel)
+            return q[0] if q else None
+
+    def remaining(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+
+class _ReplayObject:
+    """Stands in for a session, recorded methods answer from the trace"""
+
+    def __init__(self, replay: TraceReplay, channel: str, methods: Sequence[str]):
+        object.__setattr__(self, "_replay", replay)
+        object.__setattr__(self, "_channel", channel)
+        object.__setattr__(self, "_methods", frozenset(methods))
+        object.__setattr__(self, "_attrs", {})
+
+    @property
+    def in_waiting(self) -> int:
+        nxt = self._replay.peek(self._channel)
+        if nxt is None or not nxt.method.startswith("read") or not isinstance(nxt.response, bytes):
+            return 0
+        return len(nxt.response)
+
+    def __getattr__(self, name):
+        if name in self._attrs:
+            return self._attrs[name]
+        if name in self._methods:
+            def replayed(*args, **kwargs):
+                command = args[0] if len(args) == 1 and not kwargs else repr((args, kwargs))
+                if not isinstance(command, str):
+                    command = repr(command)
+                return self._replay.serve(self._channel, name, command)
+            return replayed
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *a, **k: None  # open / close / lock handling etc.
+
+    def __setattr__(self, name, value):
+        self._attrs[name] = value
+
+
+class ReplayResourceManager:
+    def __init__(self, replay: TraceReplay):
+        self._replay = replay
+
+    def open_resource(self, resource_name: str, *args, **kwargs):
+        channel = f"visa:{resource_name}"
+        self._replay.serve(channel, "open_resource", resource_name)
+        return _ReplayObject(self._replay, channel, VISA_METHODS)
+
+    def list_resources(self, *args, **kwargs):
+        return tuple(sorted(ch[5:] for ch in self._replay._queues if ch.startswith("visa:")))
+
+    def close(self):
+        pass
+
+
+class _ReplayFunction:
+    def __init__(self, replay: TraceReplay, channel: str, name: str):
+        self.__dict__.update(_replay=replay, _channel=channel, _name=name)
+
+    def __call__(self, *args):
+        ret, outs = self._replay.serve(self._channel, "call", _ctypes_command(self._name, args))
+        for idx, data in outs.items():
+            obj = _ctypes_target(args[idx]) if idx < len(args) else None
+            if obj is not None:
+                ctypes.memmove(ctypes.addressof(obj), data, min(len(data), ctypes.sizeof(obj)))
+        return ret
+
+    def __setattr__(self, name, value):
+        pass  # argtypes / restype are irrelevant offline
+
+
+class ReplayLibrary:
+    def __init__(self, replay: TraceReplay, channel: str):
+        self._replay = replay
+        self._channel = channel
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return _ReplayFunction(self._replay, self._channel, name)
+
+
+######################################################################
+# Driver entry points
+######################################################################
+
+_recorder: Optional[TraceRecorder] = None
+_replay: Optional[TraceReplay] = None
+
+
+def start_recording(path: str) -> TraceRecorder:
+    global _recorder, _replay
+    stop()
+    _recorder = TraceRecorder(path)
+    _replay = None
+    return _recorder
+
+
+def start_replay(path: str, scale: float = 1.0) -> TraceReplay:
+    global _replay
+    stop()
+    _replay = TraceReplay(path, scale)
+    return _replay
+
+
+def stop() -> None:
+    global _recorder, _replay
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+    _replay = None
+
+
+def mode() -> str:
+    return "record" if _recorder is not None else "replay" if _replay is not None else "off"
+
+
+def resource_manager(visa_library: str = ""):
+    """pyvisa.ResourceManager, recorded or replayed when tracing"""
+    if _replay is not None:
+        return ReplayResourceManager(_replay)
+    import pyvisa
+    rm = pyvisa.ResourceManager(visa_library) if visa_library else pyvisa.ResourceManager()
+    return TracedResourceManager(rm, _recorder) if _recorder is not None else rm
+
+
+def load_library(path: str):
+    """ctypes.WinDLL(path), recorded or replayed (without loading the DLL) when tracing"""
+    channel = f"dll:{os.path.basename(path)}"
+    if _replay is not None:
+        return ReplayLibrary(_replay, channel)
+    lib = ctypes.WinDLL(path)
+    return TracedLibrary(lib, _recorder, channel) if _recorder is not None else lib
+
+
+def wrap_session(session, channel: str, methods: Sequence[str] = SESSION_METHODS):
+    """Socket / serial style session, recorded or replaced by its replay when tracing"""
+    if _replay is not None:
+        return _ReplayObject(_replay, channel, methods)
+    if _recorder is not None and session is not None:
+        return _TracedObject(session, _recorder, channel, methods)
+    return session
+
+
+def _from_env() -> None:
+    spec = os.environ.get("IDA_IO_TRACE", "").strip()
+    if not spec:
+        return
+    kind, _, rest = spec.partition(":")
+    try:
+        if kind == "record":
+            start_recording(rest)
+        elif kind == "replay":
+            path, scale = rest, 1.0
+            head, sep, tail = rest.rpartition(":")
+            if sep and head and tail.replace(".", "", 1).isdigit():
+                path, scale = head, float(tail)
+            start_replay(path, scale)
+        else:
+            print(f"[IOTrace] Unknown IDA_IO_TRACE mode '{kind}'")
+    except Exception as e:
+        print(f"[IOTrace] Could not start {kind}: {e}")
+
+
+_from_env()
@@ -0,0 +1,280 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+"""
+SQLite catalog of the measurement results of one user / project.
+
+Every sweep written by the export path adds one row, so finding results
+is an indexed query instead of a walk over UserData/<user>/<project>/*:
+
+    cat = open_catalog("./UserData/me/project")       # <project>/results.sqlite
+    cat.add(device="ring_12 (12)", kind="spectrum", directory=..., stem=...,
+            files=["csv", "html"], x=..., y=..., polarization="TE",
+            wavelength="1550", device_type="ring", align_ok=True, align_loss=-21.3)
+    cat.query(device_type="ring", wavelength="1550", since=time.time() - 86400)
+    cat.latest("ring_12 (12)")
+
+WAL mode: the GUI writes while the testing GUI / analysis scripts read,
+from other processes, without blocking each other. Directories are stored
+relative to the project, so a catalog stays valid when the project is
+copied; merge() folds another project's catalog in (exports), index_tree()
+fills one from a project written before the catalog existed.
+"""
+
+FILE_NAME = "results.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    device        TEXT NOT NULL,
+    device_num    INTEGER,
+    device_type   TEXT,
+    kind          TEXT,
+    x             REAL,
+    y             REAL,
+    polarization  TEXT,
+    wavelength    TEXT,
+    time          REAL NOT NULL,
+    file_time     TEXT,
+    auto          INTEGER,
+    align_ok      INTEGER,
+    align_loss    REAL,
+    directory     TEXT,
+    stem          TEXT,
+    files         TEXT,
+    meta          TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_results_device ON results (device, time);
+CREATE INDEX IF NOT EXISTS idx_results_type ON results (device_type, wavelength, time);
+CREATE INDEX IF NOT EXISTS idx_results_pol ON results (polarization, wavelength, time);
+CREATE INDEX IF NOT EXISTS idx_results_time ON results (time);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_results_stem ON results (directory, stem);
+"""
+
+_COLUMNS = ("device, device_num, device_type, kind, x, y, polarization, wavelength, time,"
+            " file_time, auto, align_ok, align_loss, directory, stem, files, meta")
+
+# query() keyword -> column
+_FILTERS = {
+    "device": "device",
+    "device_num": "device_num",
+    "device_type": "device_type",
+    "kind": "kind",
+    "polarization": "polarization",
+    "wavelength": "wavelength",
+    "align_ok": "align_ok",
+    "auto": "auto",
+}
+
+_STEM = re.compile(r"^(?P<prefix>.+?)_(?P<time>\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})$")
+_KINDS = {"Spectrum": "spectrum", "OVA": "ova", "LD_Sweep": "ld_sweep"}
+
+
+def _row(cursor: sqlite3.Cursor, values) -> Dict[str, Any]:
+    out = {d[0]: v for d, v in zip(cursor.description, values)}
+    for key in ("files", "meta"):
+        if out.get(key):
+            try:
+                out[key] = json.loads(out[key])
+            except ValueError:
+                pass
+    if out.get("align_ok") is not None:
+        out["align_ok"] = bool(out["align_ok"])
+    return out
+
+
+class ResultsCatalog:
+    def __init__(self, path: str):
+        if os.path.isdir(path) or not path.endswith(".sqlite"):
+            path = os.path.join(path, FILE_NAME)
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+        self._conn.row_factory = _row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _relative(self, directory: Optional[str]) -> Optional[str]:
+        """directory relative to the project ("/" separated), absolute if outside it"""
+        if directory is None:
+            return None
+        rel = os.path.relpath(os.path.abspath(directory), self.root)
+        if rel.startswith(".."):
+            return os.path.abspath(directory)
+        return rel.replace(os.sep, "/")
+
+    ######################################################################
+    # Writing
+    ######################################################################
+
+    def add(self, device: str, kind: str = "spectrum", directory: Optional[str] = None,
+            stem: Optional[str] = None, files: Iterable[str] = (),
+            t: Optional[float] = None, file_time: Optional[str] = None,
+            device_num: Optional[int] = None, device_type: Optional[str] = None,
+            x: Optional[float] = None, y: Optional[float] = None,
+            polarization: Optional[str] = None, wavelength: Optional[str] = None,
+            auto: Optional[bool] = None, align_ok: Optional[bool] = None,
+            align_loss: Optional[float] = None,
+            meta: Optional[Dict[str, Any]] = None) -> int:
+        """
+        One result, returns its id. directory + stem (file name without
+        extension) locate the files, files lists the extensions written.
+        The same directory / stem again replaces the row.
+        """
+        row = (
+            str(device), device_num, device_type, kind, x, y, polarization,
+            None if wavelength is None else str(wavelength),
+            time.time() if t is None else float(t), file_time,
+            None if auto is None else int(bool(auto)),
+            None if align_ok is None else int(bool(align_ok)), align_loss,
+            self._relative(directory), stem,
+            json.dumps(list(files)), json.dumps(meta, default=str) if meta else None,
+        )
+        with self._lock, self._conn:
+            cur = self._conn.execute(
+                f"INSERT OR REPLACE INTO results ({_COLUMNS}) VALUES ({','.join('?' * len(row))})", row)
+            return int(cur.lastrowid)
+
+    ######################################################################
+    # Queries
+    ######################################################################
+
+    def query(self, since: Optional[float] = None, until: Optional[float] = None,
+              limit: Optional[int] = None, newest_first: bool = True,
+              **filters) -> List[Dict[str, Any]]:
+        """
+        Rows matching every given filter (device, device_num, device_type,
+        kind, polarization, wavelength, align_ok, auto). A list / tuple
+        value matches any of its entries. since / until are epoch seconds.
+        """
+        where, args = [], []
+        for key, value in filters.items():
+            column = _FILTERS.get(key)
+            if column is None:
+                raise KeyError(f"unknown filter {key!r}")
+            if value is None:
+                continue
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (list, tuple, set)):
+                value = list(value)
+                where.append(f"{column} IN ({','.join('?' * len(value))})")
+                args.extend(value)
+            else:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("time >= ?")
+            args.append(float(since))
+        if until is not None:
+            where.append("time < ?")
+            args.append(float(until))
+        sql = "SELECT * FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY time " + ("DESC" if newest_first else "ASC")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def latest(self, device: str, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        rows = self.query(device=device, kind=kind, limit=1)
+        return rows[0] if rows else None
+
+    def devices(self) -> List[str]:
+        with self._lock:
+            return [r["device"] for r in
+                    self._conn.execute("SELECT DISTINCT device FROM results ORDER BY device")]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) AS n FROM results").fetchone()["n"]
+
+    def paths(self, row: Dict[str, Any]) -> List[str]:
+        """File paths of a result row"""
+        if row.get("directory") is None or not row.get("stem"):
+            return []
+        directory = os.path.join(self.root, row["directory"])
+        return [os.path.join(directory, f"{row['stem']}.{ext}") for ext in row.get("files") or []]
+
+    def merge(self, other_path: str) -> int:
+        """Add the rows of another catalog file not in this one, returns how many"""
+        if not os.path.exists(other_path):
+            return 0
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.execute("ATTACH DATABASE ? AS other", (other_path,))
+            try:
+                self._conn.execute(f"INSERT OR IGNORE INTO results ({_COLUMNS}) "
+                                   f"SELECT {_COLUMNS} FROM other.results")
+            finally:
+                self._conn.commit()
+                self._conn.execute("DETACH DATABASE other")
+            return self._conn.total_changes - before
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    ######################################################################
+    # Backfill
+    ######################################################################
+
+    def index_tree(self, project_root: str) -> int:
+        """
+        Add results found on disk (<project>/<Spectrum|OVA|LD_Sweep>/<device>/
+        <prefix>_<YYYY-mm-dd_HH-MM-SS>.<ext>) that are not in the catalog yet.
+        Only what the file names tell is known (device, kind, time, files).
+        """
+        known = set()
+        with self._lock:
+            for r in self._conn.execute("SELECT directory, stem FROM results"):
+                known.add((r["directory"], r["stem"]))
+        n = 0
+        for folder, kind in _KINDS.items():
+            base = os.path.join(project_root, folder)
+            if not os.path.isdir(base):
+                continue
+            for device in sorted(os.listdir(base)):
+                directory = os.path.join(base, device)
+                if not os.path.isdir(directory):
+                    continue
+                found: Dict[str, List[str]] = {}
+                for f in os.listdir(directory):
+                    stem, ext = f.split(".", 1) if "." in f else (f, "")
+                    if _STEM.match(stem):
+                        found.setdefault(stem, []).append(ext)
+                for stem, exts in sorted(found.items()):
+                    if (self._relative(directory), stem) in known:
+                        continue
+                    file_time = _STEM.match(stem).group("time")
+                    try:
+                        t = time.mktime(time.strptime(file_time, "%Y-%m-%d_%H-%M-%S"))
+                    except ValueError:
+                        continue
+                    self.add(device, kind, directory, stem, sorted(exts), t=t, file_time=file_time)
+                    n += 1
+        return n
+
+
+_catalogs: Dict[str, ResultsCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def open_catalog(project_root: str) -> ResultsCatalog:
+    """Shared catalog of a project directory (one connection per process)"""
+    path = os.path.abspath(os.path.join(project_root, FILE_NAME))
+    with _catalogs_lock:
+        cat = _catalogs.get(path)
+        if cat is None:
+            cat = _catalogs[path] = ResultsCatalog(path)
+        return cat
@@ -0,0 +1,256 @@
+import json
+import os
+import struct
+import sys
+import zlib
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+from NIR.utils.spectrum_result import SpectrumResult
+
+try:
+    import zstandard
+except ImportError:  # zlib fallback, files stay readable wherever zstandard is
+    zstandard = None
+
+"""
+Compact file codec for one sweep (.spz), CSV on demand.
+
+    save("dev_12_...spz", wl, detectors, channels=slot_info)   # centi-dB
+    spec = load("dev_12_...spz")                               # SpectrumResult
+    to_csv("dev_12_...spz")                                    # same columns as plot's CSV
+    csv_pending(".../Spectrum")                                # every .spz without its .csv
+
+Layout: MAGIC, u32 header length, JSON header, compressed payload.
+
+    grid       uniform -> (start, step, n) only, else the float64 grid
+               (uniform = every point within GRID_TOL of start + i * step)
+    precision  "centi_db"  int32 round(dBm * 100): |error| <= 0.005 dB,
+                           delta encoded along the sweep
+               "float32"   exact float32 values
+               "float64"   exact
+    y_norm     optional normalised rows [dB], stored after the detectors
+               (header "n_norm"), back as spec.meta["y_norm"]
+    payload    byte shuffled (byte planes of the values together), then
+               zstd when zstandard is installed, zlib otherwise
+
+NaN / +-inf survive every precision (reserved int32 codes in centi_db).
+"""
+
+MAGIC = b"IDASPZ1\0"
+SUFFIX = ".spz"
+GRID_TOL = 1e-9  # nm
+PRECISIONS = ("centi_db", "float32", "float64")
+
+_SCALE = 100.0
+_NAN = np.iinfo(np.int32).min
+_POS_INF = np.iinfo(np.int32).max
+_NEG_INF = _NAN + 1
+_LIMIT = _POS_INF - 1  # |dBm| * 100 beyond this is not representable
+
+
+######################################################################
+# Pieces
+######################################################################
+
+def uniform_grid(wl) -> Optional[Dict[str, Any]]:
+    """{"start", "step", "n"} when wl is start + i * step (within GRID_TOL)"""
+    wl = np.asarray(wl, dtype=np.float64).ravel()
+    n = wl.size
+    if n < 2:
+        return None
+    step = (wl[-1] - wl[0]) / (n - 1)
+    if step == 0 or np.max(np.abs(wl - (wl[0] + step * np.arange(n)))) > GRID_TOL:
+        return None
+    return {"start": float(wl[0]), "step": float(step), "n": int(n)}
+
+
+def _shuffle(raw: np.ndarray) -> bytes:
+    """Byte planes: all first bytes, all second bytes, ..."""
+    b = raw.view(np.uint8).reshape(-1, raw.dtype.itemsize)
+    return np.ascontiguousarray(b.T).tobytes()
+
+
+def _unshuffle(buf: bytes, dtype: np.dtype, count: int) -> np.ndarray:
+    b = np.frombuffer(buf, dtype=np.uint8).reshape(dtype.itemsize, count)
+    return np.ascontiguousarray(b.T).view(dtype).ravel()
+
+
+def _compress(data: bytes, level: int):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=level).compress(data)
+    return "zlib", zlib.compress(data, min(level, 9))
+
+
+def _decompress(name: str, data: bytes) -> bytes:
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("file compressed with zstd, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _to_centi(block: np.ndarray) -> np.ndarray:
+    q = np.rint(np.clip(block, -_LIMIT / _SCALE, _LIMIT / _SCALE) * _SCALE)
+    q = np.where(np.isnan(block), _NAN, q)
+    q = np.where(block == np.inf, _POS_INF, q)
+    q = np.where(block == -np.inf, _NEG_INF, q)
+    q = q.astype(np.int32)
+    # First value of each row, then the step to the next one (wraps like int32)
+    d = q.copy()
+    d[:, 1:] = np.diff(q, axis=1)
+    return d
+
+
+def _from_centi(d: np.ndarray, dtype) -> np.ndarray:
+    q = np.cumsum(d, axis=1, dtype=np.int32)
+    out = q.astype(dtype) / dtype.type(_SCALE)
+    out[q == _NAN] = np.nan
+    out[q == _POS_INF] = np.inf
+    out[q == _NEG_INF] = -np.inf
+    return out
+
+
+######################################################################
+# Codec
+######################################################################
+
+def encode(wl, detectors, precision: str = "centi_db",
+           channels: Optional[Sequence] = None, meta: Optional[Dict[str, Any]] = None,
+           level: int = 3, y_norm=None) -> bytes:
+    if precision not in PRECISIONS:
+        raise ValueError(f"precision must be one of {PRECISIONS}")
+    wl = np.asarray(wl, dtype=np.float64).ravel()
+    block = np.atleast_2d(np.asarray(detectors))
+    if block.shape[1] != wl.size:
+        raise ValueError(f"{block.shape[1]} points per detector for {wl.size} wavelengths")
+    if channels is None and isinstance(detectors, SpectrumResult):
+        channels = detectors.channels
+    n_det = block.shape[0]
+    if y_norm is not None:
+        norm = np.atleast_2d(np.asarray(y_norm))
+        if norm.shape[1] != wl.size:
+            raise ValueError(f"{norm.shape[1]} normalised points for {wl.size} wavelengths")
+        block = np.vstack([block, norm])
+
+    grid = uniform_grid(wl)
+    parts = [] if grid is not None else [_shuffle(wl)]
+    if precision == "centi_db":
+        values = _to_centi(block.astype(np.float64, copy=False))
+    else:
+        values = np.ascontiguousarray(block, dtype=precision)
+    parts.append(_shuffle(values))
+    compressor, payload = _compress(b"".join(parts), level)
+
+    header = {
+        "n_det": int(n_det),
+        "n_norm": int(block.shape[0] - n_det),
+        "n_pts": int(block.shape[1]),
+        "grid": grid,
+        "precision": precision,
+        "compressor": compressor,
+        "channels": [list(c) for c in channels] if channels is not None else None,
+        "meta": meta or {},
+    }
+    head = json.dumps(header, default=str).encode("utf-8")
+    return MAGIC + struct.pack("<I", len(head)) + head + payload
+
+
+def decode(data: bytes, dtype="float64") -> SpectrumResult:
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("not a .spz sweep")
+    pos = len(MAGIC)
+    (n_head,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    header = json.loads(data[pos:pos + n_head].decode("utf-8"))
+    raw = _decompress(header["compressor"], data[pos + n_head:])
+    n_det, n_pts = header["n_det"], header["n_pts"]
+    n_rows = n_det + header.get("n_norm", 0)
+
+    grid = header["grid"]
+    if grid is not None:
+        wl = grid["start"] + grid["step"] * np.arange(grid["n"], dtype=np.float64)
+        offset = 0
+    else:
+        wl = _unshuffle(raw[:n_pts * 8], np.dtype(np.float64), n_pts)
+        offset = n_pts * 8
+
+    precision = header["precision"]
+    stored = np.dtype(np.int32) if precision == "centi_db" else np.dtype(precision)
+    values = _unshuffle(raw[offset:], stored, n_rows * n_pts).reshape(n_rows, n_pts)
+    out_dtype = np.dtype(dtype)
+    if precision == "centi_db":
+        block = _from_centi(values, out_dtype)
+    else:
+        block = values.astype(out_dtype, copy=False)
+    meta = header["meta"]
+    if n_rows > n_det:
+        meta["y_norm"] = block[n_det:]
+    return SpectrumResult(wl, block[:n_det], header["channels"], meta)
+
+
+def save(path: str, wl, detectors, precision: str = "centi_db",
+         channels: Optional[Sequence] = None, meta: Optional[Dict[str, Any]] = None,
+         y_norm=None) -> str:
+    if not path.endswith(SUFFIX):
+        path += SUFFIX
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode(wl, detectors, precision, channels, meta, y_norm=y_norm))
+    os.replace(tmp, path)
+    return path
+
+
+def load(path: str, dtype="float64") -> SpectrumResult:
+    with open(path, "rb") as f:
+        return decode(f.read(), dtype)
+
+
+def to_csv(path: str, csv_path: Optional[str] = None) -> str:
+    """CSV export of a stored sweep, in plot's layout ("Wavelength [nm]", "Detector 1", ...)"""
+    import pandas as pd
+    spec = load(path)
+    if csv_path is None:
+        csv_path = path[:-len(SUFFIX)] + ".csv" if path.endswith(SUFFIX) else path + ".csv"
+    df = pd.DataFrame(spec.power_dbm.T, copy=False,
+                      columns=[f"Detector {i + 1}" for i in range(spec.n_det)])
+    df.insert(0, "Wavelength [nm]", spec.wavelengths_nm)
+    y_norm = spec.meta.get("y_norm")
+    if y_norm is not None:
+        for i in range(len(y_norm)):
+            df[f"Detector {i + 1} Normalised [dB]"] = y_norm[i]
+    df.to_csv(csv_path, index=False)
+    return csv_path
+
+
+def csv_pending(root: str) -> int:
+    """CSV next to every .spz under root that has none yet (project export), returns the count"""
+    done = 0
+    for d, _, files in os.walk(root):
+        for f in files:
+            if not f.endswith(SUFFIX):
+                continue
+            path = os.path.join(d, f)
+            if os.path.exists(path[:-len(SUFFIX)] + ".csv"):
+                continue
+            try:
+                to_csv(path)
+                done += 1
+            except Exception as e:
+                print(f"[Codec] CSV from {path} failed: {e}")
+    return done
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python -m utils.spectrum_codec <file.spz | directory>  (writes .csv next to each)")
+        sys.exit(1)
+    target = sys.argv[1]
+    if os.path.isdir(target):
+        todo = [os.path.join(d, f) for d, _, fs in os.walk(target) for f in fs if f.endswith(SUFFIX)]
+    else:
+        todo = [target]
+    for p in sorted(todo):
+        print(f"[Codec] {to_csv(p)}")
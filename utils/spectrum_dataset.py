@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from NIR.utils.spectrum_result import SpectrumResult, resolve_dtype
+
+"""
+Append only dataset holding every sweep of a run.
+
+Instead of a CSV / MAT / PNG / PDF / HTML per device, an auto measurement
+run can append each sweep to one dataset directory (<run>.spds):
+
+    detectors.bin   detector blocks, appended back to back
+    grids.bin       float64 wavelength grids, each distinct grid stored once
+    index.jsonl     one line per sweep: device, offsets, shape, dtype,
+                    channels, meta_data, time, codec
+
+Records are written data first and indexed last, so a run killed mid
+write loses at most the sweep in flight. Raw records ("raw" codec) are read
+through np.memmap, so loading a device or stacking thousands of them only
+touches the pages needed. compress=True stores each record zlib compressed
+("zlib" codec), smaller on disk but decoded on read.
+
+    ds = SpectrumDataset(".../Spectrum/run_2025-06-01.spds")
+    ds.append("ring_12", wl, detectors, channels=slot_info, meta=meta_data)
+    spec = ds.read("ring_12")                     # SpectrumResult, memmapped
+    wl, block = ds.load_many(ds.devices())        # (n_dev, n_det, n_pts)
+
+No HDF5 / Parquet dependency, numpy only.
+"""
+
+DATA_FILE = "detectors.bin"
+GRID_FILE = "grids.bin"
+INDEX_FILE = "index.jsonl"
+SUFFIX = ".spds"
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class SpectrumDataset:
+    def __init__(self, path: str, compress: bool = False, dtype: str = "float32"):
+        """
+        :param compress: zlib per record (no memmap on read)
+        :param dtype: detector storage dtype, "float32" or "float64"
+        """
+        if not path.endswith(SUFFIX):
+            path += SUFFIX
+        self.path = path
+        self.compress = compress
+        self.dtype = resolve_dtype(dtype)
+        self._lock = threading.Lock()
+        self._index: Optional[List[Dict[str, Any]]] = None
+        self._grids: Dict[tuple, int] = {}  # (n, first, last, hash) -> offset
+        self._mm: Dict[str, np.memmap] = {}
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    ######################################################################
+    # Writing
+    ######################################################################
+
+    def _grid_offset(self, wl: np.ndarray) -> int:
+        """Offset (in values) of wl in grids.bin, appended if new"""
+        key = (wl.size, float(wl[0]), float(wl[-1]), hash(wl.tobytes()))
+        off = self._grids.get(key)
+        if off is None:
+            with open(self._file(GRID_FILE), "ab") as f:
+                off = f.tell() // 8
+                f.write(wl.tobytes())
+            self._grids[key] = off
+        return off
+
+    def append(self, device: str, wl, detectors, channels: Optional[Sequence] = None,
+               meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Append one sweep, returns its index entry"""
+        wl = np.ascontiguousarray(wl, dtype=np.float64).ravel()
+        block = np.ascontiguousarray(np.atleast_2d(np.asarray(detectors)), dtype=self.dtype)
+        if block.shape[1] != wl.size:
+            raise ValueError(f"{block.shape[1]} points per detector for {wl.size} wavelengths")
+        if channels is None and isinstance(detectors, SpectrumResult):
+            channels = detectors.channels
+        payload = block.tobytes()
+        codec = "raw"
+        if self.compress:
+            payload = zlib.compress(payload, 6)
+            codec = "zlib"
+
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            self._load_index()
+            grid = self._grid_offset(wl)
+            with open(self._file(DATA_FILE), "ab") as f:
+                offset = f.tell()
+                f.write(payload)
+            entry = {
+                "device": str(device),
+                "offset": offset,
+                "nbytes": len(payload),
+                "n_det": int(block.shape[0]),
+                "n_pts": int(block.shape[1]),
+                "dtype": block.dtype.str,
+                "codec": codec,
+                "grid": grid,
+                "channels": [list(c) for c in channels] if channels is not None else None,
+                "meta": _jsonable(meta or {}),
+                "time": time.time(),
+            }
+            with open(self._file(INDEX_FILE), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+            self._index.append(entry)
+            self._mm.pop(DATA_FILE, None)  # file grew, map it again on read
+            self._mm.pop(GRID_FILE, None)
+        return entry
+
+    ######################################################################
+    # Reading
+    ######################################################################
+
+    def _load_index(self) -> List[Dict[str, Any]]:
+        if self._index is None:
+            self._index = []
+            try:
+                with open(self._file(INDEX_FILE), "r") as f:
+                    for line in f:
+                        try:
+                            self._index.append(json.loads(line))
+                        except ValueError:
+                            break  # Torn last line of an interrupted run
+            except OSError:
+                pass
+        return self._index
+
+    def index(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._load_index())
+
+    def refresh(self) -> None:
+        """Re-read the index (dataset appended by another process)"""
+        with self._lock:
+            self._index = None
+            self._mm.clear()
+
+    def devices(self) -> List[str]:
+        """Device names in append order (latest sweep wins on read)"""
+        seen = {}
+        for e in self.index():
+            seen[e["device"]] = True
+        return list(seen)
+
+    def _entry(self, device) -> Dict[str, Any]:
+        if isinstance(device, int):
+            return self.index()[device]
+        for e in reversed(self.index()):
+            if e["device"] == device:
+                return e
+        raise KeyError(device)
+
+    def _map(self, name: str) -> np.memmap:
+        with self._lock:
+            mm = self._mm.get(name)
+            if mm is None:
+                mm = np.memmap(self._file(name), dtype=np.uint8, mode="r")
+                self._mm[name] = mm
+        return mm
+
+    def _wavelengths(self, e: Dict[str, Any]) -> np.ndarray:
+        raw = self._map(GRID_FILE)
+        start = e["grid"] * 8
+        return raw[start:start + e["n_pts"] * 8].view(np.float64)
+
+    def _block(self, e: Dict[str, Any]) -> np.ndarray:
+        raw = self._map(DATA_FILE)[e["offset"]:e["offset"] + e["nbytes"]]
+        dtype = np.dtype(e["dtype"])
+        if e["codec"] == "zlib":
+            arr = np.frombuffer(zlib.decompress(raw.tobytes()), dtype=dtype)
+        else:
+            arr = raw.view(dtype)
+        return arr.reshape(e["n_det"], e["n_pts"])
+
+    def read(self, device) -> SpectrumResult:
+        """Latest sweep of device (name, or index position), memmapped when raw"""
+        e = self._entry(device)
+        return SpectrumResult(self._wavelengths(e), self._block(e), e["channels"], e["meta"])
+
+    def load_many(self, devices: Optional[Iterable] = None, dtype=None):
+        """
+        Stack the sweeps of devices (default: all) into one array.
+        Same grid and detector count -> (wl, (n_dev, n_det, n_pts) array),
+        otherwise (None, [SpectrumResult, ...]).
+        """
+        entries = [self._entry(d) for d in (self.devices() if devices is None else devices)]
+        if not entries:
+            return None, []
+        same = all(e["grid"] == entries[0]["grid"] and e["n_pts"] == entries[0]["n_pts"]
+                   and e["n_det"] == entries[0]["n_det"] for e in entries)
+        if not same:
+            return None, [self.read(self._index.index(e)) for e in entries]
+        out = np.empty((len(entries), entries[0]["n_det"], entries[0]["n_pts"]),
+                       dtype=resolve_dtype(dtype) if dtype is not None else np.dtype(entries[0]["dtype"]))
+        for i, e in enumerate(entries):
+            out[i] = self._block(e)
+        return np.array(self._wavelengths(entries[0])), out
+
+    def meta_table(self):
+        """One row per sweep: device, time, shape, meta_data columns (pandas)"""
+        import pandas as pd
+        rows = []
+        for e in self.index():
+            row = {"device": e["device"], "time": e["time"], "n_det": e["n_det"], "n_pts": e["n_pts"]}
+            row.update({k: v for k, v in e["meta"].items() if not isinstance(v, (dict, list))})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._mm.clear()